@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+转发缓冲区测试 - 固定8KB读缓冲区 vs 自适应读缓冲区
+
+代理（独立子进程）分别使用两种配置：
+
+    fixed      每个方向固定8KB，不调整收发缓冲区（之前的行为）
+    adaptive   按 SOCKS5_CONFIG 中 relay_buffer_* 的默认值自适应
+
+先通过代理下载固定大小的数据，统计吞吐量和代理进程的CPU时间；再保持一批只
+偶尔收发小消息的连接，统计此时转发缓冲区占用的内存。
+
+用法:
+    python benchmarks/bench_adaptive_buffers.py [--engine thread|asyncio] [--size-mb 512]
+        [--idle-connections 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def start_source_server(total_bytes):
+    """
+    启动目标服务器：请求的第一个字节为 'D' 时发送 total_bytes 字节后关闭，
+    否则原样回显收到的数据
+
+    Returns:
+        int: 监听端口
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(512)
+    chunk = b'\0' * (256 * 1024)
+
+    def serve(conn):
+        try:
+            if conn.recv(1) == b'D':
+                remaining = total_bytes
+                while remaining > 0:
+                    remaining -= conn.send(chunk[:min(len(chunk), remaining)])
+            else:
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    conn.sendall(data)
+        except OSError:
+            pass
+        conn.close()
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_proxy(engine, adaptive, conn):
+    """子进程入口：运行代理，按父进程的请求回复统计，收到 'stop' 时上报CPU时间并退出"""
+    from common.config import SOCKS5_CONFIG
+    SOCKS5_CONFIG['metrics_port'] = 0
+    SOCKS5_CONFIG['max_handlers'] = 0
+    SOCKS5_CONFIG['max_connections_per_ip'] = 0
+    if not adaptive:
+        SOCKS5_CONFIG['relay_buffer_min'] = SOCKS5_CONFIG['relay_buffer_max'] = 8192
+        SOCKS5_CONFIG['relay_socket_buffer_factor'] = 0
+    from common.socks5_proxy import create_proxy_server
+
+    server = create_proxy_server('127.0.0.1', 0, engine=engine)
+    server.logger.logger.setLevel('WARNING')
+    threading.Thread(target=server.start, daemon=True).start()
+    while not server.running or server.listener_fileno() is None:
+        time.sleep(0.01)
+    with socket.socket(fileno=os.dup(server.listener_fileno())) as listener:
+        conn.send(listener.getsockname()[1])
+
+    cpu_start = time.process_time()
+    while True:
+        command = conn.recv()
+        if command == 'stats':
+            conn.send(server.get_stats()['buffers'])
+        elif command == 'cpu':
+            conn.send(time.process_time() - cpu_start)
+        else:
+            break
+    server.stop()
+
+
+def open_via_proxy(proxy_port, target_port, mode):
+    """通过SOCKS5代理连接目标，并发送模式字节"""
+    sock = socket.create_connection(('127.0.0.1', proxy_port))
+    sock.sendall(b'\x05\x01\x00')
+    sock.recv(2)
+    sock.sendall(b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port))
+    sock.recv(10)
+    sock.sendall(mode)
+    return sock
+
+
+def download(proxy_port, target_port):
+    """
+    通过代理下载目标发送的全部数据
+
+    Returns:
+        int: 读取的字节数
+    """
+    sock = open_via_proxy(proxy_port, target_port, b'D')
+    buf = bytearray(256 * 1024)
+    received = 0
+    while True:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    sock.close()
+    return received
+
+
+def bench(engine, adaptive, target_port, idle_connections):
+    """
+    测试一种配置
+
+    Returns:
+        dict: 测试结果
+    """
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=run_proxy, args=(engine, adaptive, child))
+    proc.start()
+    proxy_port = parent.recv()
+
+    start = time.perf_counter()
+    moved = download(proxy_port, target_port)
+    elapsed = time.perf_counter() - start
+    parent.send('cpu')
+    cpu = parent.recv()
+
+    # 交互连接：每个连接来回几条小消息后保持空闲
+    socks = [open_via_proxy(proxy_port, target_port, b'E') for _ in range(idle_connections)]
+    for _ in range(SHRINK_ROUNDS):
+        for sock in socks:
+            sock.sendall(b'ping')
+        for sock in socks:
+            sock.recv(16)
+    time.sleep(0.2)
+    parent.send('stats')
+    stats = parent.recv()
+    for sock in socks:
+        sock.close()
+
+    parent.send('stop')
+    proc.join(timeout=5)
+    return {
+        'mode': 'adaptive' if adaptive else 'fixed',
+        'throughput_mbps': moved * 8 / elapsed / 1e6,
+        'cpu_seconds_per_gb': cpu / (moved / 1e9),
+        'idle_kb': stats['in_use_bytes'] / 1024,
+    }
+
+
+# 交互连接收发小消息的轮数（足以让自适应缓冲区缩回最小值）
+SHRINK_ROUNDS = 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description='固定 vs 自适应转发缓冲区')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), default='thread', help='代理引擎')
+    parser.add_argument('--size-mb', type=int, default=512, help='下载的数据量(MB)')
+    parser.add_argument('--idle-connections', type=int, default=200, help='交互/空闲连接数')
+    args = parser.parse_args()
+
+    target_port = start_source_server(args.size_mb * 1024 * 1024)
+
+    print(f"引擎: {args.engine}")
+    print(f"{'模式':<10}{'吞吐量(Mbit/s)':>16}{'CPU秒/GB':>12}"
+          f"{'空闲缓冲区(KB)':>18}")
+    for adaptive in (False, True):
+        r = bench(args.engine, adaptive, target_port, args.idle_connections)
+        print(f"{r['mode']:<10}{r['throughput_mbps']:>16.1f}{r['cpu_seconds_per_gb']:>12.2f}{r['idle_kb']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+转发循环内存分配测试 - recv()/bytes vs 缓冲区池 recv_into()/memoryview
+
+使用 socketpair 在单线程内反复执行"读一个数据包并转发"的步骤，借助
+tracemalloc 统计每个数据包在转发过程中临时分配的字节数（每步开始前重置峰值，
+以峰值与起始值之差作为该步的分配量）。
+
+用法:
+    python benchmarks/bench_buffer_pool.py [--packets 20000] [--packet-size 8192]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.buffer_pool import RELAY_BUFFER_SIZE, BufferPool  # noqa: E402
+from common.socks5_proxy import Socks5ProxyHandler  # noqa: E402
+
+
+def legacy_forward(src, dst):
+    """旧版转发步骤：每个数据包新建一个bytes对象"""
+    data = src.recv(RELAY_BUFFER_SIZE)
+    if data:
+        dst.sendall(data)
+    return len(data)
+
+
+def bench(name, step, packets, packet_size):
+    """
+    测试单个转发步骤
+
+    Args:
+        name: 名称
+        step: 转发函数 step(src, dst) -> int
+        packets: 数据包数量
+        packet_size: 每个数据包的大小
+
+    Returns:
+        dict: 测试结果
+    """
+    # writer -> src ==(step)==> dst -> reader
+    writer, src = socket.socketpair()
+    dst, reader = socket.socketpair()
+    payload = b'\xab' * packet_size
+    sink = bytearray(packet_size * 2)
+
+    allocated = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(packets):
+        writer.sendall(payload)
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        step(src, dst)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        reader.recv_into(sink)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    for sock in (writer, src, dst, reader):
+        sock.close()
+
+    return {
+        'name': name,
+        'packets': packets,
+        'bytes_allocated_per_packet': allocated / packets,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='转发循环内存分配测试')
+    parser.add_argument('--packets', type=int, default=20000, help='数据包数量')
+    parser.add_argument('--packet-size', type=int, default=RELAY_BUFFER_SIZE, help='数据包大小(字节)')
+    args = parser.parse_args()
+
+    pool = BufferPool()
+    buf = pool.acquire()
+    view = memoryview(buf)
+
+    def pooled_forward(src, dst):
+        return Socks5ProxyHandler._forward_chunk(src, dst, buf, view)
+
+    print(f"{'方式':<20}{'每包分配(字节)':>16}{'耗时(秒)':>10}")
+    for name, step in (('recv/bytes', legacy_forward), ('recv_into/memoryview', pooled_forward)):
+        r = bench(name, step, args.packets, args.packet_size)
+        print(f"{r['name']:<20}{r['bytes_allocated_per_packet']:>16.1f}{r['seconds']:>10.2f}")
+
+    view.release()
+    pool.release(buf)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+转发热路径日志开销测试 - 连接汇总日志 vs 逐包调试日志
+
+代理以默认的 DEBUG 日志级别运行（文件处理器写入临时目录），分别测试：
+
+    summary   默认模式，每个连接只在结束时记录一条汇总日志
+    trace     客户端在 LOG_CONFIG['trace_clients'] 中，转发的每一块数据都写一行
+              DEBUG日志（与之前所有连接的行为相同）
+
+测试两种负载：大块下载的吞吐量，以及小消息一问一答的往返次数（每块数据
+都很小时日志开销占比最高）。
+
+用法:
+    python benchmarks/bench_hot_path_logging.py [--engine thread|asyncio] [--size-mb 256]
+        [--messages 20000] [--message-size 512]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def start_source_server(total_bytes):
+    """
+    启动目标服务器：请求的第一个字节为 'D' 时发送 total_bytes 字节后关闭，
+    否则原样回显收到的数据
+
+    Returns:
+        int: 监听端口
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(16)
+    chunk = b'\0' * (256 * 1024)
+
+    def serve(conn):
+        mode = conn.recv(1)
+        if mode == b'D':
+            remaining = total_bytes
+            while remaining > 0:
+                remaining -= conn.send(chunk[:min(len(chunk), remaining)])
+        else:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                conn.sendall(data)
+        conn.close()
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_proxy(engine, trace, log_dir, port_queue, stop_event, cpu_queue):
+    """子进程入口：按指定日志模式运行代理直到 stop_event 被设置，然后上报CPU时间"""
+    from common.config import LOG_CONFIG, SOCKS5_CONFIG
+    LOG_CONFIG['log_dir'] = log_dir
+    LOG_CONFIG['log_level'] = 'DEBUG'
+    LOG_CONFIG['trace_clients'] = ['127.0.0.1'] if trace else []
+    SOCKS5_CONFIG['metrics_port'] = 0
+    from common.socks5_proxy import create_proxy_server
+
+    server = create_proxy_server('127.0.0.1', 0, engine=engine)
+    # 只屏蔽控制台输出，文件处理器仍按DEBUG级别写入
+    for handler in server.logger.logger.handlers:
+        if not hasattr(handler, 'baseFilename'):
+            handler.setLevel('CRITICAL')
+    threading.Thread(target=server.start, daemon=True).start()
+    while not server.running or server.listener_fileno() is None:
+        time.sleep(0.01)
+    with socket.socket(fileno=os.dup(server.listener_fileno())) as listener:
+        port_queue.put(listener.getsockname()[1])
+
+    cpu_start = time.process_time()
+    stop_event.wait()
+    cpu_queue.put(time.process_time() - cpu_start)
+    server.stop()
+
+
+def open_via_proxy(proxy_port, target_port, mode):
+    """通过SOCKS5代理连接目标，并发送模式字节"""
+    sock = socket.create_connection(('127.0.0.1', proxy_port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(b'\x05\x01\x00')
+    sock.recv(2)
+    sock.sendall(b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port))
+    sock.recv(10)
+    sock.sendall(mode)
+    return sock
+
+
+def download(proxy_port, target_port):
+    """
+    通过代理下载目标发送的全部数据
+
+    Returns:
+        int: 读取的字节数
+    """
+    sock = open_via_proxy(proxy_port, target_port, b'D')
+    buf = bytearray(256 * 1024)
+    received = 0
+    while True:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    sock.close()
+    return received
+
+
+def ping_pong(proxy_port, target_port, messages, message_size):
+    """
+    通过代理发送 messages 条小消息，每条等待回显后再发下一条
+
+    Returns:
+        int: 完成的往返次数
+    """
+    sock = open_via_proxy(proxy_port, target_port, b'E')
+    payload = b'x' * message_size
+    buf = bytearray(message_size)
+    view = memoryview(buf)
+    for _ in range(messages):
+        sock.sendall(payload)
+        got = 0
+        while got < message_size:
+            n = sock.recv_into(view[got:])
+            if not n:
+                raise ConnectionError("代理提前关闭了连接")
+            got += n
+    sock.close()
+    return messages
+
+
+def bench(engine, trace, target_port, messages, message_size):
+    """
+    测试一种日志模式
+
+    Returns:
+        dict: 测试结果
+    """
+    log_dir = tempfile.mkdtemp(prefix='bench-logging-')
+    port_queue = multiprocessing.Queue()
+    cpu_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    proc = multiprocessing.Process(
+        target=run_proxy, args=(engine, trace, log_dir, port_queue, stop_event, cpu_queue)
+    )
+    proc.start()
+    proxy_port = port_queue.get(timeout=10)
+
+    start = time.perf_counter()
+    moved = download(proxy_port, target_port)
+    download_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trips = ping_pong(proxy_port, target_port, messages, message_size)
+    ping_seconds = time.perf_counter() - start
+
+    stop_event.set()
+    cpu = cpu_queue.get(timeout=10)
+    proc.join(timeout=5)
+
+    log_bytes = sum(os.path.getsize(os.path.join(log_dir, name)) for name in os.listdir(log_dir))
+    return {
+        'mode': 'trace' if trace else 'summary',
+        'throughput_mbps': moved * 8 / download_seconds / 1e6,
+        'round_trips_per_sec': trips / ping_seconds,
+        'cpu_seconds': cpu,
+        'log_kb': log_bytes / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='转发热路径日志开销测试')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), default='thread', help='代理引擎')
+    parser.add_argument('--size-mb', type=int, default=256, help='下载的数据量(MB)')
+    parser.add_argument('--messages', type=int, default=20000, help='小消息往返次数')
+    parser.add_argument('--message-size', type=int, default=512, help='小消息大小(字节)')
+    args = parser.parse_args()
+
+    target_port = start_source_server(args.size_mb * 1024 * 1024)
+
+    print(f"引擎: {args.engine}")
+    print(f"{'模式':<10}{'吞吐量(Mbit/s)':>16}{'往返/秒':>12}{'CPU秒':>10}{'日志(KB)':>12}")
+    results = {}
+    for trace in (True, False):
+        r = results[trace] = bench(args.engine, trace, target_port, args.messages, args.message_size)
+        print(f"{r['mode']:<10}{r['throughput_mbps']:>16.1f}{r['round_trips_per_sec']:>12.0f}"
+              f"{r['cpu_seconds']:>10.2f}{r['log_kb']:>12.1f}")
+
+    base, new = results[True], results[False]
+    print(f"汇总日志相比逐包日志: 吞吐量 x{new['throughput_mbps'] / base['throughput_mbps']:.2f}，"
+          f"往返 x{new['round_trips_per_sec'] / base['round_trips_per_sec']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+转发性能测试 - splice零拷贝 vs recv/sendall
+
+在本机回环上启动一个只发送数据的目标服务器，以及分别使用两种转发模式的
+SOCKS5代理（独立子进程），通过代理下载固定大小的数据，统计吞吐量和
+代理进程每GB数据消耗的CPU时间。
+
+用法:
+    python benchmarks/bench_splice_relay.py [--size-mb 512] [--rounds 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.splice_relay import splice_available  # noqa: E402
+
+
+def start_source_server(total_bytes):
+    """
+    启动一个连接后发送 total_bytes 字节再关闭的目标服务器
+
+    Returns:
+        int: 监听端口
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(16)
+    chunk = b'\0' * (256 * 1024)
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            remaining = total_bytes
+            while remaining > 0:
+                sent = conn.send(chunk[:min(len(chunk), remaining)])
+                remaining -= sent
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_proxy(relay_mode, port_queue, stop_event, cpu_queue):
+    """子进程入口：运行代理直到 stop_event 被设置，然后上报CPU时间"""
+    from common.socks5_proxy import Socks5ProxyServer
+
+    server = Socks5ProxyServer('127.0.0.1', 0, relay_mode=relay_mode)
+    server.logger.logger.setLevel('WARNING')
+    threading.Thread(target=server.start, daemon=True).start()
+    while server.server_socket is None or not server.running:
+        time.sleep(0.01)
+    port_queue.put(server.server_socket.getsockname()[1])
+
+    cpu_start = time.process_time()
+    stop_event.wait()
+    cpu_queue.put(time.process_time() - cpu_start)
+    server.stop()
+
+
+def download_via_proxy(proxy_port, target_port):
+    """
+    通过SOCKS5代理连接目标并读取全部数据
+
+    Returns:
+        int: 读取的字节数
+    """
+    sock = socket.create_connection(('127.0.0.1', proxy_port))
+    sock.sendall(b'\x05\x01\x00')
+    sock.recv(2)
+    sock.sendall(b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port))
+    sock.recv(10)
+
+    buf = bytearray(256 * 1024)
+    received = 0
+    while True:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    sock.close()
+    return received
+
+
+def bench(relay_mode, target_port, total_bytes, rounds):
+    """
+    测试单个转发模式
+
+    Returns:
+        dict: 测试结果
+    """
+    port_queue = multiprocessing.Queue()
+    cpu_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    proc = multiprocessing.Process(target=run_proxy, args=(relay_mode, port_queue, stop_event, cpu_queue))
+    proc.start()
+    proxy_port = port_queue.get(timeout=10)
+
+    start = time.perf_counter()
+    moved = 0
+    for _ in range(rounds):
+        moved += download_via_proxy(proxy_port, target_port)
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    cpu = cpu_queue.get(timeout=10)
+    proc.join(timeout=5)
+
+    gb = moved / 1e9
+    return {
+        'mode': relay_mode,
+        'bytes': moved,
+        'seconds': elapsed,
+        'throughput_mbps': moved * 8 / elapsed / 1e6,
+        'cpu_seconds': cpu,
+        'cpu_seconds_per_gb': cpu / gb if gb else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='splice vs copy 转发性能测试')
+    parser.add_argument('--size-mb', type=int, default=512, help='每轮下载的数据量(MB)')
+    parser.add_argument('--rounds', type=int, default=3, help='测试轮数')
+    args = parser.parse_args()
+
+    total_bytes = args.size_mb * 1024 * 1024
+    target_port = start_source_server(total_bytes)
+
+    modes = ['copy']
+    if splice_available():
+        modes.append('splice')
+    else:
+        print("当前环境不支持splice，仅测试copy模式")
+
+    print(f"{'模式':<8}{'吞吐量(Mbit/s)':>16}{'CPU秒':>10}{'CPU秒/GB':>12}")
+    for mode in modes:
+        r = bench(mode, target_port, total_bytes, args.rounds)
+        print(f"{r['mode']:<8}{r['throughput_mbps']:>16.1f}{r['cpu_seconds']:>10.2f}{r['cpu_seconds_per_gb']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
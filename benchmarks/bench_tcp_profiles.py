@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+TCP调优配置性能测试
+
+在本机回环上为每个调优配置启动一个SOCKS5代理（独立子进程），分别测试：
+
+    建连耗时   从连接代理到收到SOCKS5成功响应的耗时
+    请求延迟   客户端把一条消息分两次写出（头部 + 正文），目标收齐后回复，
+               统计往返时间；代理上游启用Nagle时第二次写会等待第一次的ACK
+    吞吐量     通过代理下载固定大小的数据
+
+用法:
+    python benchmarks/bench_tcp_profiles.py [--size-mb 256] [--requests 500] [--connects 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.tcp_tuning import PROFILES  # noqa: E402
+
+HEADER = struct.Struct('!I')
+
+
+def recv_exact(sock, n):
+    """读取恰好n字节，连接关闭时返回已读取的部分"""
+    buf = bytearray()
+    while len(buf) < n:
+        data = sock.recv(n - len(buf))
+        if not data:
+            break
+        buf += data
+    return bytes(buf)
+
+
+def start_target_server(total_bytes):
+    """
+    启动目标服务器：第一个字节为 'D' 时发送 total_bytes 字节后关闭，
+    否则按 长度头部 + 正文 的格式收齐每条消息后原样回复
+
+    Returns:
+        int: 监听端口
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(128)
+    chunk = b'\0' * (256 * 1024)
+
+    def serve(conn):
+        try:
+            mode = conn.recv(1)
+            if mode == b'D':
+                remaining = total_bytes
+                while remaining > 0:
+                    remaining -= conn.send(chunk[:min(len(chunk), remaining)])
+                return
+            while mode == b'E':
+                header = recv_exact(conn, HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                body = recv_exact(conn, HEADER.unpack(header)[0])
+                conn.sendall(header + body)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_proxy(profile, port_queue, stop_event):
+    """子进程入口：使用指定调优配置运行代理直到 stop_event 被设置"""
+    from common.socks5_proxy import Socks5ProxyServer
+
+    server = Socks5ProxyServer('127.0.0.1', 0, tcp_profile=profile, metrics_port=0)
+    server.logger.logger.setLevel('WARNING')
+    threading.Thread(target=server.start, daemon=True).start()
+    while server.server_socket is None or not server.running:
+        time.sleep(0.01)
+    port_queue.put(server.server_socket.getsockname()[1])
+    stop_event.wait()
+    server.stop()
+
+
+def open_via_proxy(proxy_port, target_port):
+    """
+    通过SOCKS5代理连接目标
+
+    Returns:
+        socket.socket: 已建立的连接
+    """
+    sock = socket.create_connection(('127.0.0.1', proxy_port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(b'\x05\x01\x00')
+    recv_exact(sock, 2)
+    sock.sendall(b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port))
+    reply = recv_exact(sock, 10)
+    if len(reply) < 10 or reply[1] != 0:
+        raise ConnectionError(f"代理连接目标失败: {reply!r}")
+    return sock
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure_connect(proxy_port, target_port, count):
+    """建连耗时（毫秒）"""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        sock = open_via_proxy(proxy_port, target_port)
+        samples.append((time.perf_counter() - start) * 1000)
+        sock.close()
+    return samples
+
+
+def measure_requests(proxy_port, target_port, count, body_size=200):
+    """分两次写出的请求的往返时间（毫秒）"""
+    sock = open_via_proxy(proxy_port, target_port)
+    sock.sendall(b'E')
+    body = b'x' * body_size
+    header = HEADER.pack(body_size)
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        sock.sendall(header)
+        sock.sendall(body)
+        recv_exact(sock, HEADER.size + body_size)
+        samples.append((time.perf_counter() - start) * 1000)
+    sock.close()
+    return samples
+
+
+def measure_download(proxy_port, target_port):
+    """下载吞吐量（Mbit/s）"""
+    sock = open_via_proxy(proxy_port, target_port)
+    sock.sendall(b'D')
+    buf = bytearray(256 * 1024)
+    received = 0
+    start = time.perf_counter()
+    while True:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return received * 8 / elapsed / 1e6
+
+
+def bench(profile, target_port, args):
+    """
+    测试单个调优配置
+
+    Returns:
+        dict: 测试结果
+    """
+    port_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    proc = multiprocessing.Process(target=run_proxy, args=(profile, port_queue, stop_event))
+    proc.start()
+    try:
+        proxy_port = port_queue.get(timeout=10)
+        connects = measure_connect(proxy_port, target_port, args.connects)
+        requests = measure_requests(proxy_port, target_port, args.requests)
+        throughput = measure_download(proxy_port, target_port)
+    finally:
+        stop_event.set()
+        proc.join(timeout=5)
+
+    return {
+        'profile': profile,
+        'connect_p50_ms': percentile(connects, 0.5),
+        'request_p50_ms': percentile(requests, 0.5),
+        'request_p99_ms': percentile(requests, 0.99),
+        'throughput_mbps': throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TCP调优配置性能测试')
+    parser.add_argument('--size-mb', type=int, default=256, help='下载测试的数据量(MB)')
+    parser.add_argument('--requests', type=int, default=500, help='请求延迟测试的请求数')
+    parser.add_argument('--connects', type=int, default=200, help='建连测试的连接数')
+    parser.add_argument('--profiles', nargs='*', default=list(PROFILES), help='要测试的调优配置')
+    args = parser.parse_args()
+
+    target_port = start_target_server(args.size_mb * 1024 * 1024)
+
+    print(f"{'配置':<20}{'建连p50(ms)':>14}{'请求p50(ms)':>14}{'请求p99(ms)':>14}{'吞吐量(Mbit/s)':>18}")
+    for profile in args.profiles:
+        r = bench(profile, target_port, args)
+        print(f"{r['profile']:<20}{r['connect_p50_ms']:>14.3f}{r['request_p50_ms']:>14.3f}"
+              f"{r['request_p99_ms']:>14.3f}{r['throughput_mbps']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+同机客户端连接开销测试 - TCP回环 vs Unix域socket
+
+代理（独立子进程）同时监听 127.0.0.1 的TCP端口和一个Unix域socket，客户端
+分别通过两种方式反复完成一次完整的短连接：
+
+    连接代理 -> SOCKS5握手和CONNECT请求 -> 发送一条小消息并等待回显 -> 关闭
+
+统计每秒完成的连接数、单个连接耗时的中位数和P99，以及代理进程处理每个连接
+消耗的CPU时间；再在一条长连接上测小消息往返的延迟。目标服务器在本进程中，
+两种方式下代理到目标的一段都是相同的TCP回环连接。
+
+用法:
+    python benchmarks/bench_unix_socket.py [--engine thread|asyncio] [--connections 5000]
+        [--round-trips 20000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def start_echo_server():
+    """
+    启动回显服务器
+
+    Returns:
+        int: 监听端口
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+
+    def serve(conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                conn.sendall(data)
+        except OSError:
+            pass
+        conn.close()
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_proxy(engine, unix_path, conn):
+    """子进程入口：同时监听TCP和Unix域socket，按父进程的请求回复CPU时间，收到 'stop' 时退出"""
+    from common.config import SOCKS5_CONFIG
+    SOCKS5_CONFIG['metrics_port'] = 0
+    SOCKS5_CONFIG['max_handlers'] = 0
+    SOCKS5_CONFIG['max_connections_per_ip'] = 0
+    SOCKS5_CONFIG['unix_socket'] = unix_path
+    from common.socks5_proxy import create_proxy_server
+
+    server = create_proxy_server('127.0.0.1', 0, engine=engine)
+    server.logger.logger.setLevel('WARNING')
+    threading.Thread(target=server.start, daemon=True).start()
+    while not server.running or server.listener_fileno() is None or not os.path.exists(unix_path):
+        time.sleep(0.01)
+    with socket.socket(fileno=os.dup(server.listener_fileno())) as listener:
+        conn.send(listener.getsockname()[1])
+
+    while True:
+        command = conn.recv()
+        if command == 'cpu':
+            conn.send(time.process_time())
+        else:
+            break
+    server.stop()
+
+
+def recv_exactly(sock, n):
+    """读取恰好 n 个字节"""
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("代理提前关闭了连接")
+        data += chunk
+    return data
+
+
+def open_via_proxy(address, target_port):
+    """
+    通过代理连接目标（address 为 ('127.0.0.1', 端口) 或Unix域socket路径）
+
+    Returns:
+        socket.socket: 已完成CONNECT的连接
+    """
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    else:
+        sock = socket.create_connection(address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # 问候和请求一次发出，代理按顺序处理
+    sock.sendall(b'\x05\x01\x00' + b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1')
+                 + struct.pack('!H', target_port))
+    reply = recv_exactly(sock, 12)
+    if reply[3] != 0:
+        raise ConnectionError(f"代理拒绝连接: {reply[3]}")
+    return sock
+
+
+def short_connections(address, target_port, count):
+    """
+    完成 count 次短连接
+
+    Returns:
+        list: 每个连接的耗时（秒）
+    """
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        sock = open_via_proxy(address, target_port)
+        sock.sendall(b'ping')
+        recv_exactly(sock, 4)
+        sock.close()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def round_trips(address, target_port, count):
+    """
+    在一条长连接上完成 count 次小消息往返
+
+    Returns:
+        float: 平均往返时间（秒）
+    """
+    sock = open_via_proxy(address, target_port)
+    start = time.perf_counter()
+    for _ in range(count):
+        sock.sendall(b'x' * 64)
+        recv_exactly(sock, 64)
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return elapsed / count
+
+
+def percentile(values, fraction):
+    """已排序列表的分位数"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同机客户端连接开销: TCP回环 vs Unix域socket')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), default='thread', help='代理引擎')
+    parser.add_argument('--connections', type=int, default=5000, help='每种方式的短连接数')
+    parser.add_argument('--round-trips', type=int, default=20000, help='长连接上的小消息往返次数')
+    args = parser.parse_args()
+
+    target_port = start_echo_server()
+    unix_path = os.path.join(tempfile.mkdtemp(prefix='bench-unix-'), 'socks5.sock')
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=run_proxy, args=(args.engine, unix_path, child))
+    proc.start()
+    tcp_port = parent.recv()
+
+    print(f"引擎: {args.engine}")
+    print(f"{'方式':<8}{'连接/秒':>10}{'中位数(us)':>12}{'P99(us)':>10}{'代理CPU(us/连接)':>20}{'往返(us)':>12}")
+    for name, address in (('tcp', ('127.0.0.1', tcp_port)), ('unix', unix_path)):
+        # 预热
+        short_connections(address, target_port, min(200, args.connections))
+        parent.send('cpu')
+        cpu_start = parent.recv()
+        start = time.perf_counter()
+        timings = sorted(short_connections(address, target_port, args.connections))
+        elapsed = time.perf_counter() - start
+        parent.send('cpu')
+        cpu = parent.recv() - cpu_start
+        rtt = round_trips(address, target_port, args.round_trips)
+        print(f"{name:<8}{args.connections / elapsed:>10.0f}{percentile(timings, 0.5) * 1e6:>12.1f}"
+              f"{percentile(timings, 0.99) * 1e6:>10.1f}{cpu / args.connections * 1e6:>20.1f}{rtt * 1e6:>12.1f}")
+
+    parent.send('stop')
+    proc.join(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+SOCKS5代理压力测试
+
+在本机回环上启动代理（独立子进程）、目标服务器（独立子进程）和负载生成器，
+依次运行以下场景，结果以JSON格式输出，便于比较不同版本：
+
+    connect     并发客户端反复建立连接并完成SOCKS5握手和CONNECT请求，
+                统计每秒连接数和握手耗时分位数
+    throughput  多条并行连接通过代理下载/上传固定大小的数据，统计总吞吐量
+    idle        保持N条已建立的空闲连接，统计代理进程的内存、线程数和文件描述符数
+
+目标服务器按每条连接收到的第一个字节区分用途：
+    'E' 回显；'S' + 8字节长度 接收并丢弃指定字节数后回复收到的字节数
+    （代理在一端关闭时会关闭两端，因此不能用半关闭标记结束）；
+    'D' + 8字节长度 发送指定字节数后关闭；其他情况等待对端关闭
+
+用法:
+    python benchmarks/load_test.py [--engine thread] [--output result.json]
+    python benchmarks/load_test.py --output new.json --compare old.json [--fail-on-regression]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+COUNT = struct.Struct('!Q')
+
+# 用于比较的指标：(场景, 指标路径, 越大越好)
+COMPARED_METRICS = [
+    ('connect', 'connections_per_second', True),
+    ('connect', 'handshake_ms.p50', False),
+    ('connect', 'handshake_ms.p99', False),
+    ('throughput', 'download_mbps', True),
+    ('throughput', 'upload_mbps', True),
+    ('idle', 'rss_kb_per_connection', False),
+    ('idle', 'threads_per_connection', False),
+]
+
+
+def raise_fd_limit():
+    """把文件描述符软限制提高到硬限制"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def free_port():
+    """获取一个空闲的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_usage():
+    """
+    读取当前进程的资源占用
+
+    Returns:
+        dict: rss_kb, threads, fds
+    """
+    usage = {'rss_kb': 0, 'threads': threading.active_count(), 'fds': 0}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_kb'] = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    usage['threads'] = int(line.split()[1])
+        usage['fds'] = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        import resource
+        usage['rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage
+
+
+# ---------------------------------------------------------------- 目标服务器
+
+async def _serve_target(reader, writer):
+    try:
+        mode = await reader.read(1)
+        if mode == b'E':
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        elif mode == b'S':
+            expected = COUNT.unpack(await reader.readexactly(COUNT.size))[0]
+            received = 0
+            while received < expected:
+                data = await reader.read(min(256 * 1024, expected - received))
+                if not data:
+                    break
+                received += len(data)
+            writer.write(COUNT.pack(received))
+            await writer.drain()
+        elif mode == b'D':
+            remaining = COUNT.unpack(await reader.readexactly(COUNT.size))[0]
+            chunk = b'\0' * (256 * 1024)
+            while remaining > 0:
+                n = min(len(chunk), remaining)
+                writer.write(chunk[:n])
+                await writer.drain()
+                remaining -= n
+        else:
+            await reader.read()
+    except (OSError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_target(port, ready):
+    """子进程入口：运行目标服务器"""
+    raise_fd_limit()
+
+    async def main():
+        server = await asyncio.start_server(_serve_target, '127.0.0.1', port, backlog=1024)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------- 代理
+
+def run_proxy(engine, port, options, conn):
+    """
+    子进程入口：运行代理，通过管道响应 'usage' 和 'stop' 命令
+
+    Args:
+        engine: 'thread' 或 'asyncio'
+        port: 监听端口
+        options: 传递给代理服务器的参数（max_handlers 用于准入控制器）
+        conn: multiprocessing 管道
+    """
+    raise_fd_limit()
+    from common.admission import AdmissionController
+    from common.config import SOCKS5_CONFIG
+    from common.socks5_proxy import create_proxy_server
+
+    # 所有负载都来自127.0.0.1，取消单IP和握手阶段的连接数限制
+    max_handlers = options.pop('max_handlers', None)
+    if max_handlers is None and engine == 'asyncio':
+        max_handlers = SOCKS5_CONFIG['async_max_connections']
+    admission = AdmissionController(
+        max_handlers=max_handlers,
+        max_queued=0 if engine == 'asyncio' else None,
+        max_pending=0, max_per_ip=0,
+    )
+    server = create_proxy_server('127.0.0.1', port, engine=engine, admission=admission,
+                                 metrics_port=0, **options)
+    server.logger.logger.setLevel('WARNING')
+    threading.Thread(target=server.start, daemon=True).start()
+
+    while True:
+        command = conn.recv()
+        if command == 'usage':
+            conn.send(process_usage())
+        elif command == 'stop':
+            server.stop()
+            conn.send(None)
+            return
+
+
+def wait_port(port, timeout=10):
+    """等待端口开始监听"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"端口 {port} 未能在 {timeout} 秒内开始监听")
+
+
+# ---------------------------------------------------------------- 负载生成
+
+def _request(target_port):
+    return b'\x05\x01\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port)
+
+
+async def socks5_open(proxy_port, target_port):
+    """
+    通过SOCKS5代理连接目标
+
+    Returns:
+        tuple: (reader, writer)
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', proxy_port)
+    try:
+        writer.write(b'\x05\x01\x00')
+        if await reader.readexactly(2) != b'\x05\x00':
+            raise ConnectionError("握手失败")
+        writer.write(_request(target_port))
+        reply = await reader.readexactly(10)
+        if reply[1] != 0:
+            raise ConnectionError(f"代理返回错误 {reply[1]}")
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+def summarize(samples):
+    """
+    计算分位数（毫秒）
+
+    Returns:
+        dict: p50/p90/p99/max/mean
+    """
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def pick(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3)
+
+    return {
+        'p50': pick(0.5),
+        'p90': pick(0.9),
+        'p99': pick(0.99),
+        'max': round(samples[-1], 3),
+        'mean': round(sum(samples) / len(samples), 3),
+    }
+
+
+async def scenario_connect(proxy_port, target_port, concurrency, duration):
+    """并发建连：每个客户端反复 连接 -> 握手 -> 请求 -> 关闭"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                _, writer = await socks5_open(proxy_port, target_port)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 3),
+        'connections': len(latencies),
+        'errors': errors,
+        'connections_per_second': round(len(latencies) / elapsed, 1),
+        'handshake_ms': summarize(latencies),
+    }
+
+
+def _open_blocking(proxy_port, target_port):
+    sock = socket.create_connection(('127.0.0.1', proxy_port))
+    sock.sendall(b'\x05\x01\x00')
+    sock.recv(2)
+    sock.sendall(_request(target_port))
+    reply = sock.recv(10)
+    if len(reply) < 2 or reply[1] != 0:
+        raise ConnectionError(f"代理连接目标失败: {reply!r}")
+    return sock
+
+
+def _parallel(streams, fn):
+    """并行运行 streams 个 fn()，返回 (总字节数, 耗时)"""
+    totals = [0] * streams
+
+    def run(i):
+        totals[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(streams)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(totals), time.perf_counter() - start
+
+
+def scenario_throughput(proxy_port, target_port, streams, size):
+    """多条并行连接下载和上传 size 字节"""
+
+    def download():
+        sock = _open_blocking(proxy_port, target_port)
+        sock.sendall(b'D' + COUNT.pack(size))
+        buf = bytearray(256 * 1024)
+        received = 0
+        while True:
+            n = sock.recv_into(buf)
+            if not n:
+                break
+            received += n
+        sock.close()
+        return received
+
+    def upload():
+        sock = _open_blocking(proxy_port, target_port)
+        sock.sendall(b'S' + COUNT.pack(size))
+        chunk = b'\0' * (256 * 1024)
+        remaining = size
+        while remaining > 0:
+            n = min(len(chunk), remaining)
+            sock.sendall(chunk[:n])
+            remaining -= n
+        reply = b''
+        while len(reply) < COUNT.size:
+            data = sock.recv(COUNT.size - len(reply))
+            if not data:
+                break
+            reply += data
+        sock.close()
+        return COUNT.unpack(reply)[0] if len(reply) == COUNT.size else 0
+
+    down_bytes, down_seconds = _parallel(streams, download)
+    up_bytes, up_seconds = _parallel(streams, upload)
+    return {
+        'streams': streams,
+        'bytes_per_stream': size,
+        'download_bytes': down_bytes,
+        'download_mbps': round(down_bytes * 8 / down_seconds / 1e6, 1),
+        'upload_bytes': up_bytes,
+        'upload_mbps': round(up_bytes * 8 / up_seconds / 1e6, 1),
+    }
+
+
+async def scenario_idle(proxy_port, target_port, count, proxy_conn):
+    """保持 count 条空闲连接，比较建立前后代理进程的资源占用"""
+    proxy_conn.send('usage')
+    baseline = proxy_conn.recv()
+
+    writers = []
+    errors = 0
+    semaphore = asyncio.Semaphore(64)
+
+    async def open_one():
+        nonlocal errors
+        async with semaphore:
+            try:
+                _, writer = await socks5_open(proxy_port, target_port)
+                writers.append(writer)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+
+    await asyncio.gather(*(open_one() for _ in range(count)))
+    # 等待代理中处理线程/协程进入转发阶段
+    await asyncio.sleep(1)
+    proxy_conn.send('usage')
+    loaded = proxy_conn.recv()
+    for writer in writers:
+        writer.close()
+
+    opened = len(writers)
+    return {
+        'connections': opened,
+        'errors': errors,
+        'baseline': baseline,
+        'loaded': loaded,
+        'rss_kb_per_connection': round((loaded['rss_kb'] - baseline['rss_kb']) / opened, 2) if opened else None,
+        'threads_per_connection': round((loaded['threads'] - baseline['threads']) / opened, 3) if opened else None,
+        'fds_per_connection': round((loaded['fds'] - baseline['fds']) / opened, 3) if opened else None,
+    }
+
+
+# ---------------------------------------------------------------- 结果
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(results, scenario, path):
+    value = results.get(scenario)
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(baseline, current, threshold):
+    """
+    把两次结果的对比打印到标准错误
+
+    Args:
+        baseline: 基准结果（JSON对象）
+        current: 本次结果
+        threshold: 变差超过该比例时标记为退化
+
+    Returns:
+        list: 退化的指标名称
+    """
+    regressions = []
+    out = sys.stderr
+    print(f"\n对比基准 {baseline['meta'].get('git_revision')} -> {current['meta'].get('git_revision')}", file=out)
+    print(f"{'指标':<36}{'基准':>12}{'本次':>12}{'变化':>10}", file=out)
+    for scenario, path, higher_is_better in COMPARED_METRICS:
+        old = lookup(baseline['results'], scenario, path)
+        new = lookup(current['results'], scenario, path)
+        if old is None or new is None:
+            continue
+        name = f"{scenario}.{path}"
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  退化'
+            regressions.append(name)
+        print(f"{name:<36}{old:>12}{new:>12}{change:>+10.1%}{flag}", file=out)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SOCKS5代理压力测试')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), default='thread', help='代理服务器引擎')
+    parser.add_argument('--relay-mode', choices=('copy', 'splice'), default=None, help='线程模式的转发方式')
+    parser.add_argument('--tcp-profile', default=None, help='TCP调优配置')
+    parser.add_argument('--max-handlers', type=int, default=None,
+                        help='线程模式的处理线程上限（空闲连接也占用处理线程）')
+    parser.add_argument('--scenarios', nargs='*', default=['connect', 'throughput', 'idle'],
+                        choices=('connect', 'throughput', 'idle'), help='要运行的场景')
+    parser.add_argument('--concurrency', type=int, default=32, help='connect场景的并发客户端数')
+    parser.add_argument('--duration', type=float, default=5.0, help='connect场景的持续时间（秒）')
+    parser.add_argument('--streams', type=int, default=4, help='throughput场景的并行连接数')
+    parser.add_argument('--size-mb', type=int, default=128, help='throughput场景每条连接的数据量(MB)')
+    parser.add_argument('--idle', type=int, default=200, help='idle场景的空闲连接数')
+    parser.add_argument('--output', help='结果JSON文件（默认输出到标准输出）')
+    parser.add_argument('--compare', help='与之前的结果JSON文件比较')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定退化的变差比例')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在退化时以状态码1退出')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    options = {}
+    if args.relay_mode:
+        options['relay_mode'] = args.relay_mode
+    if args.tcp_profile:
+        options['tcp_profile'] = args.tcp_profile
+    if args.max_handlers is not None:
+        options['max_handlers'] = args.max_handlers
+
+    target_port = free_port()
+    target_ready = multiprocessing.Event()
+    target = multiprocessing.Process(target=run_target, args=(target_port, target_ready), daemon=True)
+    target.start()
+    target_ready.wait(10)
+
+    proxy_port = free_port()
+    proxy_conn, child_conn = multiprocessing.Pipe()
+    proxy = multiprocessing.Process(target=run_proxy, args=(args.engine, proxy_port, dict(options), child_conn))
+    proxy.start()
+
+    results = {}
+    try:
+        wait_port(proxy_port)
+        if 'connect' in args.scenarios:
+            print(f"connect: {args.concurrency} 个并发客户端，{args.duration} 秒", file=sys.stderr)
+            results['connect'] = asyncio.run(
+                scenario_connect(proxy_port, target_port, args.concurrency, args.duration))
+        if 'throughput' in args.scenarios:
+            print(f"throughput: {args.streams} 条连接，每条 {args.size_mb} MB", file=sys.stderr)
+            results['throughput'] = scenario_throughput(
+                proxy_port, target_port, args.streams, args.size_mb * 1024 * 1024)
+        if 'idle' in args.scenarios:
+            print(f"idle: {args.idle} 条空闲连接", file=sys.stderr)
+            results['idle'] = asyncio.run(scenario_idle(proxy_port, target_port, args.idle, proxy_conn))
+    finally:
+        proxy_conn.send('stop')
+        if proxy_conn.poll(10):
+            proxy_conn.recv()
+        proxy.join(timeout=5)
+        if proxy.is_alive():
+            proxy.terminate()
+        target.terminate()
+
+    report = {
+        'format': 1,
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'engine': args.engine,
+            'options': options,
+            'params': {
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'streams': args.streams,
+                'size_mb': args.size_mb,
+                'idle': args.idle,
+            },
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
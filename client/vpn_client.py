@@ -0,0 +1,271 @@
+"""
+VPN 客户端 - 本地SOCKS5代理 + 多路复用隧道
+
+本地应用连接 127.0.0.1 上的SOCKS5代理，代理把每个连接作为一个流，通过一条
+预先认证的长连接转发到服务端（server.vpn_server.VPNServer），由服务端连接
+真正的目标。新连接只需要在隧道上发送一个 OPEN 帧。
+"""
+
+import socket
+import threading
+from common.compression import describe_stats
+from common.config import VPN_CONFIG, SOCKS5_CONFIG
+from common.logger import Logger
+from common.mux import MuxSession, TunnelError, client_handshake, relay_stream
+from common.socks5_proxy import Socks5ProxyHandler, Socks5ProxyServer
+
+
+class TunnelSocks5Handler(Socks5ProxyHandler):
+    """在本地完成SOCKS5握手，通过隧道连接目标的处理器"""
+
+    def __init__(self, client_socket, client_id, tunnel, logger=None, on_established=None):
+        """
+        初始化处理器
+
+        Args:
+            client_socket: 客户端socket
+            client_id: 客户端ID
+            tunnel: VPNClient 实例，提供隧道流
+            logger: 日志记录器
+            on_established: 完成请求阶段时调用的回调（可选）
+        """
+        super().__init__(client_socket, client_id, logger, relay_mode='copy', on_established=on_established)
+        self.tunnel = tunnel
+        self.stream = None
+        self.bind_address = ('0.0.0.0', 0)
+        # 转发过程中的 [上行, 下行] 字节数
+        self._moved = [0, 0]
+
+    def _connect_to_target(self, addr, port):
+        """
+        通过隧道打开一个流，由服务端连接目标
+
+        Returns:
+            bool: 连接是否成功
+        """
+        try:
+            self.stream, result = self.tunnel.open_stream(addr, port)
+        except (OSError, TunnelError) as e:
+            self.logger.error(f"[{self.client_id}] 隧道不可用: {e}")
+            self._send_reply(self.REP_GENERAL_FAILURE)
+            return False
+
+        if result is None:
+            self.logger.warning(f"[{self.client_id}] 隧道打开流超时: {addr}:{port}")
+            self.stream.close()
+            self._send_reply(self.REP_TTL_EXPIRED)
+            return False
+
+        reply, bind_addr, bind_port = result
+        if reply != self.REP_SUCCESS:
+            self.logger.warning(f"[{self.client_id}] 服务端连接目标失败({reply}): {addr}:{port}")
+            self._send_reply(reply)
+            return False
+
+        self.bind_address = (bind_addr, bind_port)
+        return True
+
+    def _get_bind_address(self):
+        """返回服务端连接目标时使用的本地地址"""
+        return self.bind_address
+
+    def _forward_pipelined(self):
+        """把客户端早发的数据写入隧道流"""
+        data = self._recv_buffer
+        if not data:
+            return 0
+        self.stream.send(bytes(data))
+        self._recv_buffer = bytearray()
+        return len(data)
+
+    def _relay_data(self):
+        """在客户端连接和隧道流之间双向转发数据（结束后由 handle() 记录汇总日志）"""
+        up, self.bytes_down = relay_stream(self.client_socket, self.stream, counts=self._moved)
+        self.bytes_up += up
+        compression = self.stream.compression_stats()
+        if compression:
+            self.logger.info(f"[{self.client_id}] {describe_stats(compression)}")
+            self.tunnel.record_compression(compression)
+
+    def progress(self):
+        """已转发的字节总数（包括正在转发中的）"""
+        return self.bytes_up + self._moved[0] + self._moved[1]
+
+    def _close_connections(self):
+        """关闭隧道流"""
+        if self.stream:
+            self.stream.close()
+
+
+class TunnelSocks5Server(Socks5ProxyServer):
+    """本地SOCKS5前端，所有连接都经由隧道转发"""
+
+    def __init__(self, tunnel, host='127.0.0.1', port=None, **options):
+        """
+        初始化本地代理
+
+        Args:
+            tunnel: VPNClient 实例
+            host: 监听地址
+            port: 监听端口（默认读取VPN_CONFIG['local_proxy_port']）
+            **options: 传递给 Socks5ProxyServer 的其他参数
+        """
+        # SOCKS5_CONFIG['unix_socket']、upstream_proxy 和 metrics_port 属于网关上的代理服务器，本地前端
+        # 不监听、不选择路径（目标由服务端连接），也不启动指标端口（避免与同机的代理服务器冲突）
+        options.setdefault('unix_listener', False)
+        options.setdefault('paths', False)
+        options.setdefault('metrics_port', 0)
+        super().__init__(host, port or VPN_CONFIG['local_proxy_port'], **options)
+        self.tunnel = tunnel
+        # 域名由服务端解析，UDP不经过隧道
+        self.resolver = None
+        self.udp_relay = None
+
+    def _create_handler(self, client_socket, client_id, client_ip):
+        return TunnelSocks5Handler(
+            client_socket, client_id, self.tunnel, self.logger,
+            on_established=self.admission.established
+        )
+
+
+class VPNClient:
+    """VPN客户端"""
+
+    def __init__(self, username, password, server_ip, server_port=None, local_port=None):
+        """
+        初始化VPN客户端
+
+        Args:
+            username: 用户名
+            password: 密码
+            server_ip: 服务端地址
+            server_port: 服务端端口（默认读取VPN_CONFIG['server_port']）
+            local_port: 本地SOCKS5代理端口（默认读取VPN_CONFIG['local_proxy_port']）
+        """
+        self.username = username
+        self.password = password
+        self.server_ip = server_ip
+        self.server_port = server_port or VPN_CONFIG['server_port']
+        self.local_port = local_port or VPN_CONFIG['local_proxy_port']
+        self.logger = Logger('VPNClient', 'vpn_client')
+        self.session = None
+        self.proxy = None
+        self.running = False
+        self._session_lock = threading.Lock()
+        # 所有流累计节省的字节数和压缩/解压的CPU时间
+        self.compression = {'saved_bytes': 0, 'cpu_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """
+        连接服务端并启动本地SOCKS5代理
+
+        Returns:
+            bool: 是否启动成功
+        """
+        try:
+            self._connect()
+        except (OSError, TunnelError) as e:
+            self.logger.error(f"连接服务端失败: {e}")
+            return False
+
+        self.running = True
+        self.proxy = TunnelSocks5Server(self, port=self.local_port)
+        threading.Thread(target=self.proxy.start, name='vpn-local-proxy', daemon=True).start()
+        self.logger.info(f"本地SOCKS5代理: 127.0.0.1:{self.local_port}")
+        return True
+
+    def stop(self):
+        """停止本地代理并断开隧道"""
+        self.running = False
+        if self.proxy:
+            self.proxy.stop()
+            self.proxy = None
+        with self._session_lock:
+            if self.session:
+                self.session.close()
+                self.session = None
+        self.logger.info("VPN客户端已停止")
+
+    def open_stream(self, addr, port):
+        """
+        在隧道上打开一个流，隧道断开时自动重连
+
+        Args:
+            addr: 目标地址
+            port: 目标端口
+
+        Returns:
+            tuple: (stream, (REP, 绑定地址, 绑定端口))，超时时结果为None
+        """
+        session = self._get_session()
+        # 服务端可能需要依次尝试多个地址，多等一个连接超时
+        timeout = SOCKS5_CONFIG['connect_attempt_timeout'] + VPN_CONFIG['connection_timeout']
+        return session.open_stream(addr, port, timeout)
+
+    def record_compression(self, compression):
+        """累计一个流的压缩统计（MuxStream.compression_stats()）"""
+        with self._stats_lock:
+            self.compression['saved_bytes'] += compression['saved_bytes']
+            self.compression['cpu_seconds'] += compression['cpu_seconds']
+
+    def get_stats(self):
+        """
+        获取客户端统计信息
+
+        Returns:
+            dict: 本地代理统计、隧道中的流数量和压缩统计
+        """
+        stats = self.proxy.get_stats() if self.proxy else {}
+        session = self.session
+        stats['tunnel_connected'] = bool(session and not session.closed)
+        stats['tunnel_streams'] = len(session.streams) if session else 0
+        with self._stats_lock:
+            stats['compression'] = dict(self.compression)
+        return stats
+
+    def _get_session(self):
+        """返回可用的隧道会话，断开时重新连接"""
+        with self._session_lock:
+            if self.session is None or self.session.closed:
+                if not self.running:
+                    raise TunnelError("VPN客户端未运行")
+                self.logger.warning("隧道已断开，正在重新连接")
+                self._connect_locked()
+            return self.session
+
+    def _connect(self):
+        with self._session_lock:
+            self._connect_locked()
+
+    def _connect_locked(self):
+        """建立并认证隧道连接（调用方需持有 _session_lock）"""
+        timeout = VPN_CONFIG['connection_timeout']
+        sock = socket.create_connection((self.server_ip, self.server_port), timeout=timeout)
+        try:
+            client_handshake(sock, self.username, self.password, timeout)
+        except BaseException:
+            sock.close()
+            raise
+        self.session = MuxSession(sock, logger=self.logger)
+        self.session.start()
+        self.logger.info(f"隧道已建立: {self.server_ip}:{self.server_port}")
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if len(sys.argv) < 4:
+        print("用法: python -m client.vpn_client 用户名 密码 服务端地址 [服务端端口]")
+        sys.exit(1)
+
+    client = VPNClient(sys.argv[1], sys.argv[2], sys.argv[3],
+                       int(sys.argv[4]) if len(sys.argv) > 4 else None)
+    if not client.start():
+        sys.exit(1)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        client.stop()
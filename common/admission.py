@@ -0,0 +1,209 @@
+"""
+连接准入控制
+
+限制代理服务器同时处理的连接数、排队等待的连接数、处于握手阶段的连接数
+以及单个客户端IP的连接数，防止连接风暴（BT客户端、异常应用等）耗尽
+路由器的内存或文件描述符。
+"""
+
+import queue
+import threading
+import time
+from collections import defaultdict
+from .config import SOCKS5_CONFIG
+
+
+class AdmissionController:
+    """线程安全的连接准入计数器"""
+
+    # 拒绝原因
+    REJECT_CAPACITY = 'capacity'          # 处理线程和等待队列都已满
+    REJECT_PENDING = 'pending'            # 握手阶段的连接过多
+    REJECT_PER_IP = 'per_ip'              # 单个客户端IP连接过多
+    REJECT_QUEUE_TIMEOUT = 'queue_timeout'  # 排队超时
+
+    def __init__(self, max_handlers=None, max_queued=None, max_pending=None,
+                 max_per_ip=None, queue_timeout=None):
+        """
+        初始化准入控制器（参数为None时读取SOCKS5_CONFIG，为0时表示不限制）
+
+        Args:
+            max_handlers: 同时处理的最大连接数
+            max_queued: 等待空闲处理线程的最大连接数
+            max_pending: 尚未完成握手和请求阶段的最大连接数
+            max_per_ip: 单个客户端IP的最大连接数
+            queue_timeout: 连接在队列中的最长等待时间（秒）
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.max_handlers = pick(max_handlers, 'max_handlers')
+        self.max_queued = pick(max_queued, 'max_queued')
+        self.max_pending = pick(max_pending, 'max_pending_handshakes')
+        self.max_per_ip = pick(max_per_ip, 'max_connections_per_ip')
+        self.queue_timeout = pick(queue_timeout, 'queue_timeout')
+
+        self._lock = threading.Lock()
+        self._per_ip = defaultdict(int)
+        self.admitted = 0   # 已准入但尚未释放（处理中 + 排队中）
+        self.active = 0     # 正在被处理线程处理
+        self.pending = 0    # 尚未完成握手和请求阶段
+        self.accepted_total = 0
+        self.rejected = defaultdict(int)
+
+    def try_admit(self, client_ip):
+        """
+        尝试准入一个新连接
+
+        Args:
+            client_ip: 客户端IP
+
+        Returns:
+            str: 拒绝原因，准入成功时返回None
+        """
+        with self._lock:
+            reason = None
+            capacity = self.max_handlers + self.max_queued
+            if self.max_handlers and self.admitted >= capacity:
+                reason = self.REJECT_CAPACITY
+            elif self.max_pending and self.pending >= self.max_pending:
+                reason = self.REJECT_PENDING
+            elif self.max_per_ip and self._per_ip[client_ip] >= self.max_per_ip:
+                reason = self.REJECT_PER_IP
+
+            if reason:
+                self.rejected[reason] += 1
+                if not self._per_ip[client_ip]:
+                    del self._per_ip[client_ip]
+                return reason
+
+            self.admitted += 1
+            self.pending += 1
+            self.accepted_total += 1
+            self._per_ip[client_ip] += 1
+            return None
+
+    def begin(self, enqueued_at):
+        """
+        处理线程开始处理一个已准入的连接
+
+        Args:
+            enqueued_at: 连接被准入时的 time.monotonic() 时间
+
+        Returns:
+            bool: False 表示该连接排队超时，应直接拒绝
+        """
+        if self.queue_timeout and time.monotonic() - enqueued_at > self.queue_timeout:
+            with self._lock:
+                self.rejected[self.REJECT_QUEUE_TIMEOUT] += 1
+            return False
+        with self._lock:
+            self.active += 1
+        return True
+
+    def established(self):
+        """连接完成握手和请求阶段，进入转发阶段"""
+        with self._lock:
+            self.pending -= 1
+
+    def release(self, client_ip, started, established):
+        """
+        释放一个已准入的连接
+
+        Args:
+            client_ip: 客户端IP
+            started: 是否调用过 begin() 且返回True
+            established: 是否调用过 established()
+        """
+        with self._lock:
+            self.admitted -= 1
+            if started:
+                self.active -= 1
+            if not established:
+                self.pending -= 1
+            self._per_ip[client_ip] -= 1
+            if self._per_ip[client_ip] <= 0:
+                del self._per_ip[client_ip]
+
+    def get_stats(self):
+        """
+        获取准入统计信息
+
+        Returns:
+            dict: active / queued / pending / accepted / rejected / rejected_by_reason / clients
+        """
+        with self._lock:
+            return {
+                'active': self.active,
+                'queued': self.admitted - self.active,
+                'pending': self.pending,
+                'accepted': self.accepted_total,
+                'rejected': sum(self.rejected.values()),
+                'rejected_by_reason': dict(self.rejected),
+                'clients': len(self._per_ip),
+            }
+
+
+class WorkerPool:
+    """数量有上限、按需创建的守护线程池"""
+
+    def __init__(self, max_workers, name='socks5-worker', logger=None):
+        """
+        初始化线程池
+
+        Args:
+            max_workers: 最大线程数
+            name: 线程名前缀
+            logger: 日志记录器（用于记录任务中未捕获的异常）
+        """
+        self.max_workers = max_workers
+        self.name = name
+        self.logger = logger
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle = 0
+
+    def submit(self, fn, *args):
+        """
+        提交任务，没有空闲线程且未达上限时创建新线程，否则排队等待
+
+        Args:
+            fn: 任务函数
+            *args: 任务参数
+        """
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+                spawn = False
+            else:
+                spawn = self._workers < self.max_workers
+                if spawn:
+                    self._workers += 1
+
+        self._queue.put((fn, args))
+        if spawn:
+            threading.Thread(target=self._run, name=f"{self.name}-{self._workers}", daemon=True).start()
+
+    def shutdown(self):
+        """通知所有线程在完成当前任务后退出"""
+        with self._lock:
+            workers = self._workers
+        for _ in range(workers):
+            self._queue.put((None, None))
+
+    def _run(self):
+        """线程主循环"""
+        while True:
+            fn, args = self._queue.get()
+            if fn is None:
+                with self._lock:
+                    self._workers -= 1
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"工作线程任务异常: {e}")
+            with self._lock:
+                self._idle += 1
@@ -0,0 +1,251 @@
+"""
+转发缓冲区池
+
+预先分配并复用固定大小的 bytearray，转发循环通过 recv_into 直接读入缓冲区、
+再以 memoryview 切片发送，避免每个数据包都新建一个 bytes 对象。
+
+自适应缓冲区（AdaptiveBuffer）：每个连接的每个转发方向从最小的缓冲区开始，
+连续 GROW_AFTER 次读满缓冲区时扩大一倍（大流量下载每次系统调用搬运更多数据），
+连续 SHRINK_AFTER 次读到的数据不足缓冲区的 1/SHRINK_RATIO 时缩小一半（交互流量
+和空闲连接只占用很少的内存）。所有连接扩大出来的部分合计不超过内存预算，
+超出时保持当前大小；每个连接的最小缓冲区总是分配（连接数由准入控制限制）。
+"""
+
+import threading
+from collections import deque
+from .config import SOCKS5_CONFIG
+
+# 默认缓冲区大小（字节）
+RELAY_BUFFER_SIZE = 8192
+
+# 连续读满多少次后扩大缓冲区
+GROW_AFTER = 2
+
+# 连续多少次读到的数据不足 1/SHRINK_RATIO 后缩小缓冲区
+SHRINK_AFTER = 8
+SHRINK_RATIO = 8
+
+
+class BufferPool:
+    """线程安全的 bytearray 缓冲区池"""
+
+    def __init__(self, buffer_size=RELAY_BUFFER_SIZE, max_buffers=256):
+        """
+        初始化缓冲区池
+
+        Args:
+            buffer_size: 每个缓冲区的大小（字节）
+            max_buffers: 池中最多保留的空闲缓冲区数量，超出部分归还时直接丢弃
+        """
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free = deque()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def acquire(self):
+        """
+        取出一个缓冲区
+
+        Returns:
+            bytearray: 大小为 buffer_size 的缓冲区
+        """
+        with self._lock:
+            self.in_use += 1
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.created += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buf):
+        """
+        归还缓冲区
+
+        Args:
+            buf: 之前由 acquire() 取出的缓冲区
+        """
+        with self._lock:
+            self.in_use -= 1
+            if len(buf) == self.buffer_size and len(self._free) < self.max_buffers:
+                self._free.append(buf)
+
+    def get_stats(self):
+        """
+        获取缓冲区池统计信息
+
+        Returns:
+            dict: created / reused / in_use / free
+        """
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'in_use': self.in_use,
+                'free': len(self._free),
+            }
+
+
+class AdaptiveBufferPool:
+    """按大小分级（最小值的2的幂倍）的缓冲区池，并限制所有转发缓冲区占用的内存（线程安全）"""
+
+    def __init__(self, min_size=None, max_size=None, budget=None, max_buffers=None):
+        """
+        初始化缓冲区池（参数为None时读取SOCKS5_CONFIG）
+
+        Args:
+            min_size: 最小（初始）缓冲区大小（字节）
+            max_size: 最大缓冲区大小（字节）
+            budget: 所有连接的转发缓冲区合计上限（字节），0表示不限制
+            max_buffers: 最小一级保留的空闲缓冲区数量，更大的级别按相同的总字节数折算
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.min_size = pick(min_size, 'relay_buffer_min')
+        self.max_size = max(self.min_size, pick(max_size, 'relay_buffer_max'))
+        self.budget = pick(budget, 'relay_buffer_budget')
+        max_buffers = pick(max_buffers, 'buffer_pool_size')
+
+        self._pools = {}
+        size = self.min_size
+        while size <= self.max_size:
+            self._pools[size] = BufferPool(size, max(1, max_buffers * self.min_size // size))
+            size *= 2
+        # 不是最小值2的幂倍时，最大值取不超过它的一级
+        self.max_size = size // 2
+
+        self.in_use_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'grown': 0, 'shrunk': 0, 'denied': 0}
+
+    def reserve(self, nbytes, force=False):
+        """
+        从内存预算中预留 nbytes 字节
+
+        Args:
+            nbytes: 字节数
+            force: 不检查预算（每个连接的最小缓冲区）
+
+        Returns:
+            bool: 是否预留成功
+        """
+        with self._lock:
+            if not force and self.budget and self.in_use_bytes + nbytes > self.budget:
+                self.stats['denied'] += 1
+                return False
+            self.in_use_bytes += nbytes
+            return True
+
+    def unreserve(self, nbytes):
+        """归还预留的 nbytes 字节"""
+        with self._lock:
+            self.in_use_bytes -= nbytes
+
+    def get(self, size):
+        """取出一个大小为 size 的缓冲区（size 必须是分级中的一个，不检查预算）"""
+        return self._pools[size].acquire()
+
+    def put(self, buf):
+        """归还由 get() 取出的缓冲区"""
+        self._pools[len(buf)].release(buf)
+
+    def get_stats(self):
+        """
+        获取缓冲区池统计信息
+
+        Returns:
+            dict: 使用中的字节数、预算、扩大/缩小/因预算不足未能扩大的次数，
+                  以及各级使用中的缓冲区数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_use_bytes'] = self.in_use_bytes
+        stats['budget'] = self.budget
+        stats['in_use'] = {size: pool.in_use for size, pool in self._pools.items() if pool.in_use}
+        return stats
+
+
+class AdaptiveBuffer:
+    """一个转发方向的读缓冲区，按最近的读取结果调整大小"""
+
+    __slots__ = ('pool', 'size', 'buf', 'view', '_full', '_small')
+
+    def __init__(self, pool=None, allocate=True):
+        """
+        Args:
+            pool: AdaptiveBufferPool（为None时使用固定大小 RELAY_BUFFER_SIZE 的独立缓冲区）
+            allocate: 是否分配缓冲区（False时只跟踪读取大小和预算，如asyncio按大小读取）
+        """
+        self.pool = pool
+        self.size = pool.min_size if pool else RELAY_BUFFER_SIZE
+        self.buf = self.view = None
+        self._full = self._small = 0
+        if pool:
+            pool.reserve(self.size, force=True)
+        if allocate:
+            self.buf = pool.get(self.size) if pool else bytearray(self.size)
+            self.view = memoryview(self.buf)
+
+    def record(self, n):
+        """
+        记录一次读取的字节数，必要时调整大小
+
+        Args:
+            n: 读到的字节数
+
+        Returns:
+            bool: 大小是否改变（调用方需要重新取 buf/view）
+        """
+        pool = self.pool
+        if pool is None:
+            return False
+        size = self.size
+        if n >= size:
+            self._small = 0
+            self._full += 1
+            if self._full >= GROW_AFTER and size < pool.max_size:
+                self._full = 0
+                return self._resize(size * 2)
+        elif n * SHRINK_RATIO <= size:
+            self._full = 0
+            self._small += 1
+            if self._small >= SHRINK_AFTER and size > pool.min_size:
+                self._small = 0
+                return self._resize(size // 2)
+        else:
+            self._full = self._small = 0
+        return False
+
+    def _resize(self, size):
+        pool = self.pool
+        if size > self.size:
+            if not pool.reserve(size - self.size):
+                return False
+            key = 'grown'
+        else:
+            pool.unreserve(self.size - size)
+            key = 'shrunk'
+        with pool._lock:
+            pool.stats[key] += 1
+        if self.buf is not None:
+            self.view.release()
+            pool.put(self.buf)
+            self.buf = pool.get(size)
+            self.view = memoryview(self.buf)
+        self.size = size
+        return True
+
+    def close(self):
+        """归还缓冲区和预留的预算（只能调用一次）"""
+        if self.view is not None:
+            self.view.release()
+        if self.pool:
+            self.pool.unreserve(self.size)
+            if self.buf is not None:
+                self.pool.put(self.buf)
+        self.buf = self.view = None
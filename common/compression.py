@@ -0,0 +1,292 @@
+"""
+隧道流压缩
+
+隧道两端（VPN客户端和服务端）可以对每个流的 DATA 帧做流式压缩：同一个流
+同一方向的所有压缩帧共用一个压缩上下文（前面的数据作为后面的字典），每帧
+结束时同步刷新，接收方收到一帧即可完整解出。
+
+压缩率按采样判断：每累计 sample_bytes 字节计算一次这段数据的压缩率，节省
+不到 min_saving 时认为数据不可压缩（图片、视频、TLS等已压缩或加密的流量），
+之后的 skip_bytes 字节直接以原始帧发送，再重新采样。原始帧不经过压缩上下文，
+接收方也不需要解压。
+
+方法：
+
+    zlib   标准库，raw deflate，去掉每帧末尾同步刷新的4字节标记
+    zstd   需要安装 zstandard 包，同等CPU下压缩率更高；未安装时回退到zlib
+"""
+
+import time
+import zlib
+from .config import VPN_CONFIG
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 方法编号（隧道 OPEN/OPEN_RESULT 帧中使用）
+METHOD_NONE = 0
+METHOD_ZLIB = 1
+METHOD_ZSTD = 2
+
+METHOD_NAMES = {METHOD_ZLIB: 'zlib', METHOD_ZSTD: 'zstd'}
+
+# 未指定压缩级别时使用（偏向速度，慢速链路上CPU通常不是瓶颈但路由器CPU较弱）
+DEFAULT_LEVELS = {METHOD_ZLIB: 3, METHOD_ZSTD: 3}
+
+# Z_SYNC_FLUSH 在每帧末尾产生的空存储块，发送时去掉，接收时补回
+_SYNC_MARKER = b'\x00\x00\xff\xff'
+
+
+def method_available(method):
+    """当前环境是否支持该方法"""
+    if method == METHOD_ZSTD:
+        return zstandard is not None
+    return method == METHOD_ZLIB
+
+
+def resolve_method(name, logger=None):
+    """
+    把配置中的方法名转换为方法编号
+
+    Args:
+        name: None、'zlib' 或 'zstd'
+        logger: 日志记录器（zstd不可用时记录回退）
+
+    Returns:
+        int: 方法编号，不压缩时为 METHOD_NONE
+
+    Raises:
+        ValueError: 未知的方法名
+    """
+    if not name:
+        return METHOD_NONE
+    for method, method_name in METHOD_NAMES.items():
+        if method_name == name:
+            break
+    else:
+        raise ValueError(f"未知的压缩方法: {name}")
+    if not method_available(method):
+        if logger:
+            logger.warning("未安装 zstandard，隧道压缩使用zlib")
+        method = METHOD_ZLIB
+    return method
+
+
+class StreamCompressor:
+    """一个流单方向的压缩器，按采样的压缩率决定是否压缩"""
+
+    def __init__(self, method, level=None, sample_bytes=None, min_saving=None, skip_bytes=None):
+        """
+        Args:
+            method: METHOD_ZLIB 或 METHOD_ZSTD
+            level: 压缩级别（默认读取VPN_CONFIG，未配置时使用 DEFAULT_LEVELS）
+            sample_bytes: 每次计算压缩率的数据量（字节，默认读取VPN_CONFIG）
+            min_saving: 采样中至少节省的比例，低于该值时暂停压缩（默认读取VPN_CONFIG）
+            skip_bytes: 暂停压缩的数据量（字节，默认读取VPN_CONFIG）
+        """
+        def pick(value, key):
+            return VPN_CONFIG[key] if value is None else value
+
+        self.method = method
+        level = pick(level, 'tunnel_compression_level') or DEFAULT_LEVELS[method]
+        if method == METHOD_ZSTD:
+            self._c = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.sample_bytes = pick(sample_bytes, 'compression_sample_bytes')
+        self.min_saving = pick(min_saving, 'compression_min_saving')
+        self.skip_bytes = pick(skip_bytes, 'compression_skip_bytes')
+
+        self._sample_in = 0
+        self._sample_out = 0
+        self._skip_left = 0
+
+        self.raw_bytes = 0      # 压缩前的数据量（含未压缩发送的）
+        self.wire_bytes = 0     # 实际发送的负载量
+        self.skipped_bytes = 0  # 判断为不可压缩、直接发送的数据量
+        self.cpu_seconds = 0.0
+
+    def compress(self, data):
+        """
+        压缩一帧数据
+
+        Args:
+            data: bytes 或 memoryview
+
+        Returns:
+            tuple: (负载, 是否已压缩)
+        """
+        n = len(data)
+        self.raw_bytes += n
+        if self._skip_left > 0:
+            self._skip_left -= n
+            self.skipped_bytes += n
+            self.wire_bytes += n
+            return data, False
+
+        started = time.thread_time()
+        if self.method == METHOD_ZSTD:
+            out = self._c.compress(data) + self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        else:
+            out = self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+            if out.endswith(_SYNC_MARKER):
+                out = out[:-len(_SYNC_MARKER)]
+        self.cpu_seconds += time.thread_time() - started
+        self.wire_bytes += len(out)
+
+        self._sample_in += n
+        self._sample_out += len(out)
+        if self._sample_in >= self.sample_bytes:
+            if self._sample_out > self._sample_in * (1 - self.min_saving):
+                self._skip_left = self.skip_bytes
+            self._sample_in = self._sample_out = 0
+        return out, True
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: raw_bytes / wire_bytes / skipped_bytes / cpu_seconds
+        """
+        return {
+            'raw_bytes': self.raw_bytes,
+            'wire_bytes': self.wire_bytes,
+            'skipped_bytes': self.skipped_bytes,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+
+class _FrameSink:
+    """zstd 解压的输出：收集一帧解出的数据，超过单帧上限时立即中止解压"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._size += len(data)
+        if self._size > self.limit:
+            raise ValueError(f"解压后的数据超过单帧上限 {self.limit} 字节")
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        """取出已收集的数据并清空"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+
+class StreamDecompressor:
+    """一个流单方向的解压器"""
+
+    def __init__(self, method, max_output):
+        """
+        Args:
+            method: METHOD_ZLIB 或 METHOD_ZSTD
+            max_output: 单帧解压后的最大长度（发送方每帧压缩的数据不超过该值）
+        """
+        self.method = method
+        self.max_output = max_output
+        if method == METHOD_ZSTD:
+            # decompressobj 会一次解出整帧，无法限制输出长度；stream_writer 按块写出，
+            # 输出超过上限时在写出的过程中中止，不会先分配出全部数据
+            self._sink = _FrameSink(max_output)
+            self._d = zstandard.ZstdDecompressor().stream_writer(
+                self._sink, write_size=zstandard.DECOMPRESSION_RECOMMENDED_OUTPUT_SIZE, closefd=False)
+        else:
+            self._d = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        self.raw_bytes = 0      # 解压后的数据量（含未压缩收到的）
+        self.wire_bytes = 0     # 收到的负载量
+        self.cpu_seconds = 0.0
+
+    def decompress(self, payload):
+        """
+        解压一帧数据
+
+        Args:
+            payload: 压缩帧的负载
+
+        Returns:
+            bytes: 原始数据
+
+        Raises:
+            ValueError: 数据损坏或解压后超过 max_output
+        """
+        started = time.thread_time()
+        try:
+            if self.method == METHOD_ZSTD:
+                try:
+                    self._d.write(payload)
+                finally:
+                    data = self._sink.take()
+            else:
+                data = self._d.decompress(payload + _SYNC_MARKER, self.max_output + 1)
+        except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as e:
+            raise ValueError(f"解压失败: {e}") from e
+        finally:
+            self.cpu_seconds += time.thread_time() - started
+        if len(data) > self.max_output:
+            raise ValueError(f"解压后的数据超过单帧上限 {self.max_output} 字节")
+        self.wire_bytes += len(payload)
+        self.raw_bytes += len(data)
+        return data
+
+    def passthrough(self, data):
+        """记录一个未压缩的帧"""
+        self.wire_bytes += len(data)
+        self.raw_bytes += len(data)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: raw_bytes / wire_bytes / cpu_seconds
+        """
+        return {'raw_bytes': self.raw_bytes, 'wire_bytes': self.wire_bytes, 'cpu_seconds': self.cpu_seconds}
+
+
+def describe_stats(stats):
+    """
+    把一个流的压缩统计（MuxStream.compression_stats()）格式化为日志文本
+
+    Returns:
+        str: 方法、两个方向压缩前后的字节数、节省的字节数和CPU时间
+    """
+    raw = stats['sent_raw'] + stats['received_raw']
+    saved_pct = stats['saved_bytes'] * 100 / raw if raw else 0.0
+    return (f"压缩({METHOD_NAMES[stats['method']]}) 发送 {stats['sent_raw']} -> {stats['sent_wire']} 字节，"
+            f"接收 {stats['received_wire']} -> {stats['received_raw']} 字节，"
+            f"节省 {stats['saved_bytes']} 字节({saved_pct:.1f}%)，CPU {stats['cpu_seconds'] * 1000:.1f} 毫秒")
+
+
+# 用于测试的独立运行
+if __name__ == '__main__':
+    import os
+
+    text = b''.join(b'{"id": %d, "path": "/api/v1/items/%d", "status": "ok"}\n' % (i, i * 7) for i in range(20000))
+    noise = os.urandom(len(text))
+    frame = 16 * 1024
+    for method in (METHOD_ZLIB, METHOD_ZSTD):
+        if not method_available(method):
+            print(f"{METHOD_NAMES[method]}: 不可用")
+            continue
+        for name, data in (('text', text), ('random', noise), ('mixed', text[:len(text) // 2] + noise)):
+            c = StreamCompressor(method, sample_bytes=64 * 1024, min_saving=0.1, skip_bytes=256 * 1024)
+            d = StreamDecompressor(method, frame)
+            out = []
+            for i in range(0, len(data), frame):
+                payload, compressed = c.compress(data[i:i + frame])
+                if compressed:
+                    out.append(d.decompress(payload))
+                else:
+                    d.passthrough(payload)
+                    out.append(bytes(payload))
+            assert b''.join(out) == data
+            s = c.get_stats()
+            print(f"{METHOD_NAMES[method]} {name:<7} {s['raw_bytes']:>9} -> {s['wire_bytes']:>9} 字节，"
+                  f"跳过 {s['skipped_bytes']:>8}，CPU {s['cpu_seconds'] * 1000:.1f} 毫秒")
+    print("OK")
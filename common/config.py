@@ -11,6 +11,8 @@
 发布日期：2025年11月7日
 """
 
+import os
+
 # Dr.COM认证服务器配置
 DRCOM_CONFIG = {
     'base_url': 'http://10.252.252.5',
@@ -50,13 +52,143 @@ VPN_CONFIG = {
     'buffer_size': 8192,    # 缓冲区大小
     'connection_timeout': 10,  # 连接超时（秒）
     'socks5_enabled': True,  # 启用SOCKS5代理（真实流量转发）
+    'tunnel_window': 256 * 1024,  # 隧道中每个流的发送窗口（字节）
+    # 隧道流压缩：None、'zlib' 或 'zstd'（需要安装zstandard，未安装时使用zlib）；
+    # 客户端按此请求压缩，服务端为None时不接受压缩请求
+    'tunnel_compression': None,
+    'tunnel_compression_level': None,  # 压缩级别（None为默认: zlib 3，zstd 3）
+    # 每累计 sample 字节计算一次压缩率，节省不到 min_saving 时之后的 skip 字节不压缩
+    'compression_sample_bytes': 64 * 1024,
+    'compression_min_saving': 0.1,
+    'compression_skip_bytes': 1024 * 1024,
+}
+
+# SOCKS5代理服务器配置
+SOCKS5_CONFIG = {
+    # 服务器引擎：'thread'(每连接一个线程)、'asyncio'(单线程事件循环)
+    # 或 'prefork'(多进程，每个进程用SO_REUSEPORT绑定同一端口)
+    'engine': 'thread',
+    # 同一端口上接受的协议（按连接的第一个字节识别）：'socks5'、'socks4'(含4a) 和 'http'(CONNECT/绝对URI)
+    'protocols': ['socks5', 'socks4', 'http'],
+    # 运行状态文件（DNS缓存、路径表）所在的目录，下面的状态文件名为相对路径时相对于此目录
+    'state_dir': os.path.join('~', '.local', 'state', 'drcom'),
+    'listen_backlog': 128,  # 监听队列长度
+    # 同机客户端的Unix域socket监听（与TCP端口同时提供，None表示不启用），
+    # 访问控制依靠socket文件的属组和权限位
+    'unix_socket': None,
+    'unix_socket_mode': 0o660,
+    'unix_socket_group': None,  # 属组名或GID（None为进程的属组）
+    'async_stream_limit': 16 * 1024,  # asyncio模式下每个连接的读缓冲上限（字节）
+    # asyncio模式下同时处理的最大连接数（0表示不限制）；协程不占用线程，不受 max_handlers 限制
+    'async_max_connections': 10000,
+    # 线程模式的转发方式：'copy'(recv/sendall) 或 'splice'(Linux零拷贝，不支持时自动回退)
+    'relay_mode': 'copy',
+    'accept_batch': 16,  # 每次唤醒最多连续接受的连接数
+    'buffer_pool_size': 256,  # 转发缓冲区池最多保留的空闲缓冲区数量（按最小缓冲区计）
+    # 自适应转发缓冲区：每个方向从最小值开始，连续读满时加倍，转为交互流量时减半
+    'relay_buffer_min': 4096,  # 最小（初始）读缓冲区（字节）
+    'relay_buffer_max': 256 * 1024,  # 最大读缓冲区（字节）
+    'relay_buffer_budget': 64 * 1024 * 1024,  # 所有连接的转发缓冲区合计上限（字节），0表示不限制
+    # 读缓冲区大小改变时把收发缓冲区(SO_RCVBUF/SO_SNDBUF)设为它的倍数，0表示不调整；
+    # TCP调优配置固定了收发缓冲区大小时不调整
+    'relay_socket_buffer_factor': 4,
+    # 多进程模式（SO_REUSEPORT）工作进程数，0表示使用CPU核数
+    'workers': 0,
+    # 准入控制（0表示不限制；max_handlers为0时恢复为每连接一个线程）
+    'max_handlers': 256,  # 同时处理的最大连接数（处理线程数上限）
+    'max_queued': 128,  # 等待空闲处理线程的最大连接数
+    'queue_timeout': 5,  # 连接排队的最长时间（秒），超时后拒绝
+    'max_pending_handshakes': 64,  # 尚未完成握手的最大连接数
+    'max_connections_per_ip': 128,  # 单个客户端IP的最大连接数
+    # UDP ASSOCIATE（仅线程模式）
+    'udp_enabled': True,
+    'udp_idle_timeout': 60,  # UDP关联空闲超时（秒）
+    'udp_batch_size': 64,  # 每次唤醒每个关联最多处理的数据报数
+    'udp_max_associations': 1024,  # 最大UDP关联数
+    # DNS缓存（getaddrinfo不返回真实TTL，使用以下固定值）
+    'dns_cache_enabled': True,
+    'dns_positive_ttl': 60,  # 解析成功的记录缓存时间（秒）
+    'dns_negative_ttl': 10,  # 域名不存在的记录缓存时间（秒）
+    'dns_max_stale': 24 * 3600,  # 过期记录仍可先行使用（同时后台刷新）的时间（秒）
+    'dns_max_entries': 4096,  # 最大缓存条目数
+    'dns_workers': 4,  # 后台解析线程数
+    'dns_timeout': 10,  # 连接目标前等待解析结果的最长时间（秒）
+    # 缓存持久化文件（相对于 state_dir），留空则不持久化；文件中记录了客户端访问过的所有域名
+    'dns_cache_file': 'dns_cache.json',
+    # 连接目标（Happy Eyeballs：多个地址交替竞速连接）
+    'connect_attempt_timeout': 10,  # 每个地址的连接超时（秒）
+    'connect_attempt_delay': 0.25,  # 上一个尝试未完成时，开始下一个尝试前的等待时间（秒）
+    'prefer_ipv6': True,  # 优先尝试IPv6地址
+    # 带宽限速（字节/秒，上下行分别计算，0表示不限速；prefork模式下每个进程单独计算）
+    'rate_limit_global': 0,  # 所有连接合计
+    'rate_limit_per_ip': 0,  # 单个客户端IP
+    'rate_limit_per_connection': 0,  # 单个连接
+    'rate_limit_burst': 1.0,  # 突发额度，按满速率持续的秒数计
+    # 指标（Prometheus文本格式，http://metrics_host:metrics_port/metrics）
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 9150,  # 0表示不启动；prefork模式下工作进程不启动
+    # TCP调优：'interactive'(低延迟)、'bulk'(高吞吐)、'low-memory-router'(小内存设备) 或 'none'
+    'tcp_profile': 'interactive',
+    # 上游连接启用TCP Fast Open（可省一个RTT，但连接目标失败不再能回复SOCKS5错误代码，
+    # 也会使多地址竞速、出口和路径的建连耗时测量失效，见 common/tcp_tuning.py）
+    'tcp_fastopen_connect': False,
+    # 用户名/密码认证（RFC 1929），凭据文件为空时不要求认证
+    # 添加用户: python -m common.socks5_auth 凭据文件 用户名
+    'auth_file': '',
+    'auth_cache_ttl': 300,  # 验证成功的凭据缓存时间（秒）
+    'auth_cache_size': 1024,  # 最多缓存的凭据数
+    'auth_hash_iterations': 200000,  # 新密码的PBKDF2迭代次数
+    # 目标地址规则（允许/拒绝/改走指定出口，格式见 common/rules.py），为空时不检查
+    'rules_file': '',
+    # 出口：名称 -> {'bind_address': 本地源地址, 'interface': 网卡名（SO_BINDTODEVICE）}，
+    # 供规则中的 route:<名称> 和多出口均衡使用（见 common/uplinks.py）
+    'outbounds': {},
+    'uplinks': [],  # 参与均衡的出口名，为空时使用默认路由
+    # 均衡策略：'round-robin'、'least-conn'(活动连接最少)、'least-rtt'(建连耗时最短) 或 'sticky'(按客户端IP固定)
+    'uplink_policy': 'least-conn',
+    'uplink_max_failures': 3,  # 出口连续建连失败多少次后暂时移出均衡
+    'uplink_cooldown': 30,  # 移出后多久重新尝试（秒），再次失败时加倍
+    # 上游SOCKS5代理 'socks5://[用户名:密码@]主机:端口'，配置后按目标学习直连还是经上游代理更快
+    # （见 common/path_selector.py），为空时总是直连
+    'upstream_proxy': None,
+    'path_ewma_alpha': 0.3,  # 建连/首字节耗时指数加权平均中新测量值的权重
+    'path_explore_ratio': 0.05,  # 改走较慢路径探测的概率
+    'path_table_size': 4096,  # 路径表最多保留的目标数（域名或 /24、/48 网段）
+    # 路径表持久化文件（相对于 state_dir），留空则不持久化；文件中记录了客户端访问过的所有域名和网段
+    'path_table_file': 'path_table.json',
+    # 空闲连接回收（0表示不检查）；对端掉线的连接由TCP调优配置中的保活探测发现
+    'handshake_timeout': 30,  # 接受连接后完成握手和请求的最长时间（秒）
+    'idle_timeout': 300,  # 转发阶段双向都没有数据的最长时间（秒）
+    'reaper_tick': 1.0,  # 回收器时间轮的刻度（秒）
+    # 平滑退出/交接时等待已有连接结束的最长时间（秒），超时后中止剩余连接
+    'drain_timeout': 30,
+    'handover_ready_timeout': 30,  # 交接时等待新进程开始接受连接的最长时间（秒）
 }
 
+
+def state_path(name):
+    """
+    状态文件的路径
+
+    Args:
+        name: 文件名（相对于 SOCKS5_CONFIG['state_dir']）或绝对路径
+
+    Returns:
+        str: 文件路径，name 为空时返回空字符串（不持久化）
+    """
+    if not name:
+        return ''
+    return os.path.join(os.path.expanduser(SOCKS5_CONFIG['state_dir']), os.path.expanduser(name))
+
+
 # 日志配置
 LOG_CONFIG = {
     'log_dir': 'logs',
     'log_level': 'DEBUG',
     'max_bytes': 10 * 1024 * 1024,  # 10MB
     'backup_count': 5,
+    # 逐包调试日志：来自这些客户端IP/网段的连接以DEBUG级别记录转发的每一块数据，
+    # 其余连接只在结束时记录一条汇总（逐包日志会显著降低吞吐量，仅用于排查问题）
+    'trace_clients': [],
 }
 
@@ -0,0 +1,382 @@
+"""
+带缓存的非阻塞DNS解析器
+
+解析在后台线程中进行，调用方拿到 Future 后可以同步等待，也可以交给
+asyncio 等待。同一域名的并发解析只发起一次查询，结果按TTL缓存（解析失败的
+域名短时间负缓存）。缓存可以保存到文件，重启后先用旧记录立即响应、同时在
+后台刷新，避免冷启动时每个连接都等待解析。
+
+注意：系统的 getaddrinfo 不返回记录的真实TTL，因此使用配置的固定TTL。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from .admission import WorkerPool
+from .config import SOCKS5_CONFIG, state_path
+from .logger import Logger
+
+
+def is_ip_address(host):
+    """
+    判断字符串是否为IPv4/IPv6地址字面量
+
+    Args:
+        host: 主机名或地址
+
+    Returns:
+        int: 地址族（AF_INET/AF_INET6），不是地址时返回0
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return family
+        except (OSError, ValueError):
+            continue
+    return 0
+
+
+def resolve_addresses(host, resolver=None, timeout=None):
+    """
+    解析主机的全部IPv4/IPv6地址（阻塞）
+
+    Args:
+        host: 主机名或IP地址
+        resolver: 缓存DNS解析器（可选，不指定时直接调用getaddrinfo）
+        timeout: 使用解析器时的最长等待时间（秒，默认SOCKS5_CONFIG['dns_timeout']）
+
+    Returns:
+        list: [(family, ip), ...]
+
+    Raises:
+        socket.gaierror: 解析失败
+        socket.timeout: 使用解析器时等待超时
+    """
+    if resolver:
+        return resolver.resolve(host, timeout=SOCKS5_CONFIG['dns_timeout'] if timeout is None else timeout)
+
+    family = is_ip_address(host)
+    if family:
+        return [(family, host)]
+
+    addresses = []
+    for family, _, _, _, sockaddr in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM):
+        if (family, sockaddr[0]) not in addresses:
+            addresses.append((family, sockaddr[0]))
+    return addresses
+
+
+class DnsResolver:
+    """线程安全的缓存DNS解析器"""
+
+    def __init__(self, positive_ttl=None, negative_ttl=None, max_stale=None,
+                 max_entries=None, workers=None, cache_file=None, logger=None):
+        """
+        初始化解析器（参数为None时读取SOCKS5_CONFIG）
+
+        Args:
+            positive_ttl: 解析成功的记录缓存时间（秒）
+            negative_ttl: 域名不存在的记录缓存时间（秒）
+            max_stale: 记录过期后仍可先行使用（同时后台刷新）的时间（秒）
+            max_entries: 最大缓存条目数
+            workers: 后台解析线程数
+            cache_file: 缓存持久化文件（相对于SOCKS5_CONFIG['state_dir']，空字符串表示不持久化）
+            logger: 日志记录器
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.positive_ttl = pick(positive_ttl, 'dns_positive_ttl')
+        self.negative_ttl = pick(negative_ttl, 'dns_negative_ttl')
+        self.max_stale = pick(max_stale, 'dns_max_stale')
+        self.max_entries = pick(max_entries, 'dns_max_entries')
+        self.cache_file = state_path(pick(cache_file, 'dns_cache_file'))
+        self.logger = logger or Logger('DnsResolver', 'socks5_proxy')
+
+        # host -> (addresses, expires_at, error)；addresses 为 [(family, ip), ...]
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = WorkerPool(pick(workers, 'dns_workers'), name='dns-resolver', logger=self.logger)
+
+        self.stats = {
+            'hits': 0,           # 命中未过期记录
+            'stale_hits': 0,     # 命中过期但仍可用的记录（同时后台刷新）
+            'negative_hits': 0,  # 命中负缓存
+            'misses': 0,         # 需要发起查询
+            'coalesced': 0,      # 合并到已有的进行中查询
+            'lookups': 0,        # 实际完成的查询次数
+            'lookup_time_total': 0.0,
+            'lookup_time_max': 0.0,
+        }
+
+    def resolve_async(self, host):
+        """
+        解析主机名（非阻塞）
+
+        Args:
+            host: 主机名或IP地址
+
+        Returns:
+            Future: 结果为 [(family, ip), ...]，解析失败时为 socket.gaierror 异常；
+                每次调用返回新的 Future，调用方可以取消（如等待超时）而不影响其他调用方
+        """
+        family = is_ip_address(host)
+        if family:
+            return self._completed([(family, host)])
+
+        with self._lock:
+            cached = self._lookup_cached(host)
+            if cached is not None:
+                addresses, error = cached
+                if error:
+                    return self._completed(exception=socket.gaierror(socket.EAI_NONAME, error))
+                return self._completed(addresses)
+
+            future = self._inflight.get(host)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return self._follow(future)
+
+            self.stats['misses'] += 1
+            return self._follow(self._start_lookup(host))
+
+    def resolve(self, host, timeout=None):
+        """
+        解析主机名（阻塞等待结果）
+
+        Args:
+            host: 主机名或IP地址
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            list: [(family, ip), ...]
+
+        Raises:
+            socket.gaierror: 解析失败
+            socket.timeout: 等待超时
+        """
+        try:
+            return self.resolve_async(host).result(timeout)
+        except FutureTimeoutError:
+            # Python 3.11之前 concurrent.futures.TimeoutError 不是OSError，调用方按连接超时处理
+            raise socket.timeout(f"解析 {host} 超时") from None
+
+    def get_cached(self, host):
+        """
+        只查缓存，不等待：未命中时在后台发起解析并返回None
+
+        Args:
+            host: 主机名或IP地址
+
+        Returns:
+            list: [(family, ip), ...]，未命中或负缓存时返回None
+        """
+        family = is_ip_address(host)
+        if family:
+            return [(family, host)]
+
+        with self._lock:
+            cached = self._lookup_cached(host)
+            if cached is None:
+                if host in self._inflight:
+                    self.stats['coalesced'] += 1
+                else:
+                    self.stats['misses'] += 1
+                    self._start_lookup(host)
+                return None
+        addresses, error = cached
+        return None if error else addresses
+
+    def _lookup_cached(self, host):
+        """
+        查缓存（调用方需持有锁），命中过期记录时顺带发起后台刷新
+
+        Returns:
+            tuple: (addresses, error)，未命中返回None
+        """
+        entry = self._cache.get(host)
+        if entry is None:
+            return None
+
+        addresses, expires_at, error = entry
+        now = time.time()
+        if now < expires_at:
+            self._cache.move_to_end(host)
+            if error:
+                self.stats['negative_hits'] += 1
+            else:
+                self.stats['hits'] += 1
+            return addresses, error
+
+        if not error and now < expires_at + self.max_stale:
+            self.stats['stale_hits'] += 1
+            if host not in self._inflight:
+                self._start_lookup(host)
+            return addresses, None
+
+        del self._cache[host]
+        return None
+
+    def _start_lookup(self, host):
+        """在后台线程中发起查询（调用方需持有锁）"""
+        future = Future()
+        self._inflight[host] = future
+        self._pool.submit(self._lookup, host, future)
+        return future
+
+    def _lookup(self, host, future):
+        """后台线程：执行查询并写入缓存"""
+        start = time.monotonic()
+        addresses, error, exception = [], None, None
+        try:
+            seen = set()
+            for family, _, _, _, sockaddr in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM):
+                if sockaddr[0] not in seen:
+                    seen.add(sockaddr[0])
+                    addresses.append((family, sockaddr[0]))
+        except socket.gaierror as e:
+            exception = e
+            # 仅对"域名不存在"做负缓存，临时性错误下次重新查询
+            if e.errno in (socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)):
+                error = e.strerror or str(e)
+        except Exception as e:
+            exception = socket.gaierror(socket.EAI_FAIL, str(e))
+        elapsed = time.monotonic() - start
+
+        with self._lock:
+            self._inflight.pop(host, None)
+            self.stats['lookups'] += 1
+            self.stats['lookup_time_total'] += elapsed
+            self.stats['lookup_time_max'] = max(self.stats['lookup_time_max'], elapsed)
+
+            if addresses:
+                self._store(host, (addresses, time.time() + self.positive_ttl, None))
+            elif error:
+                self._store(host, ([], time.time() + self.negative_ttl, error))
+            # 其他错误不改动缓存：刷新失败时旧记录在可用期限内继续使用
+
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(addresses)
+
+    def _store(self, host, entry):
+        """写入缓存并淘汰最久未使用的条目（调用方需持有锁）"""
+        self._cache[host] = entry
+        self._cache.move_to_end(host)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _follow(source):
+        """
+        构造一个跟随进行中查询结果的 Future
+
+        进行中的查询由所有合并的调用方共享，不能直接交给调用方：一个调用方等待超时
+        取消它时，其他调用方会收到 CancelledError，查询线程写入结果时也会出错
+        """
+        future = Future()
+
+        def copy(done):
+            # 调用方已取消时不再写入结果
+            if not future.set_running_or_notify_cancel():
+                return
+            exception = done.exception()
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(done.result())
+
+        source.add_done_callback(copy)
+        return future
+
+    @staticmethod
+    def _completed(result=None, exception=None):
+        """构造一个已完成的 Future"""
+        future = Future()
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+        return future
+
+    def load(self):
+        """
+        从文件加载缓存（过期但仍在可用期限内的记录也会加载）
+
+        Returns:
+            int: 加载的条目数
+        """
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return 0
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"加载DNS缓存失败: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for host, (expires_at, addresses) in data.items():
+                if now < expires_at + self.max_stale and addresses:
+                    self._store(host, ([tuple(a) for a in addresses], expires_at, None))
+                    loaded += 1
+        self.logger.info(f"已加载 {loaded} 条DNS缓存")
+        return loaded
+
+    def save(self):
+        """
+        把解析成功的记录保存到文件
+
+        Returns:
+            bool: 是否成功
+        """
+        if not self.cache_file:
+            return False
+        with self._lock:
+            data = {
+                host: [expires_at, addresses]
+                for host, (addresses, expires_at, error) in self._cache.items()
+                if not error
+            }
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_file)
+            return True
+        except OSError as e:
+            self.logger.warning(f"保存DNS缓存失败: {e}")
+            return False
+
+    def get_stats(self):
+        """
+        获取解析器统计信息
+
+        Returns:
+            dict: 命中/未命中次数、命中率、平均和最大查询耗时（秒）、缓存条目数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._cache)
+            stats['inflight'] = len(self._inflight)
+
+        requests = stats['hits'] + stats['stale_hits'] + stats['negative_hits'] + stats['misses'] + stats['coalesced']
+        cached = stats['hits'] + stats['stale_hits'] + stats['negative_hits']
+        stats['hit_rate'] = cached / requests if requests else 0.0
+        stats['lookup_time_avg'] = stats['lookup_time_total'] / stats['lookups'] if stats['lookups'] else 0.0
+        return stats
+
+    def close(self):
+        """停止后台解析线程"""
+        self._pool.shutdown()
@@ -0,0 +1,190 @@
+"""
+Happy Eyeballs 双栈连接（RFC 8305）
+
+目标解析出多个地址时，按 IPv6/IPv4 交替排序后依次发起连接：上一个尝试在
+attempt_delay 内没有结果就并行开始下一个，某个尝试失败则立即开始下一个。
+采用最先成功的连接并关闭其余尝试。每个尝试单独计算超时，一个无响应的
+地址不会让客户端等待完整的超时时间才尝试下一个地址。
+"""
+
+import asyncio
+import errno
+import os
+import selectors
+import socket
+import time
+
+# RFC 8305 推荐的连接尝试间隔（秒）
+DEFAULT_ATTEMPT_DELAY = 0.25
+
+
+def interleave_addresses(addresses, prefer_ipv6=True):
+    """
+    按地址族交替排序（RFC 8305 第4节）
+
+    Args:
+        addresses: [(family, ip), ...]
+        prefer_ipv6: 是否优先尝试IPv6
+
+    Returns:
+        list: 排序后的 [(family, ip), ...]
+    """
+    v6 = [a for a in addresses if a[0] == socket.AF_INET6]
+    v4 = [a for a in addresses if a[0] != socket.AF_INET6]
+    first, second = (v6, v4) if prefer_ipv6 else (v4, v6)
+
+    ordered = []
+    for i in range(max(len(first), len(second))):
+        if i < len(first):
+            ordered.append(first[i])
+        if i < len(second):
+            ordered.append(second[i])
+    return ordered
+
+
+def create_connection(addresses, port, attempt_timeout=10, attempt_delay=DEFAULT_ATTEMPT_DELAY,
+                      prefer_ipv6=True, prepare=None):
+    """
+    并行竞速连接多个地址（阻塞直到成功或全部失败）
+
+    Args:
+        addresses: [(family, ip), ...]
+        port: 目标端口
+        attempt_timeout: 每个连接尝试的超时时间（秒）
+        attempt_delay: 开始下一个尝试前等待的时间（秒）
+        prefer_ipv6: 是否优先尝试IPv6
+        prepare: 可选回调 prepare(sock, family)，在connect前设置socket选项或绑定源地址
+
+    Returns:
+        socket.socket: 已连接的阻塞socket
+
+    Raises:
+        socket.timeout: 所有尝试都超时
+        OSError: 所有尝试都失败（为最后一个失败原因）
+    """
+    ordered = interleave_addresses(addresses, prefer_ipv6)
+    if not ordered:
+        raise socket.gaierror(socket.EAI_NONAME, "没有可用的地址")
+
+    selector = selectors.DefaultSelector()
+    deadlines = {}
+    last_error = None
+    next_index = 0
+    next_start = time.monotonic()
+
+    try:
+        while next_index < len(ordered) or deadlines:
+            now = time.monotonic()
+
+            # 到时间或没有进行中的尝试时，开始下一个尝试
+            if next_index < len(ordered) and (now >= next_start or not deadlines):
+                family, ip = ordered[next_index]
+                next_index += 1
+                next_start = now + attempt_delay
+                sock = None
+                try:
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    if prepare:
+                        prepare(sock, family)
+                    sock.setblocking(False)
+                    err = sock.connect_ex((ip, port))
+                except OSError as e:
+                    last_error = e
+                    if sock:
+                        sock.close()
+                    continue
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock
+                if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                    last_error = OSError(err, os.strerror(err))
+                    sock.close()
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                deadlines[sock] = now + attempt_timeout
+
+            # 等待到下一个尝试开始或最早的尝试超时
+            wake_at = min(deadlines.values()) if deadlines else next_start
+            if next_index < len(ordered):
+                wake_at = min(wake_at, next_start)
+            for key, _ in selector.select(max(0.0, wake_at - time.monotonic())):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del deadlines[sock]
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    sock.setblocking(True)
+                    return sock
+                last_error = OSError(err, os.strerror(err))
+                sock.close()
+                # 失败后立即开始下一个尝试
+                next_start = time.monotonic()
+
+            now = time.monotonic()
+            for sock, deadline in list(deadlines.items()):
+                if now >= deadline:
+                    selector.unregister(sock)
+                    del deadlines[sock]
+                    sock.close()
+                    last_error = socket.timeout("连接超时")
+                    next_start = now
+
+        raise last_error
+    finally:
+        # 关闭未胜出的尝试
+        for sock in deadlines:
+            sock.close()
+        selector.close()
+
+
+async def async_create_connection(addresses, port, attempt_timeout=10, attempt_delay=DEFAULT_ATTEMPT_DELAY,
+                                  prefer_ipv6=True, prepare=None):
+    """
+    create_connection 的 asyncio 版本
+
+    Returns:
+        socket.socket: 已连接的非阻塞socket（可传给 asyncio.open_connection(sock=...)）
+    """
+    loop = asyncio.get_running_loop()
+    remaining = interleave_addresses(addresses, prefer_ipv6)
+    if not remaining:
+        raise socket.gaierror(socket.EAI_NONAME, "没有可用的地址")
+
+    async def attempt(family, ip):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if prepare:
+                prepare(sock, family)
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), attempt_timeout)
+            return sock
+        except BaseException:
+            sock.close()
+            raise
+
+    pending = set()
+    last_error = None
+    winner = None
+    try:
+        while remaining or pending:
+            if remaining:
+                pending.add(asyncio.ensure_future(attempt(*remaining.pop(0))))
+            done, pending = await asyncio.wait(
+                pending, timeout=attempt_delay if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                elif winner is None:
+                    winner = task.result()
+                else:
+                    task.result().close()
+            if winner is not None:
+                return winner
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
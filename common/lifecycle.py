@@ -0,0 +1,191 @@
+"""
+平滑退出与监听socket交接
+
+运行中的代理收到信号时：
+
+    SIGTERM / SIGINT   停止接受新连接，等待已有连接结束（最多 drain_timeout 秒），
+                       超时后中止剩余连接并退出
+    SIGUSR2            启动一个新进程并把监听socket交给它，新进程开始接受连接后，
+                       旧进程按上面的方式平滑退出（用于升级代码或修改配置）
+
+交接期间监听socket始终处于打开状态，新连接在内核队列中等待，不会被拒绝；
+旧进程上正在转发的连接继续由旧进程处理直到结束。
+
+监听socket也可以由systemd创建并传入（socket activation），这样即使服务被
+systemd重启，监听socket也一直由systemd持有：
+
+    # /etc/systemd/system/socks5-proxy.socket
+    [Socket]
+    ListenStream=1080
+
+    # /etc/systemd/system/socks5-proxy.service
+    [Service]
+    Type=notify
+    NotifyAccess=all
+    WorkingDirectory=/opt/drcom
+    ExecStart=/usr/bin/python3 -m common.socks5_proxy 1080
+    ExecReload=/bin/kill -USR2 $MAINPID
+    KillSignal=SIGTERM
+    TimeoutStopSec=40
+
+Type=notify 时新进程就绪后会通过 MAINPID= 通知systemd主进程已更换，
+因此 systemctl reload 也可以无中断地完成交接。
+"""
+
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+# 交接给新进程时传递监听socket和就绪管道的环境变量
+LISTEN_FD_ENV = 'SOCKS5_LISTEN_FD'
+READY_FD_ENV = 'SOCKS5_READY_FD'
+
+# systemd传入的第一个文件描述符
+SD_LISTEN_FDS_START = 3
+
+
+def inherited_listener():
+    """
+    获取从systemd（socket activation）或旧进程（交接）继承的监听socket
+
+    读取后清除相关环境变量，避免再传给之后启动的子进程。
+
+    Returns:
+        socket.socket: 监听socket，没有继承时返回None
+    """
+    fd = None
+    if os.environ.get('LISTEN_PID') == str(os.getpid()) and int(os.environ.get('LISTEN_FDS', '0')) >= 1:
+        fd = SD_LISTEN_FDS_START
+    elif os.environ.get(LISTEN_FD_ENV):
+        fd = int(os.environ[LISTEN_FD_ENV])
+    for key in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES', LISTEN_FD_ENV):
+        os.environ.pop(key, None)
+    if fd is None:
+        return None
+    # 地址族和类型从文件描述符自动获取
+    return socket.socket(fileno=fd)
+
+
+def notify_ready():
+    """
+    通知已开始接受连接：写入旧进程传入的就绪管道，并通知systemd（Type=notify）
+    """
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd:
+        try:
+            os.write(int(fd), b'1')
+            os.close(int(fd))
+        except OSError:
+            pass
+
+    address = os.environ.get('NOTIFY_SOCKET')
+    if address:
+        if address.startswith('@'):
+            # 抽象命名空间
+            address = '\0' + address[1:]
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto(f"READY=1\nMAINPID={os.getpid()}".encode('ascii'), address)
+        except OSError:
+            pass
+
+
+def spawn_successor(listener_fd, argv, timeout=None):
+    """
+    启动新进程并把监听socket交给它，等待新进程开始接受连接
+
+    Args:
+        listener_fd: 监听socket的文件描述符
+        argv: 新进程的命令行参数（不含解释器），如 ['-m', 'common.socks5_proxy', '1080']
+        timeout: 等待新进程就绪的最长时间（秒，默认读取SOCKS5_CONFIG['handover_ready_timeout']）
+
+    Returns:
+        subprocess.Popen: 新进程，启动失败或超时未就绪时返回None（已终止新进程）
+    """
+    timeout = SOCKS5_CONFIG['handover_ready_timeout'] if timeout is None else timeout
+    read_fd, write_fd = os.pipe()
+    env = dict(os.environ)
+    env[LISTEN_FD_ENV] = str(listener_fd)
+    env[READY_FD_ENV] = str(write_fd)
+    try:
+        proc = subprocess.Popen([sys.executable] + list(argv), env=env, pass_fds=(listener_fd, write_fd))
+    except OSError:
+        os.close(read_fd)
+        return None
+    finally:
+        os.close(write_fd)
+
+    try:
+        readable, _, _ = select.select([read_fd], [], [], timeout)
+        ready = bool(readable) and os.read(read_fd, 1) == b'1'
+    finally:
+        os.close(read_fd)
+    if not ready:
+        proc.terminate()
+        return None
+    return proc
+
+
+def run_server(server, argv=None, drain_timeout=None, logger=None):
+    """
+    在主线程中运行代理服务器并处理退出和交接信号（阻塞直到服务器停止）
+
+    Args:
+        server: Socks5ProxyServer 或 AsyncSocks5ProxyServer
+        argv: 交接时新进程的命令行参数（不含解释器），为None时不处理SIGUSR2
+        drain_timeout: 平滑退出的最长等待时间（秒，默认读取SOCKS5_CONFIG['drain_timeout']）
+        logger: 日志记录器
+    """
+    logger = logger or Logger('Lifecycle', 'socks5_proxy')
+    wakeup = threading.Event()
+    requested = []
+
+    def on_signal(signum, frame):
+        requested.append(signum)
+        wakeup.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    if argv is not None and hasattr(signal, 'SIGUSR2'):
+        signal.signal(signal.SIGUSR2, on_signal)
+
+    thread = threading.Thread(target=server.start, name='proxy-server', daemon=True)
+    thread.start()
+    while thread.is_alive() and not server.running:
+        time.sleep(0.05)
+    if not thread.is_alive():
+        return
+    notify_ready()
+
+    while thread.is_alive():
+        if not wakeup.wait(1.0):
+            continue
+        wakeup.clear()
+        signum = requested.pop() if requested else None
+        if signum == getattr(signal, 'SIGUSR2', None):
+            fd = server.listener_fileno()
+            if fd is None:
+                continue
+            logger.info("收到SIGUSR2，启动新进程并交接监听socket")
+            # 指标端口不能共享，先让给新进程
+            server.metrics_server.stop()
+            successor = spawn_successor(fd, argv)
+            if successor is None:
+                logger.error("新进程启动失败或未就绪，继续运行")
+                server.metrics_server.start()
+                continue
+            logger.info(f"新进程已就绪(pid {successor.pid})，开始平滑退出")
+        elif signum is not None:
+            logger.info(f"收到信号 {signum}，开始平滑退出")
+        else:
+            continue
+        server.drain(drain_timeout)
+        break
+    thread.join(timeout=5)
@@ -11,6 +11,7 @@
 发布日期：2025年11月7日
 """
 
+import ipaddress
 import logging
 import os
 from logging.handlers import RotatingFileHandler
@@ -66,23 +67,65 @@ class Logger:
                 file_handler.setFormatter(formatter)
                 self.logger.addHandler(file_handler)
     
-    def debug(self, msg):
+    def is_enabled(self, level=logging.DEBUG):
+        """
+        判断某个级别的日志是否会被记录（热路径上先判断再构造日志内容）
+        
+        Args:
+            level: 日志级别（默认DEBUG）
+            
+        Returns:
+            bool: 是否会被记录
+        """
+        return self.logger.isEnabledFor(level)
+    
+    # 带参数时按 % 格式延迟格式化，日志不会被记录时不产生格式化开销
+    
+    def debug(self, msg, *args):
         """记录调试信息"""
-        self.logger.debug(msg)
+        self.logger.debug(msg, *args)
     
-    def info(self, msg):
+    def info(self, msg, *args):
         """记录一般信息"""
-        self.logger.info(msg)
+        self.logger.info(msg, *args)
     
-    def warning(self, msg):
+    def warning(self, msg, *args):
         """记录警告信息"""
-        self.logger.warning(msg)
+        self.logger.warning(msg, *args)
     
-    def error(self, msg):
+    def error(self, msg, *args):
         """记录错误信息"""
-        self.logger.error(msg)
+        self.logger.error(msg, *args)
     
-    def critical(self, msg):
+    def critical(self, msg, *args):
         """记录严重错误信息"""
-        self.logger.critical(msg)
+        self.logger.critical(msg, *args)
+
+
+def packet_trace_matcher(clients=None):
+    """
+    创建判断连接是否开启逐包调试日志的函数
+    
+    默认每个连接只在结束时记录一条汇总日志；来自 clients 中地址的连接
+    额外以DEBUG级别记录转发的每一块数据，用于排查个别客户端的问题。
+    
+    Args:
+        clients: 客户端IP或网段列表（默认读取LOG_CONFIG['trace_clients']）
+        
+    Returns:
+        callable: match(client_ip) -> bool，未配置任何地址时返回None
+    """
+    clients = LOG_CONFIG['trace_clients'] if clients is None else clients
+    networks = [ipaddress.ip_network(c, strict=False) for c in clients]
+    if not networks:
+        return None
+    
+    def match(client_ip):
+        try:
+            ip = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return False
+        return any(ip in net for net in networks)
+    
+    return match
 
@@ -0,0 +1,480 @@
+"""
+进程内指标与 Prometheus 文本格式导出
+
+计数器、仪表和直方图都只在本进程内累加，记录一次只需一次加锁和几次整数运算；
+能从已有统计（准入控制器、DNS缓存等）直接读出的指标在抓取时通过回调读取，
+不在连接处理路径上重复记录。指标通过本地HTTP端口以 Prometheus 文本格式提供。
+"""
+
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+# 默认的耗时直方图分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames, values, extra=''):
+    """格式化标签，如 {direction="up"}"""
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Metric:
+    """指标基类：按标签值保存子指标"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """
+        获取指定标签值的子指标（调用方可以缓存返回值，避免每次查找）
+
+        Args:
+            *values: 按 labelnames 顺序的标签值
+
+        Returns:
+            子指标对象
+        """
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+
+class _Value:
+    """单个数值（线程安全）"""
+
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        """无标签计数器加 amount"""
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+
+class _HistogramValue:
+    """单个直方图（线程安全）"""
+
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        """无标签直方图记录一个观测值"""
+        self._children[()].observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """抓取时才通过回调读取数值的指标"""
+
+    def __init__(self, name, documentation, kind, fn, labelnames=()):
+        """
+        Args:
+            kind: 'counter' 或 'gauge'
+            fn: 无标签时返回数值，有标签时返回 {标签值元组: 数值}
+        """
+        self.kind = kind
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def render(self):
+        try:
+            result = self.fn()
+        except Exception:
+            # 数据源暂不可用时跳过该指标
+            return []
+        if not self.labelnames:
+            result = {(): result}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, value in sorted(result.items()):
+            if not isinstance(values, tuple):
+                values = (values,)
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, kind, fn, labelnames))
+
+    def render(self):
+        """
+        生成 Prometheus 文本格式
+
+        Returns:
+            str: 所有指标
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ProxyMetrics:
+    """SOCKS5代理服务器的指标"""
+
+    # SOCKS5响应代码 -> 标签值
+    REPLY_NAMES = {
+        0: 'succeeded',
+        1: 'general_failure',
+        2: 'connection_not_allowed',
+        3: 'network_unreachable',
+        4: 'host_unreachable',
+        5: 'connection_refused',
+        6: 'ttl_expired',
+        7: 'command_not_supported',
+        8: 'address_type_not_supported',
+    }
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+
+        bytes_total = r.counter('socks5_bytes_total', '转发的字节数', ('direction',))
+        # 预先取出子指标，转发路径上不再查找标签
+        self.bytes_up = bytes_total.labels('up')
+        self.bytes_down = bytes_total.labels('down')
+        self.handshake_seconds = r.histogram(
+            'socks5_handshake_duration_seconds', '从开始处理连接到收到完整请求的耗时')
+        self.connect_seconds = r.histogram(
+            'socks5_connect_duration_seconds', '解析并连接目标的耗时（仅成功的连接）')
+        self.first_byte_seconds = r.histogram(
+            'socks5_time_to_first_byte_seconds', '从回复成功到目标返回第一个字节的耗时')
+        self._replies = r.counter('socks5_replies_total', '按响应代码统计的SOCKS5响应数（其他协议按对应的代码计入）',
+                                  ('code',))
+        self._protocols = r.counter('socks5_connections_by_protocol_total', '按客户端协议统计的连接数',
+                                    ('protocol',))
+        self._reply_children = {
+            code: self._replies.labels(name) for code, name in self.REPLY_NAMES.items()
+        }
+
+    def reply(self, code):
+        """记录一个SOCKS5响应"""
+        child = self._reply_children.get(code)
+        if child is None:
+            child = self._replies.labels(str(code))
+        child.inc()
+
+    def protocol(self, name):
+        """记录一个按首字节识别出协议的连接（'socks5'、'socks4' 或 'http'）"""
+        self._protocols.labels(name).inc()
+
+    def bind_admission(self, admission):
+        """通过回调导出准入控制器的连接数"""
+        r = self.registry
+        r.callback('socks5_connections_active', '正在处理的连接数', 'gauge',
+                   lambda: admission.get_stats()['active'])
+        r.callback('socks5_connections_queued', '等待处理线程的连接数', 'gauge',
+                   lambda: admission.get_stats()['queued'])
+        r.callback('socks5_connections_pending', '尚未完成握手和请求阶段的连接数', 'gauge',
+                   lambda: admission.get_stats()['pending'])
+        r.callback('socks5_connections_accepted_total', '已接受的连接数', 'counter',
+                   lambda: admission.get_stats()['accepted'])
+        r.callback('socks5_connections_rejected_total', '按原因统计的拒绝连接数', 'counter',
+                   lambda: admission.get_stats()['rejected_by_reason'], ('reason',))
+
+    def bind_resolver(self, resolver):
+        """通过回调导出DNS缓存的统计"""
+        r = self.registry
+        r.callback('socks5_dns_lookups_total', '实际发起的DNS查询数', 'counter',
+                   lambda: resolver.get_stats()['lookups'])
+        r.callback('socks5_dns_cache_hit_ratio', 'DNS缓存命中率', 'gauge',
+                   lambda: resolver.get_stats()['hit_rate'])
+
+    def bind_credentials(self, credentials):
+        """通过回调导出每个用户的连接数和流量"""
+        r = self.registry
+
+        def user_values(field):
+            return {user: entry[field] for user, entry in credentials.get_user_stats().items()}
+
+        def user_bytes():
+            values = {}
+            for user, entry in credentials.get_user_stats().items():
+                values[(user, 'up')] = entry['bytes_up']
+                values[(user, 'down')] = entry['bytes_down']
+            return values
+
+        r.callback('socks5_user_connections_active', '每个用户正在处理的连接数', 'gauge',
+                   lambda: user_values('active'), ('user',))
+        r.callback('socks5_user_connections_total', '每个用户认证通过的连接数', 'counter',
+                   lambda: user_values('connections'), ('user',))
+        r.callback('socks5_user_bytes_total', '每个用户已结束连接转发的字节数', 'counter',
+                   user_bytes, ('user', 'direction'))
+        r.callback('socks5_auth_failures_total', '认证失败次数', 'counter',
+                   lambda: credentials.get_stats()['failures'])
+
+    def bind_rules(self, rules):
+        """通过回调导出规则的命中次数"""
+        def decisions():
+            stats = rules.get_stats()
+            return {'allow': stats['allowed'], 'deny': stats['denied'], 'route': stats['routed']}
+
+        self.registry.callback('socks5_rule_decisions_total', '按动作统计的规则匹配次数', 'counter',
+                               decisions, ('action',))
+
+    def bind_reaper(self, reaper):
+        """通过回调导出因超时被回收的连接数"""
+        def reaped():
+            stats = reaper.get_stats()
+            return {'idle': stats['reaped_idle'], 'handshake': stats['reaped_handshake']}
+
+        self.registry.callback('socks5_connections_reaped_total', '因超时被回收的连接数', 'counter',
+                               reaped, ('reason',))
+
+    def bind_buffers(self, pool):
+        """通过回调导出转发缓冲区占用的内存和大小调整次数"""
+        r = self.registry
+        r.callback('socks5_relay_buffer_bytes', '转发读缓冲区占用的字节数', 'gauge',
+                   lambda: pool.get_stats()['in_use_bytes'])
+        r.callback('socks5_relay_buffer_resizes_total', '转发读缓冲区的大小调整次数', 'counter',
+                   lambda: {key: value for key, value in pool.get_stats().items()
+                            if key in ('grown', 'shrunk', 'denied')}, ('change',))
+
+    def bind_uplinks(self, uplinks):
+        """通过回调导出各出口的活动连接数、建连失败次数、建连耗时和健康状态"""
+        r = self.registry
+
+        def uplink_values(field):
+            return {name: entry[field] for name, entry in uplinks.get_stats()['uplinks'].items()}
+
+        def uplink_rtt():
+            return {name: (rtt or 0.0) / 1000 for name, rtt in uplink_values('rtt_ms').items()}
+
+        r.callback('socks5_uplink_connections_active', '各出口的活动连接数', 'gauge',
+                   lambda: uplink_values('active'), ('uplink',))
+        r.callback('socks5_uplink_connections_total', '各出口累计的连接数', 'counter',
+                   lambda: uplink_values('connections'), ('uplink',))
+        r.callback('socks5_uplink_connect_failures_total', '各出口的建连失败次数', 'counter',
+                   lambda: uplink_values('failures'), ('uplink',))
+        r.callback('socks5_uplink_connect_rtt_seconds', '各出口建连耗时的加权平均', 'gauge',
+                   uplink_rtt, ('uplink',))
+        r.callback('socks5_uplink_healthy', '出口是否参与均衡（1为是）', 'gauge',
+                   lambda: {name: int(ok) for name, ok in uplink_values('healthy').items()}, ('uplink',))
+
+    def bind_paths(self, paths):
+        """通过回调导出直连/上游代理路径的选择次数、探测次数和路径表中各路径较快的目标数"""
+        r = self.registry
+
+        def by_path(prefix):
+            stats = paths.get_stats()
+            return {'direct': stats[f'{prefix}_direct'], 'upstream': stats[f'{prefix}_upstream']}
+
+        r.callback('socks5_path_connections_total', '各路径选择的连接数', 'counter',
+                   lambda: by_path('choices'), ('path',))
+        r.callback('socks5_path_explorations_total', '改走较慢路径探测的连接数', 'counter',
+                   lambda: paths.get_stats()['explorations'])
+        r.callback('socks5_path_connect_failures_total', '经某条路径建连失败（随后改走另一条路径）的次数', 'counter',
+                   lambda: paths.get_stats()['failures'])
+        r.callback('socks5_path_preferred_destinations', '路径表中该路径较快的目标数', 'gauge',
+                   lambda: by_path('preferred'), ('path',))
+
+
+class MetricsServer:
+    """在本地HTTP端口上提供 /metrics"""
+
+    def __init__(self, registry, host=None, port=None, logger=None):
+        """
+        初始化指标HTTP服务
+
+        Args:
+            registry: 指标注册表
+            host: 监听地址（默认读取SOCKS5_CONFIG）
+            port: 监听端口（默认读取SOCKS5_CONFIG，0表示不启动）
+            logger: 日志记录器
+        """
+        self.registry = registry
+        self.host = host or SOCKS5_CONFIG['metrics_host']
+        self.port = SOCKS5_CONFIG['metrics_port'] if port is None else port
+        self.logger = logger or Logger('MetricsServer', 'socks5_proxy')
+        self.httpd = None
+
+    def start(self):
+        """
+        在后台线程中启动HTTP服务
+
+        Returns:
+            bool: 是否启动成功
+        """
+        if not self.port:
+            return False
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 不把每次抓取写入标准错误
+                pass
+
+        try:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            self.logger.warning(f"指标服务启动失败 {self.host}:{self.port}: {e}")
+            return False
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True).start()
+        self.logger.info(f"指标服务: http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        """停止HTTP服务"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,645 @@
+"""
+多路复用隧道协议
+
+客户端与服务端之间保持一条长连接（预先完成认证），每个SOCKS5连接对应其中的
+一个流。新连接只需发送一个 OPEN 帧，不再经过慢速链路上的TCP握手和SOCKS5握手。
+
+帧格式: TYPE(1) | STREAM_ID(4) | LENGTH(2) | PAYLOAD
+
+每个流有独立的发送窗口：发送方最多发送窗口大小的未确认数据，接收方把数据
+交给本地socket后用 WINDOW 帧归还窗口。单个慢速的流只会停住自己，不会阻塞
+整条隧道上的其他流，接收方为每个流缓存的数据也不超过窗口大小。
+
+流可以协商压缩（见 common.compression）：客户端在 OPEN 的地址之后附加一个字节
+表示请求的压缩方法，服务端接受时在 OPEN_RESULT 的地址之后回复同一个字节，此后
+两个方向上的压缩数据以 DATA_COMPRESSED 帧发送。不认识该字节的旧版本对端会忽略
+它且不回复，流保持不压缩。窗口始终按压缩前的字节数计算。
+"""
+
+import hashlib
+import hmac
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from .compression import (
+    METHOD_NONE, StreamCompressor, StreamDecompressor, method_available, resolve_method,
+)
+from .config import VPN_CONFIG
+from .dns_cache import is_ip_address
+from .logger import Logger
+
+# 帧类型
+FRAME_HELLO = 0        # 服务端 -> 客户端：认证随机数
+FRAME_AUTH = 1         # 客户端 -> 服务端：ULEN(1) | 用户名 | HMAC-SHA256(密码, 随机数)
+FRAME_AUTH_RESULT = 2  # 服务端 -> 客户端：STATUS(1)，0表示成功
+FRAME_OPEN = 3         # 客户端 -> 服务端：ATYP | DST.ADDR | DST.PORT（与SOCKS5请求相同）
+FRAME_OPEN_RESULT = 4  # 服务端 -> 客户端：REP(1) | ATYP | BND.ADDR | BND.PORT
+FRAME_DATA = 5
+FRAME_WINDOW = 6       # 归还发送窗口：INCREMENT(4)
+FRAME_CLOSE = 7        # 发送方关闭了该流
+FRAME_PING = 8
+FRAME_PONG = 9
+FRAME_DATA_COMPRESSED = 10  # 负载为压缩后的数据（流协商了压缩时）
+
+FRAME_HEADER = struct.Struct('!BIH')
+_WINDOW = struct.Struct('!I')
+
+# 单个DATA帧的最大负载，较小的帧让多个流更公平地分享带宽
+MAX_FRAME_PAYLOAD = 16 * 1024
+NONCE_SIZE = 16
+
+# 地址类型（与 Socks5ProxyHandler 保持一致）
+ADDR_IPV4 = 1
+ADDR_DOMAIN = 3
+ADDR_IPV6 = 4
+
+
+class TunnelError(Exception):
+    """隧道建立或认证失败"""
+
+
+def encode_address(addr, port):
+    """
+    按SOCKS5格式编码地址
+
+    Args:
+        addr: IP地址或域名
+        port: 端口
+
+    Returns:
+        bytes: ATYP | ADDR | PORT
+    """
+    family = is_ip_address(addr)
+    if family == socket.AF_INET:
+        head = bytes([ADDR_IPV4]) + socket.inet_aton(addr)
+    elif family == socket.AF_INET6:
+        head = bytes([ADDR_IPV6]) + socket.inet_pton(socket.AF_INET6, addr)
+    else:
+        name = addr.encode('utf-8')
+        head = bytes([ADDR_DOMAIN, len(name)]) + name
+    return head + struct.pack('!H', port)
+
+
+def decode_address(data):
+    """
+    解码SOCKS5格式的地址
+
+    Args:
+        data: ATYP | ADDR | PORT
+
+    Returns:
+        tuple: (地址, 端口)
+
+    Raises:
+        ValueError: 格式错误
+    """
+    return _decode_address(data)[:2]
+
+
+def _decode_address(data):
+    """解码地址，同时返回地址（含端口）之后的偏移"""
+    atyp = data[0]
+    if atyp == ADDR_IPV4:
+        addr, end = socket.inet_ntoa(data[1:5]), 5
+    elif atyp == ADDR_IPV6:
+        addr, end = socket.inet_ntop(socket.AF_INET6, data[1:17]), 17
+    elif atyp == ADDR_DOMAIN:
+        end = 2 + data[1]
+        addr = data[2:end].decode('utf-8')
+    else:
+        raise ValueError(f"不支持的地址类型: {atyp}")
+    if len(data) < end + 2:
+        raise ValueError("地址数据不完整")
+    return addr, struct.unpack('!H', data[end:end + 2])[0], end + 2
+
+
+def _trailing_method(data):
+    """地址之后的压缩方法字节（旧版本的对端不发送，视为不压缩）"""
+    try:
+        end = _decode_address(data)[2]
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return METHOD_NONE
+    return data[end] if len(data) > end else METHOD_NONE
+
+
+def auth_digest(password, nonce):
+    """计算认证摘要，密码本身不在链路上传输"""
+    return hmac.new(password.encode('utf-8'), nonce, hashlib.sha256).digest()
+
+
+class MuxStream:
+    """隧道中的一个流，接口与阻塞socket类似"""
+
+    def __init__(self, session, stream_id, window):
+        self.session = session
+        self.stream_id = stream_id
+        self._cond = threading.Condition()
+        self._chunks = deque()
+        self._send_window = window
+        self._window = window
+        self._consumed = 0
+        self.closed = False         # 本端已关闭
+        self.remote_closed = False  # 对端已关闭或隧道已断开
+        # OPEN 的结果：(REP, 绑定地址, 绑定端口)
+        self.open_result = None
+        self._opened = threading.Event()
+        # 对端在 OPEN 中请求的压缩方法（服务端），以及协商成功后两个方向的压缩器
+        self.requested_compression = METHOD_NONE
+        self.compressor = None
+        self.decompressor = None
+
+    def enable_compression(self, method):
+        """
+        启用压缩（在发送或收到第一个 DATA 帧之前调用）
+
+        Args:
+            method: 协商的压缩方法编号
+        """
+        self.compressor = StreamCompressor(method)
+        self.decompressor = StreamDecompressor(method, MAX_FRAME_PAYLOAD)
+
+    def compression_stats(self):
+        """
+        本流的压缩统计
+
+        Returns:
+            dict: method / sent_raw / sent_wire / received_raw / received_wire / saved_bytes / cpu_seconds，
+                  未协商压缩时返回None
+        """
+        if self.compressor is None:
+            return None
+        sent, received = self.compressor.get_stats(), self.decompressor.get_stats()
+        return {
+            'method': self.compressor.method,
+            'sent_raw': sent['raw_bytes'],
+            'sent_wire': sent['wire_bytes'],
+            'received_raw': received['raw_bytes'],
+            'received_wire': received['wire_bytes'],
+            'saved_bytes': (sent['raw_bytes'] - sent['wire_bytes']) + (received['raw_bytes'] - received['wire_bytes']),
+            'cpu_seconds': sent['cpu_seconds'] + received['cpu_seconds'],
+        }
+
+    def recv(self):
+        """
+        读取一块数据（阻塞）
+
+        Returns:
+            bytes: 数据，对端关闭后返回 b''
+        """
+        with self._cond:
+            while not self._chunks and not self.remote_closed and not self.closed:
+                self._cond.wait()
+            if not self._chunks:
+                return b''
+            compressed, data = self._chunks.popleft()
+
+        # 在读取该流的线程中解压，不占用隧道的读取线程
+        if compressed:
+            try:
+                if self.decompressor is None:
+                    raise ValueError("收到未协商的压缩数据")
+                data = self.decompressor.decompress(data)
+            except ValueError as e:
+                self.session.logger.warning(f"[流{self.stream_id}] {e}")
+                self.close()
+                return b''
+        elif self.decompressor is not None:
+            self.decompressor.passthrough(data)
+
+        with self._cond:
+            self._consumed += len(data)
+            # 消费过半窗口后归还，避免每个帧都发送一次 WINDOW
+            if self._consumed < self._window // 2:
+                return data
+            increment, self._consumed = self._consumed, 0
+
+        if not self.remote_closed:
+            self.session.send_frame(FRAME_WINDOW, self.stream_id, _WINDOW.pack(increment))
+        return data
+
+    def send(self, data):
+        """
+        发送全部数据，发送窗口用完时阻塞
+
+        Args:
+            data: bytes 或 memoryview
+
+        Raises:
+            ConnectionResetError: 流已关闭
+        """
+        view = memoryview(data)
+        while view:
+            with self._cond:
+                while self._send_window <= 0 and not self.remote_closed and not self.closed:
+                    self._cond.wait()
+                if self.remote_closed or self.closed:
+                    raise ConnectionResetError("隧道流已关闭")
+                n = min(len(view), self._send_window, MAX_FRAME_PAYLOAD)
+                self._send_window -= n
+            if self.compressor is not None:
+                payload, compressed = self.compressor.compress(view[:n])
+                frame_type = FRAME_DATA_COMPRESSED if compressed else FRAME_DATA
+            else:
+                payload, frame_type = view[:n], FRAME_DATA
+            self.session.send_frame(frame_type, self.stream_id, payload)
+            view = view[n:]
+
+    def close(self):
+        """关闭流，通知对端"""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            notify_peer = not self.remote_closed
+            self._cond.notify_all()
+        self.session.remove_stream(self.stream_id)
+        if notify_peer:
+            try:
+                self.session.send_frame(FRAME_CLOSE, self.stream_id)
+            except OSError:
+                pass
+
+    def wait_opened(self, timeout):
+        """
+        等待 OPEN 的结果（客户端）
+
+        Returns:
+            tuple: (REP, 绑定地址, 绑定端口)，超时或隧道断开时返回None
+        """
+        self._opened.wait(timeout)
+        return self.open_result
+
+    def _on_data(self, data, compressed=False):
+        with self._cond:
+            self._chunks.append((compressed, data))
+            self._cond.notify_all()
+
+    def _on_window(self, increment):
+        with self._cond:
+            self._send_window += increment
+            self._cond.notify_all()
+
+    def _on_remote_close(self):
+        with self._cond:
+            self.remote_closed = True
+            self._cond.notify_all()
+        self._opened.set()
+
+
+class MuxSession:
+    """一条多路复用隧道连接（客户端和服务端共用）"""
+
+    def __init__(self, sock, on_open=None, window=None, heartbeat_interval=None, logger=None,
+                 compression=None):
+        """
+        初始化隧道会话（sock 需已完成认证）
+
+        Args:
+            sock: 已连接的TCP socket
+            on_open: 服务端收到 OPEN 时的回调 on_open(stream, payload)，客户端为None
+            window: 每个流的初始发送窗口（字节，默认读取VPN_CONFIG）
+            heartbeat_interval: 心跳间隔（秒，默认读取VPN_CONFIG），连续3个间隔收不到数据视为断开
+            logger: 日志记录器
+            compression: 压缩方法名（默认读取VPN_CONFIG['tunnel_compression']），客户端为每个流请求的
+                         方法，服务端不为None时接受客户端请求的任一可用方法
+        """
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.on_open = on_open
+        self.window = window or VPN_CONFIG['tunnel_window']
+        self.heartbeat_interval = heartbeat_interval or VPN_CONFIG['heartbeat_interval']
+        self.logger = logger or Logger('MuxSession', 'vpn_tunnel')
+        if compression is None:
+            compression = VPN_CONFIG['tunnel_compression']
+        self.compression = resolve_method(compression, self.logger)
+
+        self.streams = {}
+        self._streams_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        # 客户端使用奇数流ID
+        self._next_id = 1
+        self.closed = False
+        self.last_received = time.monotonic()
+        self._stop = threading.Event()
+        # 读取线程收到PING后由心跳线程回复PONG：读取线程不能阻塞在发送上，
+        # 否则两端的发送缓冲区都满时两端的读取线程互相等待
+        self._pong_due = False
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """启动读取线程和心跳线程"""
+        for target, name in ((self._read_loop, 'mux-reader'), (self._heartbeat_loop, 'mux-heartbeat')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        """等待隧道关闭"""
+        for thread in self._threads:
+            thread.join()
+
+    def open_stream(self, addr, port, timeout):
+        """
+        打开一个新流并等待服务端连接目标（客户端）
+
+        Args:
+            addr: 目标地址
+            port: 目标端口
+            timeout: 等待服务端结果的时间（秒）
+
+        Returns:
+            tuple: (stream, (REP, 绑定地址, 绑定端口))，超时或隧道断开时结果为None
+        """
+        with self._streams_lock:
+            if self.closed:
+                raise ConnectionResetError("隧道已断开")
+            stream_id = self._next_id
+            self._next_id += 2
+            stream = MuxStream(self, stream_id, self.window)
+            self.streams[stream_id] = stream
+        payload = encode_address(addr, port)
+        if self.compression:
+            payload += bytes([self.compression])
+        self.send_frame(FRAME_OPEN, stream_id, payload)
+        return stream, stream.wait_opened(timeout)
+
+    def accept_open(self, stream, reply, bind_addr='0.0.0.0', bind_port=0):
+        """
+        回复 OPEN 的结果（服务端）
+
+        Args:
+            stream: 流
+            reply: SOCKS5响应代码
+            bind_addr: 连接目标时使用的本地地址
+            bind_port: 连接目标时使用的本地端口
+        """
+        payload = bytes([reply]) + encode_address(bind_addr, bind_port)
+        method = stream.requested_compression
+        if reply == 0 and self.compression and method and method_available(method):
+            # 先启用再回复，客户端收到结果后发来的压缩帧一定可以解压
+            stream.enable_compression(method)
+            payload += bytes([method])
+        self.send_frame(FRAME_OPEN_RESULT, stream.stream_id, payload)
+        if reply != 0:
+            self.remove_stream(stream.stream_id)
+
+    def send_frame(self, frame_type, stream_id, payload=b''):
+        """
+        发送一个帧（线程安全）
+
+        Raises:
+            OSError: 隧道连接已断开
+        """
+        frame = FRAME_HEADER.pack(frame_type, stream_id, len(payload)) + payload
+        with self._send_lock:
+            self.sock.sendall(frame)
+
+    def remove_stream(self, stream_id):
+        """从会话中移除流"""
+        with self._streams_lock:
+            self.streams.pop(stream_id, None)
+
+    def close(self):
+        """关闭隧道，所有流都视为对端已关闭"""
+        with self._streams_lock:
+            if self.closed:
+                return
+            self.closed = True
+            streams = list(self.streams.values())
+            self.streams.clear()
+        self._stop.set()
+        self._wake.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        for stream in streams:
+            stream._on_remote_close()
+        self.logger.info(f"隧道已关闭，断开 {len(streams)} 个流")
+
+    def _read_loop(self):
+        """读取线程：解析帧并分发给各个流"""
+        rfile = self.sock.makefile('rb')
+        try:
+            while True:
+                header = rfile.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                frame_type, stream_id, length = FRAME_HEADER.unpack(header)
+                payload = rfile.read(length) if length else b''
+                if len(payload) < length:
+                    break
+                self.last_received = time.monotonic()
+                self._dispatch(frame_type, stream_id, payload)
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            # 负载长度不足的 WINDOW、OPEN_RESULT 等帧也在这里关闭隧道
+            if not self.closed:
+                self.logger.warning(f"隧道读取异常: {e}")
+        finally:
+            rfile.close()
+            self.close()
+
+    def _dispatch(self, frame_type, stream_id, payload):
+        """处理收到的一个帧"""
+        if frame_type == FRAME_PING:
+            self._pong_due = True
+            self._wake.set()
+            return
+        if frame_type == FRAME_PONG:
+            return
+
+        with self._streams_lock:
+            stream = self.streams.get(stream_id)
+            if frame_type == FRAME_OPEN and stream is None and self.on_open:
+                stream = MuxStream(self, stream_id, self.window)
+                self.streams[stream_id] = stream
+            elif stream is None:
+                # 已关闭的流的迟到帧
+                return
+
+        if frame_type == FRAME_DATA:
+            stream._on_data(payload)
+        elif frame_type == FRAME_DATA_COMPRESSED:
+            stream._on_data(payload, True)
+        elif frame_type == FRAME_WINDOW:
+            stream._on_window(_WINDOW.unpack(payload)[0])
+        elif frame_type == FRAME_CLOSE:
+            stream._on_remote_close()
+            self.remove_stream(stream_id)
+        elif frame_type == FRAME_OPEN:
+            stream.requested_compression = _trailing_method(payload)
+            self.on_open(stream, payload)
+        elif frame_type == FRAME_OPEN_RESULT:
+            bind_addr, bind_port = decode_address(payload[1:])
+            stream.open_result = (payload[0], bind_addr, bind_port)
+            method = _trailing_method(payload[1:])
+            if payload[0] == 0 and method and method == self.compression:
+                stream.enable_compression(method)
+            if payload[0] != 0:
+                stream._on_remote_close()
+                self.remove_stream(stream_id)
+            stream._opened.set()
+
+    def _heartbeat_loop(self):
+        """心跳线程：定期发送PING并回复对端的PING，长时间收不到任何帧时关闭隧道"""
+        next_ping = time.monotonic() + self.heartbeat_interval
+        while True:
+            self._wake.wait(max(0.0, next_ping - time.monotonic()))
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                if self._pong_due:
+                    self._pong_due = False
+                    self.send_frame(FRAME_PONG, 0)
+                now = time.monotonic()
+                if now < next_ping:
+                    continue
+                next_ping = now + self.heartbeat_interval
+                if now - self.last_received > 3 * self.heartbeat_interval:
+                    self.logger.warning("隧道心跳超时")
+                    self.close()
+                    return
+                self.send_frame(FRAME_PING, 0)
+            except OSError:
+                self.close()
+                return
+
+
+def relay_stream(sock, stream, buffer_size=None, counts=None):
+    """
+    在socket和隧道流之间双向转发数据，任一方向结束即关闭两端
+
+    Args:
+        sock: 本地socket（客户端连接或目标连接）
+        stream: 隧道流
+        buffer_size: 读缓冲区大小（默认读取VPN_CONFIG）
+        counts: [socket -> 流, 流 -> socket] 字节数，转发时累加（可选，供转发过程中读取）
+
+    Returns:
+        tuple: (socket -> 流 的字节数, 流 -> socket 的字节数)
+    """
+    counts = counts if counts is not None else [0, 0]
+
+    def pump_up():
+        buf = bytearray(buffer_size or VPN_CONFIG['buffer_size'])
+        view = memoryview(buf)
+        try:
+            while True:
+                n = sock.recv_into(buf)
+                if not n:
+                    break
+                stream.send(view[:n])
+                counts[0] += n
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    thread = threading.Thread(target=pump_up, name='mux-pump', daemon=True)
+    thread.start()
+    try:
+        while True:
+            data = stream.recv()
+            if not data:
+                break
+            sock.sendall(data)
+            counts[1] += len(data)
+    except OSError:
+        pass
+    finally:
+        stream.close()
+        # shutdown 能唤醒阻塞在 recv_into 上的转发线程
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        thread.join()
+    return counts[0], counts[1]
+
+
+def client_handshake(sock, username, password, timeout):
+    """
+    客户端认证：接收随机数并回复认证摘要
+
+    Args:
+        sock: 已连接到服务端的socket
+        username: 用户名
+        password: 密码
+        timeout: 超时时间（秒）
+
+    Raises:
+        TunnelError: 认证失败
+        OSError: 连接异常
+    """
+    sock.settimeout(timeout)
+    frame_type, _, nonce = _read_frame(sock)
+    if frame_type != FRAME_HELLO or len(nonce) != NONCE_SIZE:
+        raise TunnelError("服务端握手数据无效")
+    name = username.encode('utf-8')
+    send_plain_frame(sock, FRAME_AUTH, bytes([len(name)]) + name + auth_digest(password, nonce))
+    frame_type, _, status = _read_frame(sock)
+    if frame_type != FRAME_AUTH_RESULT or status != b'\0':
+        raise TunnelError("隧道认证失败")
+    sock.settimeout(None)
+
+
+def server_handshake(sock, users, timeout):
+    """
+    服务端认证：发送随机数并校验客户端摘要
+
+    Args:
+        sock: 客户端连接
+        users: {用户名: 密码}
+        timeout: 超时时间（秒）
+
+    Returns:
+        str: 通过认证的用户名
+
+    Raises:
+        TunnelError: 认证失败
+        OSError: 连接异常
+    """
+    sock.settimeout(timeout)
+    nonce = os.urandom(NONCE_SIZE)
+    send_plain_frame(sock, FRAME_HELLO, nonce)
+    frame_type, _, payload = _read_frame(sock)
+    if frame_type != FRAME_AUTH or not payload:
+        raise TunnelError("客户端握手数据无效")
+    name_end = 1 + payload[0]
+    username = payload[1:name_end].decode('utf-8', 'replace')
+    digest = payload[name_end:]
+
+    ok = username in users and hmac.compare_digest(digest, auth_digest(users[username], nonce))
+    send_plain_frame(sock, FRAME_AUTH_RESULT, b'\0' if ok else b'\1')
+    if not ok:
+        raise TunnelError(f"用户认证失败: {username}")
+    sock.settimeout(None)
+    return username
+
+
+def send_plain_frame(sock, frame_type, payload=b''):
+    """在会话建立前直接发送一个帧"""
+    sock.sendall(FRAME_HEADER.pack(frame_type, 0, len(payload)) + payload)
+
+
+def _read_frame(sock):
+    """在会话建立前读取一个帧"""
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    frame_type, stream_id, length = FRAME_HEADER.unpack(header)
+    return frame_type, stream_id, _recv_exact(sock, length)
+
+
+def _recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise TunnelError("连接已关闭")
+        data += chunk
+    return data
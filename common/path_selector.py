@@ -0,0 +1,358 @@
+"""
+按目标学习直连还是经上游代理更快
+
+有的目标经校园网出口直连更快，有的经上游代理（upstream_proxy）更快。配置了
+上游代理后，每个目标有两条路径：
+
+    direct     直连（使用出口池/默认路由，与未配置上游代理时相同）
+    upstream   经上游SOCKS5代理（见 common/upstream_proxy.py）
+
+目标按域名（小写），或IP地址所在的 /24（IPv4）、/48（IPv6）网段归为一项，
+每项分别记录两条路径的建连耗时和首字节耗时（回复客户端到收到目标第一个字节）
+的指数加权平均。新连接选择两者之和较小的路径；一条路径还没有测量值时先试它，
+之后以 path_explore_ratio 的概率改走另一条路径作为探测，使过时的测量值得到
+更新。任一路径还没有首字节耗时时只比较建连耗时。
+
+经某条路径建连失败时按 FAILURE_PENALTY 秒的耗时计入该路径的平均值，并立即改用
+另一条路径（目标拒绝连接说明路径可用，不计入）。规则中的 route:<出口名> 固定
+直连，不参与选择。
+
+学习到的表按最近使用保留 path_table_size 项，停止时保存到 path_table_file，
+启动时加载。查看保存的表：
+
+    python -m common.path_selector [文件]
+"""
+
+import ipaddress
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from .config import SOCKS5_CONFIG, state_path
+from .dns_cache import is_ip_address
+from .logger import Logger
+from .upstream_proxy import UpstreamProxy
+
+DIRECT = 'direct'
+UPSTREAM = 'upstream'
+PATHS = (DIRECT, UPSTREAM)
+
+# 日志中的路径名
+PATH_NAMES = {DIRECT: '直连', UPSTREAM: '上游代理'}
+
+# 建连失败按此耗时（秒）计入平均值
+FAILURE_PENALTY = 10.0
+
+
+def destination_key(addr):
+    """
+    目标在路径表中的键
+
+    Args:
+        addr: 目标域名或IP地址
+
+    Returns:
+        str: 小写域名，或IP地址所在的 /24、/48 网段
+    """
+    family = is_ip_address(addr)
+    if family == socket.AF_INET:
+        return str(ipaddress.ip_network(f"{addr}/24", strict=False))
+    if family == socket.AF_INET6:
+        return str(ipaddress.ip_network(f"{addr}/48", strict=False))
+    return addr.lower().rstrip('.')
+
+
+def other_path(path):
+    """另一条路径"""
+    return UPSTREAM if path == DIRECT else DIRECT
+
+
+class PathStats:
+    """一个目标经一条路径的测量值"""
+
+    __slots__ = ('connect', 'first_byte', 'samples', 'failures', 'last_used')
+
+    def __init__(self, connect=None, first_byte=None, samples=0, failures=0, last_used=0.0):
+        self.connect = connect        # 建连耗时的指数加权平均（秒）
+        self.first_byte = first_byte  # 首字节耗时的指数加权平均（秒）
+        self.samples = samples
+        self.failures = failures
+        self.last_used = last_used    # 最近一次使用的时间（time.time()）
+
+    def to_list(self):
+        return [self.connect, self.first_byte, self.samples, self.failures, self.last_used]
+
+
+def _ewma(average, value, alpha):
+    return value if average is None else average + alpha * (value - average)
+
+
+class PathSelector:
+    """按目标选择直连或上游代理，并从每次连接的耗时中学习（线程安全）"""
+
+    def __init__(self, upstream=None, alpha=None, explore_ratio=None, max_entries=None, table_file=None,
+                 logger=None):
+        """
+        初始化路径选择器（参数为None时读取SOCKS5_CONFIG）
+
+        Args:
+            upstream: 上游代理 UpstreamProxy 或其地址
+            alpha: 指数加权平均中新测量值的权重
+            explore_ratio: 不选较快路径、改走另一条路径探测的概率
+            max_entries: 路径表最多保留的目标数
+            table_file: 路径表的持久化文件（相对于SOCKS5_CONFIG['state_dir']，空字符串表示不持久化）
+            logger: 日志记录器
+
+        Raises:
+            ValueError: 上游代理地址格式错误
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        upstream = pick(upstream, 'upstream_proxy')
+        self.upstream = upstream if isinstance(upstream, UpstreamProxy) else UpstreamProxy(upstream)
+        self.alpha = pick(alpha, 'path_ewma_alpha')
+        self.explore_ratio = pick(explore_ratio, 'path_explore_ratio')
+        self.max_entries = pick(max_entries, 'path_table_size')
+        self.table_file = state_path(pick(table_file, 'path_table_file'))
+        self.logger = logger or Logger('PathSelector', 'socks5_proxy')
+
+        # 目标 -> {路径: PathStats}，按最近使用排序
+        self._table = OrderedDict()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.stats = {'choices_direct': 0, 'choices_upstream': 0, 'explorations': 0, 'failures': 0}
+
+    def _entry(self, key):
+        """取出（必要时创建）目标的测量值并移到最近使用的位置（调用方持有锁）"""
+        entry = self._table.get(key)
+        if entry is None:
+            entry = self._table[key] = {path: PathStats() for path in PATHS}
+            while len(self._table) > self.max_entries:
+                self._table.popitem(last=False)
+        else:
+            self._table.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def _score(stats, with_first_byte):
+        """路径的预计耗时（秒）"""
+        if with_first_byte:
+            return stats.connect + stats.first_byte
+        return stats.connect
+
+    def choose(self, key):
+        """
+        为一个新连接选择路径
+
+        Args:
+            key: 目标的键（destination_key()）
+
+        Returns:
+            str: DIRECT 或 UPSTREAM
+        """
+        with self._lock:
+            entry = self._entry(key)
+            unmeasured = [path for path in PATHS if entry[path].connect is None]
+            if unmeasured:
+                path = unmeasured[0]
+            else:
+                with_first_byte = all(entry[p].first_byte is not None for p in PATHS)
+                path = min(PATHS, key=lambda p: self._score(entry[p], with_first_byte))
+                if self._random.random() < self.explore_ratio:
+                    path = other_path(path)
+                    self.stats['explorations'] += 1
+            entry[path].last_used = time.time()
+            self.stats[f'choices_{path}'] += 1
+            return path
+
+    def record_connect(self, key, path, elapsed):
+        """
+        记录一次建连成功
+
+        Args:
+            key: 目标的键
+            path: 路径
+            elapsed: 建连耗时（秒）
+        """
+        with self._lock:
+            stats = self._entry(key)[path]
+            stats.connect = _ewma(stats.connect, elapsed, self.alpha)
+            stats.samples += 1
+
+    def record_failure(self, key, path):
+        """记录一次建连失败（按 FAILURE_PENALTY 计入建连耗时）"""
+        with self._lock:
+            stats = self._entry(key)[path]
+            stats.connect = _ewma(stats.connect, FAILURE_PENALTY, self.alpha)
+            stats.failures += 1
+            self.stats['failures'] += 1
+
+    def record_first_byte(self, key, path, elapsed):
+        """
+        记录从回复客户端到收到目标第一个字节的耗时
+
+        Args:
+            key: 目标的键
+            path: 路径
+            elapsed: 耗时（秒）
+        """
+        with self._lock:
+            entry = self._table.get(key)
+            if entry is not None:
+                stats = entry[path]
+                stats.first_byte = _ewma(stats.first_byte, elapsed, self.alpha)
+
+    def table(self, limit=None):
+        """
+        查看路径表
+
+        Args:
+            limit: 最多返回的目标数（最近使用的优先，默认全部）
+
+        Returns:
+            dict: 目标 -> {路径: {'connect_ms', 'first_byte_ms', 'samples', 'failures'}, 'preferred': 路径}
+        """
+        with self._lock:
+            items = list(self._table.items())
+        items.reverse()
+        if limit is not None:
+            items = items[:limit]
+        return {key: describe_entry(entry) for key, entry in items}
+
+    def get_stats(self):
+        """
+        获取选择器统计信息
+
+        Returns:
+            dict: 上游代理、目标数、各路径的选择次数、探测次数、建连失败次数和各路径较快的目标数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._table)
+            preferred = [describe_entry(entry)['preferred'] for entry in self._table.values()]
+        stats['upstream'] = self.upstream.name
+        stats['preferred_direct'] = preferred.count(DIRECT)
+        stats['preferred_upstream'] = preferred.count(UPSTREAM)
+        return stats
+
+    def load(self):
+        """
+        从文件加载路径表
+
+        Returns:
+            int: 加载的目标数
+        """
+        if not self.table_file or not os.path.exists(self.table_file):
+            return 0
+        try:
+            data = load_table(self.table_file)
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"加载路径表失败: {e}")
+            return 0
+        with self._lock:
+            for key, entry in data.items():
+                self._table[key] = entry
+                self._table.move_to_end(key)
+            while len(self._table) > self.max_entries:
+                self._table.popitem(last=False)
+            loaded = len(self._table)
+        self.logger.info(f"已加载 {loaded} 个目标的路径测量值")
+        return loaded
+
+    def save(self):
+        """
+        把路径表保存到文件（按最近使用排序）
+
+        Returns:
+            bool: 是否成功
+        """
+        if not self.table_file:
+            return False
+        with self._lock:
+            data = {key: {path: stats.to_list() for path, stats in entry.items()} for key, entry in self._table.items()}
+        try:
+            directory = os.path.dirname(self.table_file)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = f"{self.table_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.table_file)
+            return True
+        except OSError as e:
+            self.logger.warning(f"保存路径表失败: {e}")
+            return False
+
+
+def describe_entry(entry):
+    """
+    一个目标的测量值（毫秒）及当前较快的路径
+
+    Returns:
+        dict: {路径: {'connect_ms', 'first_byte_ms', 'samples', 'failures'}, 'preferred': 路径或None}
+    """
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    result = {
+        path: {
+            'connect_ms': ms(stats.connect),
+            'first_byte_ms': ms(stats.first_byte),
+            'samples': stats.samples,
+            'failures': stats.failures,
+        }
+        for path, stats in entry.items()
+    }
+    preferred = None
+    if all(entry[p].connect is not None for p in PATHS):
+        with_first_byte = all(entry[p].first_byte is not None for p in PATHS)
+        preferred = min(PATHS, key=lambda p: PathSelector._score(entry[p], with_first_byte))
+    result['preferred'] = preferred
+    return result
+
+
+def load_table(path):
+    """
+    读取保存的路径表
+
+    Returns:
+        OrderedDict: 目标 -> {路径: PathStats}，按最近使用排序
+
+    Raises:
+        OSError、ValueError: 文件无法读取或格式错误
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return OrderedDict(
+        (key, {p: PathStats(*entry[p]) if p in entry else PathStats() for p in PATHS})
+        for key, entry in data.items()
+    )
+
+
+def load_path_selector(logger=None):
+    """
+    按配置创建路径选择器
+
+    Returns:
+        PathSelector: 未配置 upstream_proxy 时返回None
+    """
+    if not SOCKS5_CONFIG['upstream_proxy']:
+        return None
+    return PathSelector(logger=logger)
+
+
+# 查看保存的路径表
+if __name__ == '__main__':
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else state_path(SOCKS5_CONFIG['path_table_file'])
+    table = load_table(path)
+    print(f"{'目标':<36}{'较快':>10}{'直连建连/首字节(ms)':>24}{'上游建连/首字节(ms)':>24}")
+    for key, entry in reversed(table.items()):
+        d = describe_entry(entry)
+        cells = [f"{d[p]['connect_ms'] or '-'}/{d[p]['first_byte_ms'] or '-'} ({d[p]['samples']}次)" for p in PATHS]
+        print(f"{key:<36}{d['preferred'] or '-':>10}{cells[0]:>24}{cells[1]:>24}")
@@ -0,0 +1,211 @@
+"""
+SOCKS5 代理服务器 - 多进程预派生模式
+
+每个工作进程都用 SO_REUSEPORT 绑定同一端口，由内核在进程间分摊新连接，
+从而绕开GIL，让转发吞吐量随CPU核数扩展。主进程只负责监控：工作进程退出后
+自动重启，并汇总各进程的连接数和流量统计。
+
+配置了Unix域监听时由主进程创建socket文件，工作进程共用继承的监听socket。
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+from .unix_listener import load_unix_listener
+
+# 共享统计数组中每个工作进程占用的槽位
+STAT_FIELDS = ('connections', 'bytes_up', 'bytes_down')
+
+
+def reuse_port_available():
+    """
+    检查当前系统是否支持 SO_REUSEPORT
+
+    Returns:
+        bool: 是否可用
+    """
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def _worker_main(index, host, port, options, stats):
+    """
+    工作进程入口，收到SIGTERM后退出
+
+    Args:
+        index: 工作进程序号
+        host: 监听地址
+        port: 监听端口
+        options: 传递给 Socks5ProxyServer 的参数
+        stats: 共享统计数组
+    """
+    from .socks5_proxy import Socks5ProxyServer
+
+    # Ctrl+C 由主进程统一处理，主进程通过SIGTERM通知工作进程退出
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    # 各工作进程的指标相互独立，不在同一端口上重复提供
+    options.setdefault('metrics_port', 0)
+    # 不支持SO_REUSEPORT时只有这一个工作进程（见 PreforkSocks5Server.__init__）
+    server = Socks5ProxyServer(host, port, reuse_port=reuse_port_available(), **options)
+    server_thread = threading.Thread(target=server.start, daemon=True)
+    server_thread.start()
+
+    # 重启后的进程在原有计数的基础上继续累加
+    offset = index * len(STAT_FIELDS)
+    base = [stats[offset + i] for i in range(len(STAT_FIELDS))]
+    parent_pid = os.getppid()
+
+    while not stop_event.is_set() and server_thread.is_alive():
+        stop_event.wait(1.0)
+        if os.getppid() != parent_pid:
+            # 主进程已意外退出，不再继续占用端口
+            break
+        with server._stats_lock:
+            current = [server.stats[field] for field in STAT_FIELDS]
+        for i, value in enumerate(current):
+            stats[offset + i] = base[i] + value
+
+    server.stop()
+
+
+class PreforkSocks5Server:
+    """SOCKS5代理服务器（多进程 SO_REUSEPORT 版）"""
+
+    def __init__(self, host='0.0.0.0', port=1080, workers=None, **options):
+        """
+        初始化多进程代理服务器
+
+        Args:
+            host: 监听地址
+            port: 监听端口
+            workers: 工作进程数（默认读取SOCKS5_CONFIG，0表示CPU核数）
+            **options: 传递给每个工作进程中 Socks5ProxyServer 的参数
+                       （relay_mode、backlog、accept_batch等）
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or SOCKS5_CONFIG['workers'] or os.cpu_count() or 1
+        self.logger = Logger('Socks5ProxyServer', 'socks5_proxy')
+        if self.workers > 1 and not reuse_port_available():
+            # 在分配统计数组和进程列表之前确定进程数
+            self.logger.warning("当前系统不支持SO_REUSEPORT，退化为单进程模式")
+            self.workers = 1
+        unix_listener = options.pop('unix_listener', None)
+        self.unix_listener = load_unix_listener(self.logger) if unix_listener is None else unix_listener or None
+        # 工作进程不再各自创建Unix域监听
+        options['unix_listener'] = self.unix_listener or False
+        self.options = options
+        self.running = False
+        self.restarts = 0
+
+        # 不使用multiprocessing.Event：工作进程被SIGKILL时可能持有其内部锁
+        self._stop_event = threading.Event()
+        self._stats = multiprocessing.Array('Q', self.workers * len(STAT_FIELDS), lock=False)
+        self._processes = [None] * self.workers
+
+    def start(self, check_interval=1.0):
+        """
+        启动所有工作进程并监控（阻塞直到 stop() 被调用）
+
+        Args:
+            check_interval: 检查工作进程存活的间隔（秒）
+        """
+        self.running = True
+        self.logger.info(f"SOCKS5代理服务器启动(多进程x{self.workers}): {self.host}:{self.port}")
+
+        try:
+            if self.unix_listener:
+                self.unix_listener.open(self.options.get('backlog'))
+            for index in range(self.workers):
+                self._spawn(index)
+
+            while self.running:
+                self._stop_event.wait(check_interval)
+                if self._stop_event.is_set():
+                    break
+                for index, proc in enumerate(self._processes):
+                    if not proc.is_alive():
+                        self.logger.warning(f"工作进程 #{index} (pid={proc.pid}) 已退出，"
+                                            f"退出码 {proc.exitcode}，正在重启")
+                        self.restarts += 1
+                        self._spawn(index)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _spawn(self, index):
+        """
+        启动（或重启）指定序号的工作进程
+
+        Args:
+            index: 工作进程序号
+        """
+        proc = multiprocessing.Process(
+            target=_worker_main,
+            args=(index, self.host, self.port, self.options, self._stats),
+            name=f"socks5-worker-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self._processes[index] = proc
+        self.logger.debug(f"工作进程 #{index} 已启动 (pid={proc.pid})")
+
+    def stop(self, timeout=5):
+        """
+        停止所有工作进程
+
+        Args:
+            timeout: 等待每个工作进程退出的时间（秒）
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._stop_event.set()
+
+        for proc in self._processes:
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+        for proc in self._processes:
+            if proc is None:
+                continue
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+                proc.join(timeout)
+        if self.unix_listener:
+            self.unix_listener.close()
+        self.logger.info("SOCKS5代理服务器已停止")
+
+    def get_stats(self):
+        """
+        汇总所有工作进程的统计信息
+
+        Returns:
+            dict: connections / bytes_up / bytes_down / workers / restarts
+        """
+        totals = dict.fromkeys(STAT_FIELDS, 0)
+        for index in range(self.workers):
+            offset = index * len(STAT_FIELDS)
+            for i, field in enumerate(STAT_FIELDS):
+                totals[field] += self._stats[offset + i]
+
+        totals['workers'] = sum(1 for proc in self._processes if proc is not None and proc.is_alive())
+        totals['restarts'] = self.restarts
+        return totals
+
+
+# 用于测试的独立运行
+if __name__ == '__main__':
+    import sys
+
+    listen_port = int(sys.argv[1]) if len(sys.argv) > 1 else 1080
+    worker_count = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    PreforkSocks5Server(port=listen_port, workers=worker_count).start()
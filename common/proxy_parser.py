@@ -0,0 +1,296 @@
+"""
+SOCKS4/4a 和 HTTP 代理请求的增量解析
+
+与 socks5_parser 相同，解析函数只处理已收到的字节，不做任何I/O：数据不完整时
+返回None，格式错误时抛出 ProtocolError。同一个监听端口上按连接的第一个字节
+区分协议（sniff_protocol）：
+
+    0x05         SOCKS5
+    0x04         SOCKS4 / SOCKS4a
+    'A'-'Z'      HTTP代理（CONNECT 隧道，或 GET http://host/path 等绝对URI请求）
+
+绝对URI请求改写为普通请求后转发给目标（去掉 Proxy-* 头，并加上
+Connection: close，使每个连接只转发一个请求，之后的请求由客户端重新连接，
+不会被发往上一个请求的目标）。
+
+响应统一使用SOCKS5的响应代码，由 socks4_reply() / http_reply() 转换为对应协议的回复。
+"""
+
+import base64
+import binascii
+import socket
+import struct
+from .socks5_parser import SOCKS_VERSION, ProtocolError
+
+SOCKS4_VERSION = 4
+
+# SOCKS4 命令
+SOCKS4_CMD_CONNECT = 1
+
+# SOCKS4 响应代码
+SOCKS4_GRANTED = 90
+SOCKS4_REJECTED = 91
+
+# USERID 和 SOCKS4a 域名的最大长度
+MAX_SOCKS4_FIELD = 255
+
+# HTTP请求头的最大长度（字节）
+MAX_HTTP_HEAD = 16 * 1024
+
+# 与 Socks5ProxyHandler 的响应代码一致
+REP_SUCCESS = 0
+REP_ADDRESS_TYPE_NOT_SUPPORTED = 8
+
+# SOCKS5响应代码 -> HTTP状态
+HTTP_STATUS = {
+    0: (200, 'Connection established'),
+    1: (502, 'Bad Gateway'),             # 一般错误
+    2: (403, 'Forbidden'),               # 规则不允许
+    3: (502, 'Bad Gateway'),             # 网络不可达
+    4: (502, 'Bad Gateway'),             # 主机不可达
+    5: (502, 'Bad Gateway'),             # 拒绝连接
+    6: (504, 'Gateway Timeout'),         # 超时
+    7: (405, 'Method Not Allowed'),      # 命令不支持
+    8: (400, 'Bad Request'),             # 地址错误
+}
+
+# 转发绝对URI请求时去掉的逐跳头（另外还去掉 Connection 头中列出的头，RFC 7230 第6.1节）
+HOP_BY_HOP_HEADERS = {'proxy-authorization', 'proxy-connection', 'connection', 'keep-alive'}
+
+# 即使在 Connection 头中列出也不去掉的头：请求体原样转发，去掉它们会使目标错判请求体的长度
+FRAMING_HEADERS = {'content-length', 'transfer-encoding'}
+
+PROTOCOL_NAMES = {'socks5': 'SOCKS5', 'socks4': 'SOCKS4', 'http': 'HTTP'}
+
+
+def sniff_protocol(first_byte):
+    """
+    按连接的第一个字节识别协议
+
+    Args:
+        first_byte: 第一个字节（int）
+
+    Returns:
+        str: 'socks5'、'socks4' 或 'http'，无法识别时返回None
+    """
+    if first_byte == SOCKS_VERSION:
+        return 'socks5'
+    if first_byte == SOCKS4_VERSION:
+        return 'socks4'
+    if 0x41 <= first_byte <= 0x5A:
+        # HTTP方法名均为大写字母
+        return 'http'
+    return None
+
+
+def parse_socks4_request(buf):
+    """
+    解析SOCKS4/4a请求: VN | CD | DSTPORT | DSTIP | USERID | NUL [| 域名 | NUL]
+
+    DSTIP 为 0.0.0.x（x 不为0）时为SOCKS4a，目标为 USERID 之后的域名。
+
+    Args:
+        buf: 已收到的数据
+
+    Returns:
+        tuple: (命令, 目标地址, 目标端口, USERID, 消耗的字节数)，数据不完整时返回None
+
+    Raises:
+        ProtocolError: 版本错误、字段过长或域名为空
+    """
+    if len(buf) < 8:
+        return None
+    if buf[0] != SOCKS4_VERSION:
+        raise ProtocolError(f"不支持的SOCKS版本: {buf[0]}")
+    cmd = buf[1]
+    port = struct.unpack_from('!H', buf, 2)[0]
+    ip = bytes(buf[4:8])
+
+    end = _find_nul(buf, 8)
+    if end is None:
+        return None
+    userid = bytes(buf[8:end]).decode('utf-8', 'replace')
+    end += 1
+
+    if ip[:3] == b'\0\0\0' and ip[3]:
+        domain_end = _find_nul(buf, end)
+        if domain_end is None:
+            return None
+        try:
+            addr = bytes(buf[end:domain_end]).decode('utf-8')
+        except UnicodeDecodeError:
+            raise ProtocolError("域名不是有效的UTF-8", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        if not addr:
+            raise ProtocolError("域名为空", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        end = domain_end + 1
+    else:
+        addr = socket.inet_ntoa(ip)
+    return cmd, addr, port, userid, end
+
+
+def _find_nul(buf, start):
+    """查找 start 之后的NUL结束符，数据不完整时返回None"""
+    nul = buf.find(b'\0', start, start + MAX_SOCKS4_FIELD + 1)
+    if nul >= 0:
+        return nul
+    if len(buf) > start + MAX_SOCKS4_FIELD:
+        raise ProtocolError("SOCKS4字段过长")
+    return None
+
+
+def parse_http_request(buf):
+    """
+    解析HTTP代理请求的请求行和请求头
+
+    Args:
+        buf: 已收到的数据
+
+    Returns:
+        tuple: (方法, 目标地址, 目标端口, 转发给目标的请求头, 认证信息, 消耗的字节数)，
+               CONNECT 请求的转发请求头为None；认证信息为 Proxy-Authorization 中的
+               (用户名, 密码)，没有或格式错误时为None。数据不完整时返回None
+
+    Raises:
+        ProtocolError: 请求格式错误、请求头过长或不是代理请求
+    """
+    end = buf.find(b'\r\n\r\n', 0, MAX_HTTP_HEAD)
+    if end < 0:
+        if len(buf) >= MAX_HTTP_HEAD:
+            raise ProtocolError("HTTP请求头过长", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        return None
+    lines = bytes(buf[:end]).decode('latin-1').split('\r\n')
+
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise ProtocolError("HTTP请求行格式错误", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+    method, target, version = parts
+
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep or not name or name != name.strip():
+            raise ProtocolError("HTTP请求头格式错误", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        headers.append((name, value.strip()))
+
+    auth = None
+    for name, value in headers:
+        if name.lower() == 'proxy-authorization':
+            auth = _parse_basic_auth(value)
+
+    if method == 'CONNECT':
+        host, port = _split_host_port(target, None)
+        return method, host, port, None, auth, end + 4
+
+    if not target.lower().startswith('http://'):
+        raise ProtocolError(f"不是代理请求: {method} {target[:64]}", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+    rest = target[7:]
+    cut = min((i for i in (rest.find('/'), rest.find('?')) if i >= 0), default=len(rest))
+    authority, path = rest[:cut], rest[cut:]
+    if not path.startswith('/'):
+        path = '/' + path
+    authority = authority.rpartition('@')[2]
+    host, port = _split_host_port(authority, 80)
+
+    dropped = set(HOP_BY_HOP_HEADERS)
+    for name, value in headers:
+        if name.lower() == 'connection':
+            dropped.update(token.strip().lower() for token in value.split(','))
+    dropped -= FRAMING_HEADERS
+
+    forwarded = [f"{method} {path} {version}"]
+    has_host = False
+    for name, value in headers:
+        lower = name.lower()
+        if lower in dropped:
+            continue
+        has_host = has_host or lower == 'host'
+        forwarded.append(f"{name}: {value}")
+    if not has_host:
+        forwarded.insert(1, f"Host: {authority}")
+    forwarded.append('Connection: close')
+    head = ('\r\n'.join(forwarded) + '\r\n\r\n').encode('latin-1')
+    return method, host, port, head, auth, end + 4
+
+
+def _split_host_port(authority, default_port):
+    """
+    拆分 host[:port]，IPv6地址带方括号
+
+    Raises:
+        ProtocolError: 格式错误或缺少端口（default_port 为None时）
+    """
+    if authority.startswith('['):
+        host, sep, rest = authority[1:].partition(']')
+        if not sep:
+            raise ProtocolError(f"目标地址格式错误: {authority[:64]}", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        port = rest[1:] if rest.startswith(':') else ''
+        if rest and not rest.startswith(':'):
+            raise ProtocolError(f"目标地址格式错误: {authority[:64]}", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+    else:
+        host, _, port = authority.partition(':')
+    if not port and default_port is not None:
+        port = str(default_port)
+    if not host or not (port.isascii() and port.isdigit()) or not 0 < int(port) < 65536:
+        raise ProtocolError(f"目标地址格式错误: {authority[:64]}", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+    return host, int(port)
+
+
+def _parse_basic_auth(value):
+    """解析 'Basic base64(用户名:密码)'，格式错误时返回None"""
+    scheme, _, token = value.partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(token.strip(), validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    username, sep, password = decoded.partition(':')
+    if not sep:
+        return None
+    return username, password
+
+
+def socks4_reply(reply, bind_addr='0.0.0.0', bind_port=0):
+    """
+    生成SOCKS4响应: VN(0) | CD | DSTPORT | DSTIP
+
+    Args:
+        reply: SOCKS5响应代码（0为成功，其余均为拒绝）
+        bind_addr: 绑定地址（IPv6地址时填0）
+        bind_port: 绑定端口
+
+    Returns:
+        bytes: 8字节响应
+    """
+    ip = socket.inet_aton(bind_addr) if ':' not in bind_addr else b'\0\0\0\0'
+    return struct.pack('!BBH4s', 0, SOCKS4_GRANTED if reply == REP_SUCCESS else SOCKS4_REJECTED, bind_port, ip)
+
+
+def http_reply(reply):
+    """
+    生成HTTP代理的响应
+
+    Args:
+        reply: SOCKS5响应代码
+
+    Returns:
+        bytes: 状态行和响应头（失败的响应不带正文，并关闭连接）
+    """
+    status, reason = HTTP_STATUS.get(reply, (502, 'Bad Gateway'))
+    if status == 200:
+        return f"HTTP/1.1 200 {reason}\r\n\r\n".encode('latin-1')
+    return f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode('latin-1')
+
+
+def http_auth_required(realm='proxy'):
+    """
+    生成要求代理认证的 407 响应
+
+    Returns:
+        bytes: 响应
+    """
+    return (
+        f"HTTP/1.1 407 Proxy Authentication Required\r\n"
+        f"Proxy-Authenticate: Basic realm=\"{realm}\"\r\n"
+        f"Content-Length: 0\r\nConnection: close\r\n\r\n"
+    ).encode('latin-1')
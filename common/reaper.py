@@ -0,0 +1,298 @@
+"""
+空闲连接回收
+
+所有连接的超时由一个哈希时间轮统一管理，而不是每个连接各自计时：
+
+    握手超时   接受连接后在 handshake_timeout 秒内没有完成握手和请求（进入转发阶段）
+    空闲超时   转发阶段连续 idle_timeout 秒没有任何方向的数据
+
+转发路径上不做任何额外操作：时间轮定期检查连接已转发的字节数是否变化，
+没有变化的时间超过空闲超时即关闭连接（每个超时周期检查 CHECKS_PER_TIMEOUT 次，
+连接在空闲 idle_timeout 到 idle_timeout * (1 + 1/CHECKS_PER_TIMEOUT) 秒之间被回收）。
+
+对端断电或网络中断时连接上没有任何数据，需要配合TCP保活探测（见 tcp_tuning 中
+各调优配置的 keepalive）才能在空闲超时之前发现。
+"""
+
+import asyncio
+import math
+import threading
+import time
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+# 每个空闲超时周期内检查转发进度的次数
+CHECKS_PER_TIMEOUT = 4
+
+
+class Timer:
+    """时间轮中的一个定时器"""
+
+    __slots__ = ('deadline', 'callback', 'cancelled')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        """取消定时器（惰性删除，到期扫描时丢弃）"""
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    哈希时间轮（线程安全）
+
+    定时器按到期的刻度放入 slots 个槽中的一个，到期时间超过一圈的定时器留在
+    槽中等待之后的轮次。添加和取消为O(1)，每个刻度只扫描一个槽。
+    """
+
+    def __init__(self, tick=1.0, slots=512):
+        """
+        Args:
+            tick: 刻度长度（秒），也是定时器的精度
+            slots: 槽数
+        """
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._origin = time.monotonic()
+        # 已经处理过的最后一个刻度
+        self._current = 0
+        self._lock = threading.Lock()
+
+    def schedule(self, delay, callback):
+        """
+        添加定时器
+
+        Args:
+            delay: 延迟（秒），向上取整到刻度
+            callback: 到期时调用的无参函数（在推进时间轮的线程中执行）
+
+        Returns:
+            Timer: 可用于取消的定时器
+        """
+        ticks = max(1, math.ceil(delay / self.tick))
+        with self._lock:
+            deadline = self._current + ticks
+            timer = Timer(deadline, callback)
+            self._slots[deadline % len(self._slots)].append(timer)
+        return timer
+
+    def advance(self, now=None):
+        """
+        推进到当前时间，执行所有到期的定时器
+
+        Args:
+            now: 当前时间（time.monotonic()，默认取当前值）
+
+        Returns:
+            int: 执行的定时器数
+        """
+        now = time.monotonic() if now is None else now
+        target = int((now - self._origin) / self.tick)
+        due = []
+        with self._lock:
+            while self._current < target:
+                self._current += 1
+                slot = self._slots[self._current % len(self._slots)]
+                if not slot:
+                    continue
+                pending = []
+                for timer in slot:
+                    if timer.cancelled:
+                        continue
+                    if timer.deadline <= self._current:
+                        due.append(timer)
+                    else:
+                        pending.append(timer)
+                slot[:] = pending
+        for timer in due:
+            timer.callback()
+        return len(due)
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for slot in self._slots for timer in slot if not timer.cancelled)
+
+
+class ReapEntry:
+    """被回收器跟踪的一个连接"""
+
+    __slots__ = ('reaper', 'close', 'progress', 'created_at', 'idle_since', 'last_progress',
+                 'is_established', 'finished', 'timer')
+
+    def __init__(self, reaper, close, progress):
+        self.reaper = reaper
+        self.close = close
+        self.progress = progress
+        self.created_at = time.monotonic()
+        self.idle_since = self.created_at
+        self.last_progress = None
+        self.is_established = False
+        self.finished = False
+        self.timer = None
+
+    def established(self):
+        """连接进入转发阶段，取消握手超时，之后按空闲超时检查"""
+        self.idle_since = time.monotonic()
+        self.last_progress = self.progress()
+        self.is_established = True
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.reaper.idle_timeout and not self.finished:
+            self.reaper._schedule(self, self.reaper.idle_timeout / CHECKS_PER_TIMEOUT)
+
+    def done(self):
+        """连接已结束，不再检查"""
+        self.finished = True
+        if self.timer is not None:
+            self.timer.cancel()
+
+
+class IdleReaper:
+    """按握手超时和空闲超时关闭连接，并统计回收的连接数"""
+
+    def __init__(self, idle_timeout=None, handshake_timeout=None, tick=None, logger=None):
+        """
+        初始化回收器（参数为None时读取SOCKS5_CONFIG，超时为0表示不检查）
+
+        Args:
+            idle_timeout: 空闲超时（秒）
+            handshake_timeout: 握手超时（秒）
+            tick: 时间轮刻度（秒）
+            logger: 日志记录器
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.idle_timeout = pick(idle_timeout, 'idle_timeout')
+        self.handshake_timeout = pick(handshake_timeout, 'handshake_timeout')
+        self.wheel = TimerWheel(tick=pick(tick, 'reaper_tick'))
+        self.logger = logger or Logger('IdleReaper', 'socks5_proxy')
+        self.running = False
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {'tracked': 0, 'reaped_idle': 0, 'reaped_handshake': 0}
+
+    def track(self, close, progress):
+        """
+        开始跟踪一个刚接受的连接
+
+        Args:
+            close: 关闭连接的无参函数（在时间轮线程中调用，需要能唤醒阻塞在该连接上的读写）
+            progress: 返回已转发字节总数的无参函数
+
+        Returns:
+            ReapEntry: 连接进入转发阶段时调用 established()，结束时调用 done()
+        """
+        entry = ReapEntry(self, close, progress)
+        with self._lock:
+            self.stats['tracked'] += 1
+        if self.handshake_timeout:
+            self._schedule(entry, self.handshake_timeout)
+        elif self.idle_timeout:
+            self._schedule(entry, self.idle_timeout / CHECKS_PER_TIMEOUT)
+        return entry
+
+    def _schedule(self, entry, delay):
+        entry.timer = self.wheel.schedule(delay, lambda: self._check(entry))
+
+    def _check(self, entry):
+        """定时器到期：判断连接是否超时，未超时则安排下一次检查"""
+        if entry.finished:
+            return
+        now = time.monotonic()
+
+        if not entry.is_established:
+            if not self.handshake_timeout:
+                self._schedule(entry, self.idle_timeout / CHECKS_PER_TIMEOUT)
+                return
+            remaining = entry.created_at + self.handshake_timeout - now
+            if remaining > 0:
+                self._schedule(entry, remaining)
+            else:
+                self._reap(entry, 'reaped_handshake')
+            return
+
+        if not self.idle_timeout:
+            return
+        progress = entry.progress()
+        if progress != entry.last_progress:
+            entry.last_progress = progress
+            entry.idle_since = now
+        if now - entry.idle_since >= self.idle_timeout:
+            self._reap(entry, 'reaped_idle')
+        else:
+            self._schedule(entry, self.idle_timeout / CHECKS_PER_TIMEOUT)
+
+    def _reap(self, entry, reason):
+        entry.finished = True
+        with self._lock:
+            self.stats[reason] += 1
+        try:
+            entry.close()
+        except Exception as e:
+            self.logger.error(f"回收连接异常: {e}")
+
+    def start(self):
+        """在后台线程中推进时间轮（线程模式）"""
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='idle-reaper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.wheel.tick):
+            try:
+                self.wheel.advance()
+            except Exception as e:
+                self.logger.error(f"时间轮推进异常: {e}")
+
+    async def run(self):
+        """在当前事件循环中推进时间轮（asyncio模式，取消任务即停止）"""
+        self.running = True
+        try:
+            while True:
+                await asyncio.sleep(self.wheel.tick)
+                try:
+                    self.wheel.advance()
+                except Exception as e:
+                    self.logger.error(f"时间轮推进异常: {e}")
+        finally:
+            self.running = False
+
+    def stop(self):
+        """停止后台线程"""
+        self.running = False
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def get_stats(self):
+        """
+        获取回收统计
+
+        Returns:
+            dict: 跟踪过的连接数、因空闲/握手超时回收的连接数、当前定时器数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats['timers'] = len(self.wheel)
+        return stats
+
+
+def create_reaper(logger=None):
+    """
+    按配置创建回收器
+
+    Returns:
+        IdleReaper: 空闲超时和握手超时都为0时返回None
+    """
+    if not SOCKS5_CONFIG['idle_timeout'] and not SOCKS5_CONFIG['handshake_timeout']:
+        return None
+    return IdleReaper(logger=logger)
@@ -0,0 +1,544 @@
+"""
+目标地址规则：允许、拒绝或改走指定出口
+
+规则文件每行一条，# 开头为注释：
+
+    deny    cidr           10.0.0.0/8
+    deny    cidr           fd00::/8
+    deny    port           25,465
+    allow   cidr           192.168.1.0/24  ports 80,443
+    deny    domain-suffix  ads.example.com
+    route:campus  domain-suffix  edu.cn
+    allow   domain         www.example.com
+    default allow
+
+动作为 allow、deny 或 route:<出口名>（出口在 SOCKS5_CONFIG['outbounds'] 中定义，
+direct 表示直接连接）。匹配顺序：
+
+    1. port 规则（只按端口匹配，按文件顺序）
+    2. 目标为域名时的域名规则：完全匹配优先，其次是最长的后缀
+    3. 目标为IP（或域名解析后的每个地址）时的CIDR规则：最长前缀优先
+    4. default（未指定时为 allow）
+
+同一前缀或同一域名上的多条规则按文件顺序取第一条端口也匹配的。
+
+规则编译为两棵树：IPv4/IPv6 各一棵路径压缩的二进制前缀树，查找只需沿地址的
+比特走一遍；域名按标签倒序（com -> example -> www）建树。查找耗时只与前缀
+长度/域名标签数有关，与规则条数无关。规则文件修改后自动重新编译，编译失败时
+继续使用旧规则。
+"""
+
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+ALLOW = 'allow'
+DENY = 'deny'
+ROUTE = 'route'
+
+# 检查规则文件是否被修改的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 5
+
+# 匹配结果：action 为 allow/deny/route，outbound 为出口名（直接连接时为None），rule 为规则原文
+Decision = namedtuple('Decision', 'action outbound rule')
+
+DEFAULT_ALLOW = Decision(ALLOW, None, 'default allow')
+
+
+class RuleError(ValueError):
+    """规则文件格式错误"""
+
+
+class _TrieNode:
+    __slots__ = ('prefix', 'length', 'entries', 'children')
+
+    def __init__(self, prefix, length):
+        self.prefix = prefix
+        self.length = length
+        self.entries = None
+        self.children = [None, None]
+
+
+class CidrTrie:
+    """路径压缩的二进制前缀树（最长前缀匹配）"""
+
+    def __init__(self, width):
+        """
+        Args:
+            width: 地址位数（IPv4为32，IPv6为128）
+        """
+        self.width = width
+        self.root = _TrieNode(0, 0)
+        self.size = 0
+
+    def insert(self, prefix, length, entry):
+        """
+        插入一个前缀
+
+        Args:
+            prefix: 网络地址（整数）
+            length: 前缀长度
+            entry: 附加到该前缀上的条目
+        """
+        w = self.width
+        node = self.root
+        self.size += 1
+        while True:
+            if length == node.length:
+                if node.entries is None:
+                    node.entries = []
+                node.entries.append(entry)
+                return
+            bit = (prefix >> (w - node.length - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                leaf = node.children[bit] = _TrieNode(prefix, length)
+                leaf.entries = [entry]
+                return
+
+            diff = prefix ^ child.prefix
+            common = min(length, child.length, w - diff.bit_length())
+            if common == child.length:
+                node = child
+                continue
+
+            # 在公共前缀处分裂出一个中间节点
+            branch = _TrieNode(prefix & ~((1 << (w - common)) - 1), common)
+            node.children[bit] = branch
+            branch.children[(child.prefix >> (w - common - 1)) & 1] = child
+            if common == length:
+                branch.entries = [entry]
+            else:
+                leaf = branch.children[(prefix >> (w - common - 1)) & 1] = _TrieNode(prefix, length)
+                leaf.entries = [entry]
+            return
+
+    def lookup(self, address):
+        """
+        查找包含该地址的所有前缀
+
+        Args:
+            address: 地址（整数）
+
+        Returns:
+            list: 各前缀的条目列表，最长前缀在前
+        """
+        w = self.width
+        node = self.root
+        matches = []
+        while node is not None:
+            if node.length and (address ^ node.prefix) >> (w - node.length):
+                break
+            if node.entries:
+                matches.append(node.entries)
+            if node.length == w:
+                break
+            node = node.children[(address >> (w - node.length - 1)) & 1]
+        matches.reverse()
+        return matches
+
+
+class _DomainNode:
+    __slots__ = ('children', 'exact', 'suffix')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.suffix = None
+
+
+class DomainTree:
+    """按标签倒序组织的域名树"""
+
+    def __init__(self):
+        self.root = _DomainNode()
+        self.size = 0
+
+    def insert(self, domain, entry, exact=False):
+        """
+        插入一个域名
+
+        Args:
+            domain: 域名
+            entry: 附加到该域名上的条目
+            exact: True 只匹配该域名本身，False 同时匹配所有子域名
+        """
+        node = self.root
+        for label in reversed(domain.split('.')):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _DomainNode()
+            node = child
+        attr = 'exact' if exact else 'suffix'
+        if getattr(node, attr) is None:
+            setattr(node, attr, [])
+        getattr(node, attr).append(entry)
+        self.size += 1
+
+    def lookup(self, domain):
+        """
+        查找匹配该域名的所有规则
+
+        Args:
+            domain: 域名（小写，不带结尾的点）
+
+        Returns:
+            list: 各层的条目列表，完全匹配在前，其次按后缀从长到短
+        """
+        node = self.root
+        matches = []
+        labels = domain.split('.')
+        for i in range(len(labels) - 1, -1, -1):
+            node = node.children.get(labels[i])
+            if node is None:
+                break
+            if node.suffix:
+                matches.append(node.suffix)
+            if i == 0 and node.exact:
+                matches.append(node.exact)
+        matches.reverse()
+        return matches
+
+
+def _parse_ports(text):
+    """
+    解析端口列表，如 "25,465,8000-9000"
+
+    Returns:
+        tuple: ((起始, 结束), ...)
+    """
+    ranges = []
+    for part in text.split(','):
+        low, sep, high = part.partition('-')
+        low = int(low)
+        high = int(high) if sep else low
+        if not 0 <= low <= high <= 65535:
+            raise ValueError(part)
+        ranges.append((low, high))
+    return tuple(ranges)
+
+
+def _port_matches(ports, port):
+    if ports is None:
+        return True
+    for low, high in ports:
+        if low <= port <= high:
+            return True
+    return False
+
+
+def _first_match(levels, port):
+    """在按优先级排列的条目列表中找到第一个端口也匹配的规则"""
+    for entries in levels:
+        for ports, decision in entries:
+            if _port_matches(ports, port):
+                return decision
+    return None
+
+
+def _parse_action(token, outbounds):
+    """
+    解析动作
+
+    Returns:
+        tuple: (动作, 出口名)
+    """
+    if token.startswith(ROUTE + ':'):
+        outbound = token[len(ROUTE) + 1:]
+        if outbound == 'direct':
+            return ROUTE, None
+        if outbound not in outbounds:
+            raise RuleError(f"未定义的出口: {outbound}")
+        return ROUTE, outbound
+    if token not in (ALLOW, DENY):
+        raise RuleError(f"未知的动作: {token}")
+    return token, None
+
+
+def _parse_ip(host):
+    """
+    把IP字面量转换为整数，::ffff:a.b.c.d 按IPv4处理（避免绕过IPv4的拒绝规则）
+
+    Returns:
+        tuple: (位数 32/128, 整数)，不是IP时返回None
+    """
+    try:
+        return 32, int.from_bytes(socket.inet_pton(socket.AF_INET, host), 'big')
+    except (OSError, ValueError):
+        pass
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, host.split('%', 1)[0]), 'big')
+    except (OSError, ValueError):
+        return None
+    if value >> 32 == 0xFFFF:
+        return 32, value & 0xFFFFFFFF
+    return 128, value
+
+
+def _normalize_domain(host):
+    return host.rstrip('.').lower()
+
+
+class RuleSet:
+    """编译后的规则（只读，可在多个线程中同时查找）"""
+
+    def __init__(self):
+        self.port_rules = []
+        self.ipv4 = CidrTrie(32)
+        self.ipv6 = CidrTrie(128)
+        self.domains = DomainTree()
+        self.default = DEFAULT_ALLOW
+
+    def __len__(self):
+        return len(self.port_rules) + self.ipv4.size + self.ipv6.size + self.domains.size
+
+    def match_host(self, host, port):
+        """
+        按端口和域名规则匹配（目标为IP时同时匹配CIDR规则）
+
+        Returns:
+            Decision: 匹配结果；目标为域名且没有匹配的规则时返回None，需要解析后再用 match_ip 判断
+        """
+        decision = _first_match([self.port_rules], port)
+        if decision is not None:
+            return decision
+        address = _parse_ip(host)
+        if address is not None:
+            return self._match_address(address, port)
+        return _first_match(self.domains.lookup(_normalize_domain(host)), port)
+
+    def match_ip(self, ip, port):
+        """
+        按CIDR规则匹配解析后的地址
+
+        Returns:
+            Decision: 匹配结果（没有匹配的规则时为默认动作）
+        """
+        address = _parse_ip(ip)
+        if address is None:
+            return self.default
+        return self._match_address(address, port)
+
+    def _match_address(self, address, port):
+        width, value = address
+        trie = self.ipv4 if width == 32 else self.ipv6
+        return _first_match(trie.lookup(value), port) or self.default
+
+
+def compile_rules(lines, outbounds=None):
+    """
+    编译规则
+
+    Args:
+        lines: 规则文本行
+        outbounds: 可用的出口名（默认读取SOCKS5_CONFIG['outbounds']）
+
+    Returns:
+        RuleSet: 编译后的规则
+
+    Raises:
+        RuleError: 格式错误，消息中包含行号
+    """
+    if outbounds is None:
+        outbounds = SOCKS5_CONFIG['outbounds']
+    ruleset = RuleSet()
+
+    for lineno, line in enumerate(lines, 1):
+        text = line.split('#', 1)[0].strip()
+        if not text:
+            continue
+        fields = text.split()
+        try:
+            if fields[0] == 'default':
+                if len(fields) != 2:
+                    raise RuleError("default 后应为一个动作")
+                ruleset.default = Decision(*_parse_action(fields[1], outbounds), text)
+                continue
+
+            action, outbound = _parse_action(fields[0], outbounds)
+            if len(fields) not in (3, 5):
+                raise RuleError("格式应为: 动作 类型 值 [ports 端口列表]")
+            kind, value = fields[1], fields[2]
+            ports = None
+            if len(fields) == 5:
+                if fields[3] != 'ports':
+                    raise RuleError(f"未知的选项: {fields[3]}")
+                ports = _parse_ports(fields[4])
+
+            decision = Decision(action, outbound, text)
+            if kind == 'port':
+                if ports is not None:
+                    raise RuleError("port 规则不能再指定 ports")
+                ruleset.port_rules.append((_parse_ports(value), decision))
+            elif kind == 'cidr':
+                network = ipaddress.ip_network(value, strict=False)
+                trie = ruleset.ipv4 if network.version == 4 else ruleset.ipv6
+                trie.insert(int(network.network_address), network.prefixlen, (ports, decision))
+            elif kind in ('domain', 'domain-suffix'):
+                domain = _normalize_domain(value).lstrip('.')
+                if not domain:
+                    raise RuleError("域名为空")
+                ruleset.domains.insert(domain, (ports, decision), exact=(kind == 'domain'))
+            else:
+                raise RuleError(f"未知的规则类型: {kind}")
+        except RuleError as e:
+            raise RuleError(f"第 {lineno} 行: {e}")
+        except (ValueError, IndexError) as e:
+            raise RuleError(f"第 {lineno} 行: 无效的值 {e}")
+
+    return ruleset
+
+
+class RuleEngine:
+    """从规则文件加载规则，文件修改后自动重新编译（线程安全）"""
+
+    def __init__(self, path=None, logger=None):
+        """
+        初始化规则引擎
+
+        Args:
+            path: 规则文件路径（默认读取SOCKS5_CONFIG['rules_file']）
+            logger: 日志记录器
+        """
+        self.path = SOCKS5_CONFIG['rules_file'] if path is None else path
+        self.logger = logger or Logger('RuleEngine', 'socks5_proxy')
+        self.ruleset = RuleSet()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'allowed': 0, 'denied': 0, 'routed': 0, 'reloads': 0, 'reload_errors': 0}
+        self.reload()
+
+    def reload(self):
+        """
+        重新编译规则文件，失败时保留旧规则
+
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                ruleset = compile_rules(f)
+        except (OSError, RuleError) as e:
+            self.logger.error(f"加载规则文件失败 {self.path}: {e}")
+            with self._lock:
+                self.stats['reload_errors'] += 1
+            return False
+
+        # 替换引用即可，正在进行的查找继续使用旧规则
+        self.ruleset = ruleset
+        with self._lock:
+            self._mtime = mtime
+            self.stats['reloads'] += 1
+        self.logger.info(f"已加载 {len(ruleset)} 条规则: {self.path}")
+        return True
+
+    def check(self, host, port):
+        """
+        连接前检查目标
+
+        Args:
+            host: 目标域名或IP
+            port: 目标端口
+
+        Returns:
+            Decision: 匹配结果；目标为域名且没有匹配的规则时返回None（需要解析后调用 filter_addresses）
+        """
+        self._maybe_reload()
+        decision = self.ruleset.match_host(host, port)
+        if decision is not None:
+            self._count(decision)
+        return decision
+
+    def filter_addresses(self, addresses, port):
+        """
+        按CIDR规则过滤解析得到的地址
+
+        同一次连接只使用一个出口：保留与第一个未被拒绝的地址出口相同的地址。
+
+        Args:
+            addresses: [(family, ip), ...]
+            port: 目标端口
+
+        Returns:
+            tuple: (保留的地址列表, Decision)；全部被拒绝时列表为空，Decision 为第一个拒绝结果
+        """
+        ruleset = self.ruleset
+        kept = []
+        chosen = None
+        denied = None
+        for family, ip in addresses:
+            decision = ruleset.match_ip(ip, port)
+            if decision.action == DENY:
+                denied = denied or decision
+                continue
+            if chosen is None:
+                chosen = decision
+            if decision.outbound == chosen.outbound:
+                kept.append((family, ip))
+        decision = chosen or denied or self.ruleset.default
+        self._count(decision)
+        return kept, decision
+
+    def allows(self, host, port):
+        """
+        只判断是否允许（用于UDP数据报等不区分出口的场景）
+
+        Returns:
+            bool: 是否允许
+        """
+        decision = self.ruleset.match_host(host, port)
+        return decision is None or decision.action != DENY
+
+    def get_stats(self):
+        """
+        获取规则统计
+
+        Returns:
+            dict: 规则条数、各动作的命中次数和重新加载次数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats['rules'] = len(self.ruleset)
+        return stats
+
+    def _count(self, decision):
+        key = {ALLOW: 'allowed', DENY: 'denied', ROUTE: 'routed'}[decision.action]
+        with self._lock:
+            self.stats[key] += 1
+
+    def _maybe_reload(self):
+        """规则文件被修改时重新编译"""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+
+def load_rules(path=None, logger=None):
+    """
+    按配置创建规则引擎
+
+    Args:
+        path: 规则文件路径（默认读取SOCKS5_CONFIG['rules_file']）
+        logger: 日志记录器
+
+    Returns:
+        RuleEngine: 未配置规则文件时返回None
+    """
+    path = SOCKS5_CONFIG['rules_file'] if path is None else path
+    if not path:
+        return None
+    return RuleEngine(path, logger=logger)
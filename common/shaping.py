@@ -0,0 +1,219 @@
+"""
+令牌桶带宽限速
+
+全局、单个客户端IP、单个连接三级限速，每级都是带突发额度的令牌桶。
+令牌在每次消费时按流逝时间补充（无需定时线程），桶允许透支：转发一块数据后
+扣除对应令牌，透支部分换算成该方向需要暂停的时间，由转发循环在这段时间内
+不再读取该方向的数据。每块数据的开销为常数次运算。
+"""
+
+import threading
+import time
+from .config import SOCKS5_CONFIG
+
+# 突发额度的下限，避免低速率时每次只能转发很小的数据块
+MIN_BURST = 64 * 1024
+
+
+class TokenBucket:
+    """允许透支的令牌桶（线程安全）"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate, burst_seconds=1.0):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 速率（字节/秒），0表示不限速
+            burst_seconds: 突发额度，按满速率持续的秒数计
+        """
+        self._lock = threading.Lock()
+        self.tokens = 0
+        self.set_rate(rate, burst_seconds)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate, burst_seconds=1.0):
+        """
+        修改速率（运行中也可调用）
+
+        Args:
+            rate: 速率（字节/秒），0表示不限速
+            burst_seconds: 突发额度（秒）
+        """
+        with self._lock:
+            self.rate = rate
+            self.burst = max(int(rate * burst_seconds), MIN_BURST) if rate else 0
+            self.tokens = min(self.tokens, self.burst)
+
+    def consume(self, n, now):
+        """
+        扣除n字节的令牌
+
+        Args:
+            n: 字节数
+            now: 当前 time.monotonic()
+
+        Returns:
+            float: 透支时需要暂停的秒数，未透支返回0
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class ConnectionShaper:
+    """单个连接的限速器，依次扣除连接、客户端IP和全局三个令牌桶"""
+
+    __slots__ = ('shaper', 'client_ip', 'up', 'down')
+
+    def __init__(self, shaper, client_ip, up, down):
+        self.shaper = shaper
+        self.client_ip = client_ip
+        # 每个方向: (连接桶, 客户端IP桶, 全局桶)
+        self.up = up
+        self.down = down
+
+    def throttle(self, upstream, n):
+        """
+        记录转发的字节数
+
+        Args:
+            upstream: True 为客户端 -> 远程方向
+            n: 转发的字节数
+
+        Returns:
+            float: 该方向需要暂停读取的秒数
+        """
+        now = time.monotonic()
+        delay = 0.0
+        for bucket in (self.up if upstream else self.down):
+            wait = bucket.consume(n, now)
+            if wait > delay:
+                delay = wait
+        return delay
+
+    def release(self):
+        """连接结束时调用，释放客户端IP的令牌桶"""
+        self.shaper._release(self)
+
+
+class BandwidthShaper:
+    """三级令牌桶限速（上下行分别计算）"""
+
+    def __init__(self, global_rate=None, per_ip_rate=None, per_connection_rate=None, burst_seconds=None):
+        """
+        初始化限速器（参数为None时读取SOCKS5_CONFIG，速率为0表示不限速）
+
+        Args:
+            global_rate: 所有连接合计的速率上限（字节/秒）
+            per_ip_rate: 单个客户端IP的速率上限（字节/秒）
+            per_connection_rate: 单个连接的速率上限（字节/秒）
+            burst_seconds: 突发额度，按满速率持续的秒数计
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.global_rate = pick(global_rate, 'rate_limit_global')
+        self.per_ip_rate = pick(per_ip_rate, 'rate_limit_per_ip')
+        self.per_connection_rate = pick(per_connection_rate, 'rate_limit_per_connection')
+        self.burst_seconds = pick(burst_seconds, 'rate_limit_burst')
+
+        self._lock = threading.Lock()
+        self._global = (TokenBucket(self.global_rate, self.burst_seconds),
+                        TokenBucket(self.global_rate, self.burst_seconds))
+        # 客户端IP -> [上行桶, 下行桶, 引用计数]
+        self._per_ip = {}
+        # 当前连接的限速器，用于运行中修改单连接速率
+        self._connections = set()
+
+    @property
+    def enabled(self):
+        """是否设置了任一级限速"""
+        return bool(self.global_rate or self.per_ip_rate or self.per_connection_rate)
+
+    def attach(self, client_ip):
+        """
+        为新连接创建限速器
+
+        Args:
+            client_ip: 客户端IP
+
+        Returns:
+            ConnectionShaper: 连接结束时需调用其 release()
+        """
+        with self._lock:
+            entry = self._per_ip.get(client_ip)
+            if entry is None:
+                entry = self._per_ip[client_ip] = [
+                    TokenBucket(self.per_ip_rate, self.burst_seconds),
+                    TokenBucket(self.per_ip_rate, self.burst_seconds),
+                    0,
+                ]
+            entry[2] += 1
+            connection = ConnectionShaper(
+                self, client_ip,
+                (TokenBucket(self.per_connection_rate, self.burst_seconds), entry[0], self._global[0]),
+                (TokenBucket(self.per_connection_rate, self.burst_seconds), entry[1], self._global[1]),
+            )
+            self._connections.add(connection)
+        return connection
+
+    def set_limits(self, global_rate=None, per_ip_rate=None, per_connection_rate=None):
+        """
+        运行中修改限速（参数为None的级别保持不变，0表示取消限速），对已有连接立即生效
+
+        Args:
+            global_rate: 所有连接合计的速率上限（字节/秒）
+            per_ip_rate: 单个客户端IP的速率上限（字节/秒）
+            per_connection_rate: 单个连接的速率上限（字节/秒）
+        """
+        with self._lock:
+            if global_rate is not None:
+                self.global_rate = global_rate
+                for bucket in self._global:
+                    bucket.set_rate(global_rate, self.burst_seconds)
+            if per_ip_rate is not None:
+                self.per_ip_rate = per_ip_rate
+                for up, down, _ in self._per_ip.values():
+                    up.set_rate(per_ip_rate, self.burst_seconds)
+                    down.set_rate(per_ip_rate, self.burst_seconds)
+            if per_connection_rate is not None:
+                self.per_connection_rate = per_connection_rate
+                for connection in self._connections:
+                    connection.up[0].set_rate(per_connection_rate, self.burst_seconds)
+                    connection.down[0].set_rate(per_connection_rate, self.burst_seconds)
+
+    def get_stats(self):
+        """
+        获取限速配置和状态
+
+        Returns:
+            dict: 各级速率（字节/秒）、限速中的客户端IP数和连接数
+        """
+        with self._lock:
+            return {
+                'global_rate': self.global_rate,
+                'per_ip_rate': self.per_ip_rate,
+                'per_connection_rate': self.per_connection_rate,
+                'clients': len(self._per_ip),
+                'connections': len(self._connections),
+            }
+
+    def _release(self, connection):
+        """移除连接，最后一个连接结束时删除其客户端IP的令牌桶"""
+        with self._lock:
+            if connection not in self._connections:
+                return
+            self._connections.discard(connection)
+            entry = self._per_ip[connection.client_ip]
+            entry[2] -= 1
+            if entry[2] <= 0:
+                del self._per_ip[connection.client_ip]
@@ -0,0 +1,984 @@
+"""
+SOCKS5 代理服务器 - asyncio事件循环实现
+
+与线程版 Socks5ProxyServer 使用相同的握手、请求、转发三个阶段，
+但所有连接都以协程的形式运行在同一个事件循环上，每个空闲连接只占用
+少量内存（无独立线程栈），适合在路由器上承载大量并发连接。
+"""
+
+import asyncio
+import contextlib
+import errno
+import functools
+import socket
+import struct
+import time
+from .admission import AdmissionController
+from .buffer_pool import AdaptiveBuffer, AdaptiveBufferPool
+from .config import SOCKS5_CONFIG
+from .dns_cache import DnsResolver, is_ip_address
+from .happy_eyeballs import async_create_connection
+from .logger import Logger, packet_trace_matcher
+from .metrics import MetricsServer, ProxyMetrics
+from .path_selector import PATH_NAMES, UPSTREAM, destination_key, load_path_selector, other_path
+from .proxy_parser import (
+    PROTOCOL_NAMES, SOCKS4_CMD_CONNECT, http_auth_required, http_reply, parse_http_request,
+    parse_socks4_request, sniff_protocol, socks4_reply,
+)
+from .reaper import create_reaper
+from .rules import DENY, ROUTE, load_rules
+from .shaping import BandwidthShaper
+from .socks5_auth import load_credentials
+from .socks5_parser import AUTH_VERSION, ProtocolError
+from .socks5_proxy import RECV_CHUNK, Socks5ProxyHandler
+from .tcp_tuning import TcpProfile, get_profile
+from .unix_listener import is_unix, load_unix_listener, peer_identity
+from .uplinks import load_uplinks
+
+
+class AsyncSocks5ProxyServer:
+    """SOCKS5代理服务器（asyncio事件循环版，同一端口也接受SOCKS4/4a和HTTP代理请求）"""
+
+    # 复用线程版处理器中的协议常量
+    P = Socks5ProxyHandler
+
+    def __init__(self, host='0.0.0.0', port=1080, backlog=None, stream_limit=None, admission=None,
+                 resolver=None, metrics_port=None, tcp_profile=None, credentials=None, rules=None,
+                 listener=None, uplinks=None, unix_listener=None, paths=None):
+        """
+        初始化SOCKS5代理服务器
+
+        Args:
+            host: 监听地址
+            port: 监听端口
+            backlog: 监听队列长度（默认读取SOCKS5_CONFIG）
+            stream_limit: 每个连接的读缓冲上限（默认读取SOCKS5_CONFIG）
+            admission: 连接准入控制器（默认按SOCKS5_CONFIG新建，连接数上限为 async_max_connections，不使用等待队列）
+            resolver: 缓存DNS解析器（默认按SOCKS5_CONFIG新建）
+            metrics_port: 指标HTTP端口（默认读取SOCKS5_CONFIG，0表示不启动）
+            tcp_profile: TCP调优配置名称或 TcpProfile（默认读取SOCKS5_CONFIG）
+            credentials: 凭据存储 CredentialStore（默认按SOCKS5_CONFIG['auth_file']加载，未配置时不认证）
+            rules: 目标地址规则引擎 RuleEngine（默认按SOCKS5_CONFIG['rules_file']加载，未配置时不检查）
+            listener: 已经在监听的socket（从旧进程或systemd继承，见 common.lifecycle），指定时不再绑定端口
+            uplinks: 出口池 UplinkPool（默认按SOCKS5_CONFIG['outbounds']创建，未定义出口时使用默认路由）
+            unix_listener: 同时监听的Unix域socket UnixListener（默认按SOCKS5_CONFIG['unix_socket']创建，
+                           False表示不监听）
+            paths: 直连/上游代理路径选择器 PathSelector（默认按SOCKS5_CONFIG['upstream_proxy']创建，
+                   未配置上游代理或为False时总是直连）
+        """
+        self.host = host
+        self.port = port
+        self.listener = listener
+        self.tcp_profile = tcp_profile if isinstance(tcp_profile, TcpProfile) else get_profile(tcp_profile)
+        self.backlog = backlog or SOCKS5_CONFIG['listen_backlog']
+        self.stream_limit = stream_limit or SOCKS5_CONFIG['async_stream_limit']
+        # 读取大小按流量自适应；流中缓冲的数据超过读缓冲上限的两倍时暂停读socket，
+        # 每次读到的数据不会更多，因此以此为读取大小的上限
+        self.buffer_pool = AdaptiveBufferPool(
+            max_size=min(SOCKS5_CONFIG['relay_buffer_max'], 2 * self.stream_limit))
+        self.logger = Logger('Socks5ProxyServer', 'socks5_proxy')
+        self.loop = None
+        self.server = None
+        # 同机客户端的Unix域监听，连接与TCP连接由同一个 _handle_client 处理
+        self.unix_listener = load_unix_listener(self.logger) if unix_listener is None else unix_listener or None
+        self.unix_server = None
+        self.running = False
+        self.accepting = False
+        # 处理中的连接: id(流列表) -> 回收或中止时需要关闭的流
+        # （同一本地进程的多个Unix域连接客户端ID相同，不能按客户端ID区分）
+        self._active = {}
+        # 平滑退出任务，以及所有连接结束时设置的事件
+        self._drain_task = None
+        self._drained = None
+        # 协程不占用线程，按 async_max_connections 而不是 max_handlers 限制连接数，超出上限的连接直接拒绝而不排队
+        self.admission = admission or AdmissionController(
+            max_handlers=SOCKS5_CONFIG['async_max_connections'], max_queued=0)
+        self.resolver = resolver
+        if resolver is None and SOCKS5_CONFIG['dns_cache_enabled']:
+            self.resolver = DnsResolver(logger=self.logger)
+        # 全局/客户端IP/连接三级限速，可通过 self.shaper.set_limits() 在运行中修改
+        self.shaper = BandwidthShaper()
+        self.credentials = credentials or load_credentials(logger=self.logger)
+        self.rules = rules or load_rules(logger=self.logger)
+        self.uplinks = uplinks or load_uplinks(logger=self.logger)
+        self.paths = load_path_selector(self.logger) if paths is None else paths or None
+        self.protocols = SOCKS5_CONFIG['protocols']
+        # 逐包调试日志只对 LOG_CONFIG['trace_clients'] 中的客户端开启
+        self.trace_match = packet_trace_matcher()
+        # 握手超时和空闲超时（由事件循环中的一个任务推进时间轮）
+        self.reaper = create_reaper(logger=self.logger)
+        self.metrics = ProxyMetrics()
+        self.metrics.bind_admission(self.admission)
+        self.metrics.bind_buffers(self.buffer_pool)
+        if self.resolver:
+            self.metrics.bind_resolver(self.resolver)
+        if self.credentials:
+            self.metrics.bind_credentials(self.credentials)
+        if self.rules:
+            self.metrics.bind_rules(self.rules)
+        if self.reaper:
+            self.metrics.bind_reaper(self.reaper)
+        if self.uplinks:
+            self.metrics.bind_uplinks(self.uplinks)
+        if self.paths:
+            self.metrics.bind_paths(self.paths)
+        self.metrics_server = MetricsServer(self.metrics.registry, port=metrics_port, logger=self.logger)
+
+    def start(self):
+        """启动代理服务器（阻塞直到 stop() 被调用）"""
+        if self.resolver:
+            self.resolver.load()
+        if self.paths:
+            self.paths.load()
+        self.metrics_server.start()
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.logger.error(f"代理服务器异常: {e}")
+        finally:
+            self.running = False
+            self.metrics_server.stop()
+            if self.resolver:
+                self.resolver.save()
+            if self.paths:
+                self.paths.save()
+            self.logger.info("SOCKS5代理服务器已停止")
+
+    def stop(self):
+        """停止代理服务器（可在其他线程中调用）"""
+        self.running = False
+        self.accepting = False
+        if self.loop and self.server:
+            try:
+                self.loop.call_soon_threadsafe(self._close_servers)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    async def serve(self):
+        """在当前事件循环中运行代理服务器"""
+        self.loop = asyncio.get_running_loop()
+        if self.listener is not None:
+            # 继承的监听socket：已经绑定并在监听，排队中的连接也一并接手
+            self.listener.setblocking(False)
+            self.host, self.port = self.listener.getsockname()[:2]
+            self.server = await asyncio.start_server(
+                self._handle_client, sock=self.listener, limit=self.stream_limit,
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self._handle_client,
+                self.host,
+                self.port,
+                backlog=self.backlog,
+                limit=self.stream_limit,
+                reuse_address=True,
+            )
+            for sock in self.server.sockets:
+                self.tcp_profile.tune_listener(sock)
+                self.tcp_profile.enable_fastopen(sock)
+        if self.unix_listener:
+            sock = self.unix_listener.open(self.backlog)
+            sock.setblocking(False)
+            self.unix_server = await asyncio.start_unix_server(
+                self._handle_client, sock=sock, limit=self.stream_limit,
+            )
+        self.running = True
+        self.accepting = True
+        self.logger.info(
+            f"SOCKS5代理服务器启动(asyncio): {self.host}:{self.port}（TCP调优: {self.tcp_profile.name}）"
+        )
+
+        reaper_task = asyncio.ensure_future(self.reaper.run()) if self.reaper else None
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                # server.close() 会取消 serve_forever
+                pass
+            finally:
+                if self._drain_task:
+                    # 平滑退出：监听已关闭，等待已有连接结束后再退出事件循环
+                    await self._drain_task
+                if reaper_task:
+                    reaper_task.cancel()
+                if self.unix_listener:
+                    self.unix_listener.close()
+
+    def _close_servers(self):
+        """关闭TCP和Unix域监听并结束 serve_forever，已建立的连接不受影响"""
+        if self.unix_server:
+            self.unix_server.close()
+        self.server.close()
+
+    def drain(self, timeout=None):
+        """
+        平滑退出：停止接受新连接，等待已有连接结束，超时后中止剩余的连接再停止服务器
+        （可在其他线程中调用）
+
+        Args:
+            timeout: 最长等待时间（秒，默认读取SOCKS5_CONFIG['drain_timeout']）
+
+        Returns:
+            int: 超时后被中止的连接数
+        """
+        timeout = SOCKS5_CONFIG['drain_timeout'] if timeout is None else timeout
+        aborted = 0
+        if self.loop and self.accepting:
+            try:
+                future = asyncio.run_coroutine_threadsafe(self._drain(timeout), self.loop)
+                aborted = future.result()
+            except Exception as e:
+                self.logger.error(f"平滑退出异常: {e}")
+        self.stop()
+        return aborted
+
+    async def _drain(self, timeout):
+        """在事件循环中执行平滑退出"""
+        self._drain_task = asyncio.current_task()
+        self.accepting = False
+        self._drained = asyncio.Event()
+        if not self._active:
+            self._drained.set()
+        self.logger.info(f"停止接受新连接，等待 {len(self._active)} 个连接结束（最多 {timeout} 秒）")
+        self._close_servers()
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        leftover = list(self._active.values())
+        if leftover:
+            self.logger.warning(f"平滑退出超时，中止 {len(leftover)} 个连接")
+            for writers in leftover:
+                self._abort(writers)
+        return len(leftover)
+
+    def listener_fileno(self):
+        """
+        监听socket的文件描述符（交接给新进程时使用）
+
+        Returns:
+            int: 文件描述符，未在接受连接时返回None
+        """
+        if self.server is None or not self.accepting or not self.server.sockets:
+            return None
+        return self.server.sockets[0].fileno()
+
+    async def _handle_client(self, reader, writer):
+        """
+        处理单个客户端连接
+
+        Args:
+            reader: 客户端读取流
+            writer: 客户端写入流
+        """
+        client_socket = writer.get_extra_info('socket')
+        local = client_socket is not None and is_unix(client_socket)
+        if local:
+            client_ip, client_id = peer_identity(client_socket)
+        else:
+            peer = writer.get_extra_info('peername') or ('?', 0)
+            client_ip = peer[0]
+            client_id = f"{client_ip}:{peer[1]}"
+        remote_writer = None
+        uplink = None
+        username = None
+        bytes_up = bytes_down = 0
+        # 回收器关闭连接时中止的流，以及转发中的 [上行, 下行] 字节数
+        writers = [writer]
+        moved = [0, 0]
+
+        reason = self.admission.try_admit(client_ip)
+        if reason:
+            self.logger.debug(f"[{client_id}] 拒绝连接: {reason}")
+            await self._send_reply(writer, self.P.REP_GENERAL_FAILURE)
+            writer.close()
+            return
+        started = time.monotonic()
+        self.admission.begin(started)
+        established = False
+        shaper = self.shaper.attach(client_ip)
+        if client_socket is not None and not local:
+            self.tcp_profile.tune_connection(client_socket)
+        entry = None
+        if self.reaper:
+            entry = self.reaper.track(lambda: self._abort(writers), lambda: moved[0] + moved[1])
+        self._active[id(writers)] = writers
+
+        try:
+            # 按第一个字节识别协议
+            try:
+                first = await reader.readexactly(1)
+            except asyncio.IncompleteReadError:
+                return
+            protocol = sniff_protocol(first[0])
+            if protocol not in self.protocols:
+                self.logger.warning(f"[{client_id}] 不支持的协议(首字节 0x{first[0]:02x})")
+                return
+            self.metrics.protocol(protocol)
+
+            # 客户端在回复前发来、连接目标后需要先转发的数据
+            early = b''
+            if protocol == 'socks4':
+                remote, early = await self._handle_socks4(reader, writer, client_id, started, first)
+            elif protocol == 'http':
+                remote, early, username = await self._handle_http(reader, writer, client_id, started, first)
+            else:
+                # 1. 握手阶段 - 协商认证方法
+                if not await self._handshake(reader, writer, client_id):
+                    return
+                if self.credentials:
+                    username = await self._authenticate(reader, writer, client_id)
+                    if username is None:
+                        return
+
+                # 2. 请求阶段 - 处理连接请求
+                remote = await self._handle_request(reader, writer, client_id, started)
+            if not remote:
+                return
+            remote_reader, remote_writer, uplink, choice = remote
+            writers.append(remote_writer)
+            if early:
+                remote_writer.write(early)
+                moved[0] += len(early)
+                self.metrics.bytes_up.inc(len(early))
+            replied_at = time.monotonic()
+            self.admission.established()
+            established = True
+            if entry:
+                entry.established()
+
+            # 3. 转发阶段 - 双向转发数据
+            trace = bool(self.trace_match and self.trace_match(client_ip))
+            on_first_byte = None
+            if choice is not None:
+                on_first_byte = functools.partial(self.paths.record_first_byte, *choice)
+            bytes_up, bytes_down = await self._relay_data(
+                reader, writer, remote_reader, remote_writer, client_id, shaper, replied_at, moved, trace,
+                on_first_byte)
+
+        except Exception as e:
+            self.logger.error(f"[{client_id}] SOCKS5处理异常: {e}")
+        finally:
+            if entry:
+                entry.done()
+            self._active.pop(id(writers), None)
+            if not self._active and self._drained is not None:
+                self._drained.set()
+            if uplink is not None:
+                self.uplinks.release(uplink)
+            self.admission.release(client_ip, True, established)
+            shaper.release()
+            if username is not None:
+                self.credentials.session_ended(username, bytes_up, bytes_down)
+            for w in (remote_writer, writer):
+                if w is not None:
+                    w.close()
+
+    @staticmethod
+    def _abort(writers):
+        """立即中止连接（回收器调用），阻塞在读写上的协程随即结束"""
+        for w in writers:
+            w.transport.abort()
+
+    def get_stats(self):
+        """
+        获取服务器统计信息
+
+        Returns:
+            dict: 处理中/拒绝的连接数等
+        """
+        stats = self.admission.get_stats()
+        stats['shaping'] = self.shaper.get_stats()
+        stats['tcp_profile'] = self.tcp_profile.name
+        stats['buffers'] = self.buffer_pool.get_stats()
+        if self.credentials:
+            stats['auth'] = self.credentials.get_stats()
+            stats['users'] = self.credentials.get_user_stats()
+        if self.rules:
+            stats['rules'] = self.rules.get_stats()
+        if self.reaper:
+            stats['reaper'] = self.reaper.get_stats()
+        if self.uplinks:
+            stats['uplinks'] = self.uplinks.get_stats()
+        if self.resolver:
+            stats['dns'] = self.resolver.get_stats()
+        if self.paths:
+            stats['paths'] = self.paths.get_stats()
+        return stats
+
+    async def _handshake(self, reader, writer, client_id):
+        """
+        SOCKS5握手 - 协商认证方法（版本字节已在识别协议时读取）
+
+        Returns:
+            bool: 握手是否成功
+        """
+        try:
+            # 格式: VER | NMETHODS | METHODS
+            nmethods = (await reader.readexactly(1))[0]
+            methods = await reader.readexactly(nmethods)
+
+            # 配置了凭据文件时只接受用户名/密码认证
+            if self.credentials:
+                method = self.P.AUTH_USERNAME_PASSWORD
+                if method not in methods:
+                    method = self.P.AUTH_NO_ACCEPTABLE
+                writer.write(struct.pack('!BB', self.P.SOCKS_VERSION, method))
+                await writer.drain()
+                if method == self.P.AUTH_NO_ACCEPTABLE:
+                    self.logger.warning(f"[{client_id}] 客户端不支持用户名/密码认证")
+                    return False
+                return True
+
+            if self.P.AUTH_NO_AUTH in methods:
+                writer.write(struct.pack('!BB', self.P.SOCKS_VERSION, self.P.AUTH_NO_AUTH))
+                await writer.drain()
+                self.logger.debug(f"[{client_id}] SOCKS5握手成功，使用无认证模式")
+                return True
+
+            writer.write(struct.pack('!BB', self.P.SOCKS_VERSION, self.P.AUTH_NO_ACCEPTABLE))
+            await writer.drain()
+            self.logger.warning(f"[{client_id}] 没有可接受的认证方法")
+            return False
+
+        except asyncio.IncompleteReadError:
+            self.logger.warning(f"[{client_id}] 握手数据不完整")
+            return False
+
+    async def _authenticate(self, reader, writer, client_id):
+        """
+        用户名/密码认证子协商（RFC 1929），缓存未命中时在线程池中计算慢哈希
+
+        Returns:
+            str: 认证通过的用户名，失败返回None
+        """
+        try:
+            # 格式: VER | ULEN | UNAME | PLEN | PASSWD
+            version, ulen = await reader.readexactly(2)
+            if version != AUTH_VERSION:
+                self.logger.warning(f"[{client_id}] 不支持的认证子协商版本: {version}")
+                return None
+            username = await reader.readexactly(ulen)
+            plen = (await reader.readexactly(1))[0]
+            password = await reader.readexactly(plen)
+            username, password = username.decode('utf-8'), password.decode('utf-8')
+        except asyncio.IncompleteReadError:
+            self.logger.warning(f"[{client_id}] 认证数据不完整")
+            return None
+        except UnicodeDecodeError:
+            self.logger.warning(f"[{client_id}] 用户名或密码不是有效的UTF-8")
+            return None
+
+        username = await self._check_credentials(client_id, username, password)
+
+        # 格式: VER | STATUS，STATUS 为0表示成功
+        writer.write(struct.pack('!BB', AUTH_VERSION, 0 if username is not None else 1))
+        await writer.drain()
+        return username
+
+    async def _check_credentials(self, client_id, username, password):
+        """
+        验证用户名和密码（缓存未命中时在线程池中计算慢哈希），通过时记录用户的连接
+
+        Returns:
+            str: 认证通过的用户名，失败返回None
+        """
+        ok = self.credentials.is_cached(username, password)
+        if not ok:
+            loop = asyncio.get_running_loop()
+            ok = await loop.run_in_executor(None, self.credentials.authenticate, username, password)
+        if not ok:
+            self.logger.warning(f"[{client_id}] 用户认证失败: {username}")
+            return None
+
+        self.credentials.session_started(username)
+        self.logger.debug(f"[{client_id}] 用户认证成功: {username}")
+        return username
+
+    async def _handle_request(self, reader, writer, client_id, started):
+        """
+        处理SOCKS5请求
+
+        Args:
+            started: 开始处理连接的时间（time.monotonic()），用于统计握手耗时
+
+        Returns:
+            tuple: 成功时返回 (remote_reader, remote_writer, uplink)，失败返回None
+        """
+        try:
+            # 格式: VER | CMD | RSV | ATYP | DST.ADDR | DST.PORT
+            data = await reader.readexactly(4)
+        except asyncio.IncompleteReadError:
+            self.logger.warning(f"[{client_id}] 请求数据不完整")
+            await self._send_reply(writer, self.P.REP_GENERAL_FAILURE)
+            return None
+
+        version, cmd, atyp = data[0], data[1], data[3]
+
+        if version != self.P.SOCKS_VERSION:
+            self.logger.warning(f"[{client_id}] 不支持的SOCKS版本: {version}")
+            await self._send_reply(writer, self.P.REP_GENERAL_FAILURE)
+            return None
+
+        if cmd != self.P.CMD_CONNECT:
+            self.logger.warning(f"[{client_id}] 不支持的命令: {cmd}")
+            await self._send_reply(writer, self.P.REP_COMMAND_NOT_SUPPORTED)
+            return None
+
+        dst_addr, dst_port = await self._parse_address(reader, atyp, client_id)
+        if not dst_addr or not dst_port:
+            self.logger.warning(f"[{client_id}] 无法解析目标地址")
+            await self._send_reply(writer, self.P.REP_ADDRESS_TYPE_NOT_SUPPORTED)
+            return None
+
+        return await self._open_target(writer, client_id, dst_addr, dst_port, started)
+
+    async def _read_message(self, reader, buf, parser, client_id, writer, protocol):
+        """
+        从 buf 解析一条完整消息，数据不足时继续读取（多余的字节留在 buf 中）
+
+        Returns:
+            tuple: 解析结果（不含消耗的字节数），数据不完整或格式错误时返回None
+        """
+        try:
+            while True:
+                result = parser(buf)
+                if result is not None:
+                    del buf[:result[-1]]
+                    return result[:-1]
+                data = await reader.read(RECV_CHUNK)
+                if not data:
+                    self.logger.warning(f"[{client_id}] 请求数据不完整")
+                    return None
+                buf += data
+        except ProtocolError as e:
+            self.logger.warning(f"[{client_id}] {e}")
+            await self._send_reply(writer, e.reply, protocol=protocol)
+            return None
+
+    async def _handle_socks4(self, reader, writer, client_id, started, first):
+        """
+        处理SOCKS4/4a请求（只支持CONNECT；SOCKS4无法携带密码，启用认证时拒绝）
+
+        Args:
+            first: 识别协议时读取的第一个字节
+
+        Returns:
+            tuple: (remote, 早发数据)，remote 同 _open_target 的返回值
+        """
+        buf = bytearray(first)
+        # 格式: VN | CD | DSTPORT | DSTIP | USERID | NUL [| 域名 | NUL]
+        request = await self._read_message(reader, buf, parse_socks4_request, client_id, writer, 'socks4')
+        if request is None:
+            return None, b''
+        cmd, dst_addr, dst_port, _ = request
+
+        if self.credentials:
+            self.logger.warning(f"[{client_id}] 已启用用户名/密码认证，拒绝SOCKS4请求")
+            reply = self.P.REP_CONNECTION_NOT_ALLOWED
+        elif cmd != SOCKS4_CMD_CONNECT:
+            self.logger.warning(f"[{client_id}] 不支持的SOCKS4命令: {cmd}")
+            reply = self.P.REP_COMMAND_NOT_SUPPORTED
+        elif not dst_port:
+            self.logger.warning(f"[{client_id}] 无效的目标端口")
+            reply = self.P.REP_ADDRESS_TYPE_NOT_SUPPORTED
+        else:
+            remote = await self._open_target(writer, client_id, dst_addr, dst_port, started, 'socks4')
+            return remote, bytes(buf)
+        await self._send_reply(writer, reply, protocol='socks4')
+        return None, b''
+
+    async def _handle_http(self, reader, writer, client_id, started, first):
+        """
+        处理HTTP代理请求：CONNECT 建立隧道；绝对URI请求改写后连同已收到的正文转发给目标
+
+        Args:
+            first: 识别协议时读取的第一个字节
+
+        Returns:
+            tuple: (remote, 早发数据, 认证通过的用户名)，remote 同 _open_target 的返回值
+        """
+        buf = bytearray(first)
+        request = await self._read_message(reader, buf, parse_http_request, client_id, writer, 'http')
+        if request is None:
+            return None, b'', None
+        _, dst_addr, dst_port, head, auth = request
+
+        # 配置了凭据文件时要求 Proxy-Authorization: Basic
+        username = None
+        if self.credentials:
+            if auth is not None:
+                username = await self._check_credentials(client_id, *auth)
+            if username is None:
+                writer.write(http_auth_required())
+                await writer.drain()
+                return None, b'', None
+
+        remote = await self._open_target(writer, client_id, dst_addr, dst_port, started, 'http',
+                                         announce=head is None)
+        if head is not None:
+            # 改写后的请求头放在早发数据之前
+            buf[:0] = head
+        return remote, bytes(buf), username
+
+    async def _open_target(self, writer, client_id, dst_addr, dst_port, started, protocol='socks5',
+                           announce=True):
+        """
+        检查规则并连接目标，成功后回复客户端（各协议共用）
+
+        Args:
+            started: 开始处理连接的时间（time.monotonic()），用于统计握手耗时
+            protocol: 客户端协议，决定回复的格式
+            announce: 是否发送成功回复（HTTP绝对URI请求由目标的响应回复客户端）
+
+        Returns:
+            tuple: 成功时返回 (remote_reader, remote_writer, uplink, choice)，失败返回None
+        """
+        self.logger.info(f"[{client_id}] {PROTOCOL_NAMES[protocol]}请求连接到: {dst_addr}:{dst_port}")
+
+        route = None
+        if self.rules:
+            route = self.rules.check(dst_addr, dst_port)
+            if route and route.action == DENY:
+                self.logger.warning(f"[{client_id}] 规则拒绝连接: {dst_addr}:{dst_port}（{route.rule}）")
+                await self._send_reply(writer, self.P.REP_CONNECTION_NOT_ALLOWED, protocol=protocol)
+                return None
+
+        connect_started = time.monotonic()
+        self.metrics.handshake_seconds.observe(connect_started - started)
+        remote = await self._connect_to_target(writer, dst_addr, dst_port, client_id, route, protocol)
+        if not remote:
+            return None
+        self.metrics.connect_seconds.observe(time.monotonic() - connect_started)
+
+        if announce:
+            await self._send_reply(writer, self.P.REP_SUCCESS, protocol=protocol)
+        else:
+            self.metrics.reply(self.P.REP_SUCCESS)
+        self.logger.info(f"[{client_id}] 成功连接到目标服务器: {dst_addr}:{dst_port}")
+        return remote
+
+    async def _parse_address(self, reader, atyp, client_id):
+        """
+        解析目标地址
+
+        Returns:
+            tuple: (地址, 端口)
+        """
+        try:
+            if atyp == self.P.ADDR_IPV4:
+                addr = socket.inet_ntoa(await reader.readexactly(4))
+            elif atyp == self.P.ADDR_DOMAIN:
+                addr_len = (await reader.readexactly(1))[0]
+                addr = (await reader.readexactly(addr_len)).decode('utf-8')
+            elif atyp == self.P.ADDR_IPV6:
+                addr = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+            else:
+                self.logger.warning(f"[{client_id}] 不支持的地址类型: {atyp}")
+                return None, None
+
+            port = struct.unpack('!H', await reader.readexactly(2))[0]
+            return addr, port
+
+        except Exception as e:
+            self.logger.error(f"[{client_id}] 解析地址异常: {e}")
+            return None, None
+
+    async def _connect_to_target(self, writer, addr, port, client_id, route=None, protocol='socks5'):
+        """
+        连接到目标服务器
+
+        Args:
+            route: 连接前匹配的规则结果（域名没有匹配的规则时为None，解析后再按地址检查）
+            protocol: 客户端协议，决定失败回复的格式
+
+        Returns:
+            tuple: 成功时返回 (remote_reader, remote_writer, uplink, choice)，uplink 为使用的出口
+                   （默认路由时为None，连接结束后需要释放），choice 为路径表中的 (目标的键, 路径)
+                   （未经路径选择时为None），失败返回None
+        """
+        uplink = None
+        try:
+            choice = None
+            if self.paths and not (route and route.action == ROUTE):
+                sock, uplink, choice = await self._connect_learned(writer, addr, port, client_id, route, protocol)
+            else:
+                sock, uplink = await self._connect_direct(writer, addr, port, client_id, route, protocol)
+            if sock is None:
+                return None
+            remote_reader, remote_writer = await asyncio.open_connection(sock=sock, limit=self.stream_limit)
+            return remote_reader, remote_writer, uplink, choice
+        except asyncio.TimeoutError:
+            self.logger.warning(f"[{client_id}] 连接目标超时: {addr}:{port}")
+            await self._send_reply(writer, self.P.REP_TTL_EXPIRED, protocol=protocol)
+        except ConnectionRefusedError:
+            self.logger.warning(f"[{client_id}] 目标拒绝连接: {addr}:{port}")
+            await self._send_reply(writer, self.P.REP_CONNECTION_REFUSED, protocol=protocol)
+        except socket.gaierror:
+            self.logger.warning(f"[{client_id}] 无法解析主机: {addr}")
+            await self._send_reply(writer, self.P.REP_HOST_UNREACHABLE, protocol=protocol)
+        except OSError as e:
+            if e.errno == errno.ENETUNREACH:
+                self.logger.warning(f"[{client_id}] 网络不可达: {addr}:{port}")
+                await self._send_reply(writer, self.P.REP_NETWORK_UNREACHABLE, protocol=protocol)
+            elif e.errno == errno.EHOSTUNREACH:
+                self.logger.warning(f"[{client_id}] 主机不可达: {addr}:{port}")
+                await self._send_reply(writer, self.P.REP_HOST_UNREACHABLE, protocol=protocol)
+            else:
+                self.logger.error(f"[{client_id}] 连接目标异常: {e}")
+                await self._send_reply(writer, self.P.REP_GENERAL_FAILURE, protocol=protocol)
+        except Exception as e:
+            self.logger.error(f"[{client_id}] 连接目标异常: {e}")
+            await self._send_reply(writer, self.P.REP_GENERAL_FAILURE, protocol=protocol)
+        if uplink:
+            self.uplinks.release(uplink)
+        return None
+
+    async def _connect_direct(self, writer, addr, port, client_id, route, protocol):
+        """
+        直连目标（经出口池选择的出口或默认路由）
+
+        Returns:
+            tuple: (sock, uplink)，规则拒绝等已回复客户端的情况 sock 为None
+        """
+        addresses = await asyncio.wait_for(self._resolve_target(addr), SOCKS5_CONFIG['dns_timeout'])
+        if self.rules and route is None:
+            addresses, route = self.rules.filter_addresses(addresses, port)
+            if not addresses:
+                self.logger.warning(f"[{client_id}] 规则拒绝连接: {addr}:{port}（{route.rule}）")
+                await self._send_reply(writer, self.P.REP_CONNECTION_NOT_ALLOWED, protocol=protocol)
+                return None, None
+        uplink = None
+        if self.uplinks:
+            uplink = self.uplinks.choose(route, client_id.rsplit(':', 1)[0])
+        try:
+            if uplink:
+                # 出口的源地址只能用于同一地址族的目标地址
+                addresses = uplink.filter_addresses(addresses)
+                if not addresses:
+                    self.logger.warning(f"[{client_id}] 出口 {uplink.name} 没有可用的同族地址: {addr}")
+                    await self._send_reply(writer, self.P.REP_NETWORK_UNREACHABLE, protocol=protocol)
+                    self.uplinks.release(uplink)
+                    return None, None
+                self.logger.debug(f"[{client_id}] 使用出口: {uplink.name}")
+
+            def prepare(sock, family):
+                self.tcp_profile.prepare_upstream(sock, family)
+                if uplink:
+                    uplink.bind(sock)
+
+            # 各地址交替竞速连接，每个尝试单独计时
+            with self.uplinks.measure(uplink) if uplink else contextlib.nullcontext():
+                sock = await async_create_connection(
+                    addresses, port,
+                    attempt_timeout=SOCKS5_CONFIG['connect_attempt_timeout'],
+                    attempt_delay=SOCKS5_CONFIG['connect_attempt_delay'],
+                    prefer_ipv6=SOCKS5_CONFIG['prefer_ipv6'],
+                    prepare=prepare,
+                )
+            return sock, uplink
+        except BaseException:
+            if uplink:
+                self.uplinks.release(uplink)
+            raise
+
+    async def _connect_upstream(self, writer, addr, port, client_id, route, protocol):
+        """
+        经上游代理连接目标（域名由上游代理解析；域名没有匹配的规则时先在本地解析，按地址检查规则）
+
+        Returns:
+            socket.socket: 已建立隧道的socket，规则拒绝时返回None
+        """
+        if self.rules and route is None:
+            addresses = await asyncio.wait_for(self._resolve_target(addr), SOCKS5_CONFIG['dns_timeout'])
+            addresses, route = self.rules.filter_addresses(addresses, port)
+            if not addresses:
+                self.logger.warning(f"[{client_id}] 规则拒绝连接: {addr}:{port}（{route.rule}）")
+                await self._send_reply(writer, self.P.REP_CONNECTION_NOT_ALLOWED, protocol=protocol)
+                return None
+        upstream = self.paths.upstream
+        self.logger.debug(f"[{client_id}] 经上游代理 {upstream.name} 连接")
+        return await upstream.async_connect(
+            addr, port, await asyncio.wait_for(self._resolve_target(upstream.host), SOCKS5_CONFIG['dns_timeout']),
+            timeout=SOCKS5_CONFIG['connect_attempt_timeout'],
+            attempt_delay=SOCKS5_CONFIG['connect_attempt_delay'],
+            prepare=self.tcp_profile.prepare_upstream,
+        )
+
+    async def _connect_learned(self, writer, addr, port, client_id, route, protocol):
+        """
+        按路径表选择直连或经上游代理连接目标，建连失败时改走另一条路径
+
+        Returns:
+            tuple: (sock, uplink, choice)，choice 为 (目标的键, 路径)；已回复客户端的情况 sock 为None
+        """
+        key = destination_key(addr)
+        path = self.paths.choose(key)
+        retry = True
+        while True:
+            started = time.monotonic()
+            uplink = None
+            try:
+                if path == UPSTREAM:
+                    sock = await self._connect_upstream(writer, addr, port, client_id, route, protocol)
+                else:
+                    sock, uplink = await self._connect_direct(writer, addr, port, client_id, route, protocol)
+            except ConnectionRefusedError:
+                # 目标拒绝连接说明经这条路径可以到达目标
+                raise
+            except (OSError, asyncio.TimeoutError) as e:
+                self.paths.record_failure(key, path)
+                if not retry:
+                    raise
+                retry = False
+                self.logger.warning(
+                    f"[{client_id}] 经{PATH_NAMES[path]}连接 {addr}:{port} 失败（{e or '超时'}），"
+                    f"改走{PATH_NAMES[other_path(path)]}"
+                )
+                path = other_path(path)
+                continue
+            if sock is None:
+                return None, None, None
+            self.paths.record_connect(key, path, time.monotonic() - started)
+            return sock, uplink, (key, path)
+
+    async def _resolve_target(self, addr):
+        """
+        解析目标地址的全部IPv4/IPv6地址
+
+        Returns:
+            list: [(family, ip), ...]
+        """
+        if self.resolver:
+            # 解析在后台线程进行，事件循环不被阻塞
+            return await asyncio.wrap_future(self.resolver.resolve_async(addr))
+
+        family = is_ip_address(addr)
+        if family:
+            return [(family, addr)]
+
+        infos = await asyncio.get_running_loop().getaddrinfo(addr, None, type=socket.SOCK_STREAM)
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            if (family, sockaddr[0]) not in addresses:
+                addresses.append((family, sockaddr[0]))
+        return addresses
+
+    async def _send_reply(self, writer, reply, bind_addr='0.0.0.0', bind_port=0, protocol='socks5'):
+        """
+        发送响应（SOCKS4/HTTP连接按对应协议的格式回复）
+
+        Args:
+            writer: 客户端写入流
+            reply: SOCKS5响应代码
+            bind_addr: 绑定地址（默认0.0.0.0）
+            bind_port: 绑定端口（默认0）
+            protocol: 客户端协议
+        """
+        self.metrics.reply(reply)
+        try:
+            if protocol == 'socks4':
+                writer.write(socks4_reply(reply, bind_addr, bind_port))
+            elif protocol == 'http':
+                writer.write(http_reply(reply))
+            else:
+                # 格式: VER | REP | RSV | ATYP | BND.ADDR | BND.PORT
+                writer.write(struct.pack(
+                    '!BBBB4sH', self.P.SOCKS_VERSION, reply, 0,
+                    self.P.ADDR_IPV4, socket.inet_aton(bind_addr), bind_port
+                ))
+            await writer.drain()
+        except Exception as e:
+            self.logger.error(f"发送响应异常: {e}")
+
+    async def _relay_data(self, reader, writer, remote_reader, remote_writer, client_id, shaper=None,
+                          replied_at=None, moved=None, trace=False, on_first_byte=None):
+        """
+        双向转发数据，任一方向结束即关闭整个连接，结束时记录一条汇总日志
+
+        Args:
+            moved: [上行, 下行] 字节数，转发时累加（可选，供转发过程中读取）
+            trace: 是否以DEBUG级别记录转发的每一块数据
+            on_first_byte: 收到目标第一个字节时以耗时（秒）调用的回调（可选）
+
+        Returns:
+            tuple: (上行字节数, 下行字节数)
+        """
+        started = replied_at or time.monotonic()
+        moved = moved if moved is not None else [0, 0]
+        trace = client_id if trace and self.logger.is_enabled() else None
+        client_sock = writer.get_extra_info('socket')
+        remote_sock = remote_writer.get_extra_info('socket')
+        tasks = [
+            asyncio.ensure_future(self._pipe(reader, remote_writer, shaper, True, moved=moved, trace=trace,
+                                             source=client_sock)),
+            asyncio.ensure_future(self._pipe(remote_reader, writer, shaper, False, replied_at, moved, trace,
+                                             remote_sock, on_first_byte)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.logger.info(
+            "[%s] 连接关闭，上行 %d 字节，下行 %d 字节，耗时 %.3f 秒",
+            client_id, moved[0], moved[1], time.monotonic() - started
+        )
+        return moved[0], moved[1]
+
+    async def _pipe(self, reader, writer, shaper=None, upstream=True, replied_at=None, moved=None,
+                    trace=None, source=None, on_first_byte=None):
+        """
+        单向转发数据
+
+        Args:
+            reader: 数据来源
+            writer: 数据去向
+            shaper: 连接的限速器（可选）
+            upstream: True 为客户端 -> 远程方向
+            replied_at: 回复成功的时间，指定时统计收到第一个字节的耗时
+            moved: [上行, 下行] 字节数，转发时累加（任务被取消后仍可读取）
+            trace: 客户端ID，指定时以DEBUG级别记录转发的每一块数据
+            source: reader 对应的socket，指定时随读取大小调整收发缓冲区
+            on_first_byte: 收到第一个字节时以耗时（秒）调用的回调（需要同时指定 replied_at）
+        """
+        counter = self.metrics.bytes_up if upstream else self.metrics.bytes_down
+        index = 0 if upstream else 1
+        pool = self.buffer_pool
+        # 只跟踪读取大小，数据由StreamReader分配
+        sizer = AdaptiveBuffer(pool, allocate=False)
+        target = writer.get_extra_info('socket') if source is not None else None
+        try:
+            while True:
+                data = await reader.read(sizer.size)
+                if not data:
+                    break
+                if sizer.record(len(data)) and target is not None and sizer.size in (pool.min_size, pool.max_size):
+                    self.tcp_profile.tune_relay_buffers(source, target, sizer.size)
+                if replied_at is not None:
+                    elapsed = time.monotonic() - replied_at
+                    self.metrics.first_byte_seconds.observe(elapsed)
+                    if on_first_byte:
+                        on_first_byte(elapsed)
+                    replied_at = None
+                counter.inc(len(data))
+                if moved is not None:
+                    moved[index] += len(data)
+                if trace:
+                    self.logger.debug("[%s] 转发 %d 字节: %s", trace, len(data),
+                                      "客户端->远程" if upstream else "远程->客户端")
+                writer.write(data)
+                # 对端读取过慢时在此暂停，避免缓冲区无限增长
+                await writer.drain()
+                if shaper:
+                    delay = shaper.throttle(upstream, len(data))
+                    if delay:
+                        await asyncio.sleep(delay)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            sizer.close()
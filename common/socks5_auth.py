@@ -0,0 +1,382 @@
+"""
+SOCKS5 用户名/密码认证（RFC 1929）
+
+用户保存在凭据文件中，每行一个 "用户名:哈希"，哈希为加盐的 PBKDF2-SHA256：
+
+    alice:pbkdf2_sha256$200000$<盐 base64>$<哈希 base64>
+
+慢哈希每次验证需要几十到上百毫秒的CPU时间，而浏览器打开一个页面就会建立
+几十个连接，因此验证成功的凭据在内存中缓存一段时间（按进程随机密钥计算的
+HMAC，不保存明文密码）；同一凭据的并发验证只计算一次。凭据文件修改后
+自动重新加载并清空缓存。
+
+添加或修改用户:
+    python -m common.socks5_auth 凭据文件 用户名
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+HASH_SCHEME = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+# 检查凭据文件是否被修改的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 5
+
+
+def hash_password(password, iterations=None, salt=None):
+    """
+    计算密码的加盐慢哈希
+
+    Args:
+        password: 密码（str）
+        iterations: PBKDF2迭代次数（默认读取SOCKS5_CONFIG）
+        salt: 盐（默认随机生成）
+
+    Returns:
+        str: 编码后的哈希，格式为 scheme$iterations$salt$hash
+    """
+    iterations = iterations or SOCKS5_CONFIG['auth_hash_iterations']
+    salt = salt or os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return '$'.join((
+        HASH_SCHEME, str(iterations),
+        base64.b64encode(salt).decode('ascii'), base64.b64encode(digest).decode('ascii'),
+    ))
+
+
+def verify_password(password, encoded):
+    """
+    校验密码与编码后的哈希是否匹配
+
+    Args:
+        password: 密码（str）
+        encoded: hash_password() 的结果
+
+    Returns:
+        bool: 是否匹配（格式错误时返回False）
+    """
+    try:
+        scheme, iterations, salt, expected = encoded.split('$')
+        if scheme != HASH_SCHEME:
+            return False
+        salt = base64.b64decode(salt)
+        expected = base64.b64decode(expected)
+        iterations = int(iterations)
+        if iterations <= 0:
+            return False
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    except (ValueError, OverflowError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def dummy_hash(users):
+    """
+    验证不存在的用户时使用的哈希，使响应时间不暴露用户名是否存在
+
+    Args:
+        users: 用户名 -> 编码后的哈希
+
+    Returns:
+        str: 迭代次数与凭据文件中最多的用户相同（没有用户时读取SOCKS5_CONFIG）的随机哈希
+    """
+    counts = defaultdict(int)
+    for encoded in users.values():
+        parts = encoded.split('$')
+        if len(parts) == 4 and parts[0] == HASH_SCHEME and parts[1].isdigit():
+            counts[int(parts[1])] += 1
+    iterations = max(counts, key=counts.get) if counts else SOCKS5_CONFIG['auth_hash_iterations']
+    return '$'.join((
+        HASH_SCHEME, str(iterations),
+        base64.b64encode(os.urandom(SALT_BYTES)).decode('ascii'), base64.b64encode(os.urandom(32)).decode('ascii'),
+    ))
+
+
+class CredentialStore:
+    """基于凭据文件的用户认证（线程安全），并统计每个用户的连接数和流量"""
+
+    def __init__(self, path=None, cache_ttl=None, cache_size=None, logger=None):
+        """
+        初始化凭据存储（参数为None时读取SOCKS5_CONFIG）
+
+        Args:
+            path: 凭据文件路径
+            cache_ttl: 验证成功的凭据缓存时间（秒），0表示不缓存
+            cache_size: 最多缓存的凭据数
+            logger: 日志记录器
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        self.path = pick(path, 'auth_file')
+        self.cache_ttl = pick(cache_ttl, 'auth_cache_ttl')
+        self.cache_size = pick(cache_size, 'auth_cache_size')
+        self.logger = logger or Logger('CredentialStore', 'socks5_proxy')
+
+        self._users = {}
+        self._dummy = dummy_hash({})
+        self._mtime = None
+        self._checked_at = 0.0
+        # 缓存: 用户名 -> (HMAC(密码), 过期时间)
+        self._cache = OrderedDict()
+        self._cache_key = os.urandom(32)
+        # (用户名, HMAC(密码)) -> Future
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        # 用户名 -> {'active', 'connections', 'bytes_up', 'bytes_down', 'failures'}
+        self._user_stats = defaultdict(lambda: {
+            'active': 0, 'connections': 0, 'bytes_up': 0, 'bytes_down': 0, 'failures': 0,
+        })
+        self.stats = {
+            'cache_hits': 0,
+            'coalesced': 0,
+            'verifications': 0,
+            'verify_time_total': 0.0,
+            'failures': 0,
+        }
+
+        self.load()
+
+    def load(self):
+        """
+        (重新)加载凭据文件，忽略空行和#开头的注释行
+
+        Returns:
+            int: 加载的用户数
+        """
+        users = {}
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for lineno, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    username, sep, encoded = line.partition(':')
+                    if not sep or not username:
+                        self.logger.warning(f"凭据文件第 {lineno} 行格式错误，已跳过")
+                        continue
+                    users[username] = encoded
+        except OSError as e:
+            self.logger.error(f"读取凭据文件失败 {self.path}: {e}")
+            return len(self._users)
+
+        dummy = dummy_hash(users)
+        with self._lock:
+            self._users = users
+            self._dummy = dummy
+            self._mtime = mtime
+            self._cache.clear()
+        self.logger.info(f"已加载 {len(users)} 个用户: {self.path}")
+        return len(users)
+
+    def authenticate(self, username, password):
+        """
+        验证用户名和密码（阻塞，缓存未命中时需要计算慢哈希）
+
+        Args:
+            username: 用户名（str）
+            password: 密码（str）
+
+        Returns:
+            bool: 是否验证通过
+        """
+        self._maybe_reload()
+        token = hmac.new(self._cache_key, password.encode('utf-8'), hashlib.sha256).digest()
+        key = (username, token)
+
+        with self._lock:
+            encoded = self._users.get(username)
+            if encoded is None:
+                self._record_failure(username)
+                dummy = self._dummy
+            else:
+                if self._lookup_cached(username, token):
+                    return True
+                future = self._inflight.get(key)
+                if future is not None:
+                    self.stats['coalesced'] += 1
+                    owner = False
+                else:
+                    future = self._inflight[key] = Future()
+                    owner = True
+
+        if encoded is None:
+            # 不存在的用户也计算一次同样迭代次数的哈希，不立即返回
+            verify_password(password, dummy)
+            return False
+        if not owner:
+            return future.result()
+
+        start = time.monotonic()
+        ok = False
+        try:
+            ok = verify_password(password, encoded)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.stats['verifications'] += 1
+                self.stats['verify_time_total'] += elapsed
+                if ok:
+                    self._store(username, token)
+                else:
+                    self._record_failure(username)
+            future.set_result(ok)
+        return ok
+
+    def is_cached(self, username, password):
+        """
+        只查缓存，不计算哈希（供事件循环在不阻塞的情况下快速判断）
+
+        Returns:
+            bool: 凭据是否在缓存中且未过期
+        """
+        token = hmac.new(self._cache_key, password.encode('utf-8'), hashlib.sha256).digest()
+        with self._lock:
+            return self._lookup_cached(username, token)
+
+    def session_started(self, username):
+        """记录用户认证通过的一个连接"""
+        with self._lock:
+            entry = self._user_stats[username]
+            entry['active'] += 1
+            entry['connections'] += 1
+
+    def session_ended(self, username, bytes_up, bytes_down):
+        """
+        记录用户的连接结束
+
+        Args:
+            username: 用户名
+            bytes_up: 上行字节数
+            bytes_down: 下行字节数
+        """
+        with self._lock:
+            entry = self._user_stats[username]
+            entry['active'] -= 1
+            entry['bytes_up'] += bytes_up
+            entry['bytes_down'] += bytes_down
+
+    def get_user_stats(self):
+        """
+        获取每个用户的统计
+
+        Returns:
+            dict: 用户名 -> {'active', 'connections', 'bytes_up', 'bytes_down', 'failures'}
+        """
+        with self._lock:
+            return {username: dict(entry) for username, entry in self._user_stats.items()}
+
+    def get_stats(self):
+        """
+        获取认证统计
+
+        Returns:
+            dict: 用户数、缓存命中/合并/实际验证次数、平均验证耗时（毫秒）和失败次数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['users'] = len(self._users)
+            stats['cached'] = len(self._cache)
+        total = stats.pop('verify_time_total')
+        stats['verify_time_avg_ms'] = total / stats['verifications'] * 1000 if stats['verifications'] else 0.0
+        return stats
+
+    def _lookup_cached(self, username, token):
+        """查缓存（调用方需持有锁）"""
+        entry = self._cache.get(username)
+        if entry is None:
+            return False
+        cached_token, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._cache[username]
+            return False
+        if not hmac.compare_digest(cached_token, token):
+            return False
+        self._cache.move_to_end(username)
+        self.stats['cache_hits'] += 1
+        return True
+
+    def _store(self, username, token):
+        """写入缓存并淘汰最久未使用的条目（调用方需持有锁）"""
+        if not self.cache_ttl or not self.cache_size:
+            return
+        self._cache[username] = (token, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(username)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _record_failure(self, username):
+        """记录失败（调用方需持有锁），只统计已存在的用户，避免任意用户名占用内存"""
+        self.stats['failures'] += 1
+        if username in self._users:
+            self._user_stats[username]['failures'] += 1
+
+    def _maybe_reload(self):
+        """凭据文件被修改时重新加载"""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load()
+
+
+def load_credentials(path=None, logger=None):
+    """
+    按配置创建凭据存储
+
+    Args:
+        path: 凭据文件路径（默认读取SOCKS5_CONFIG['auth_file']）
+        logger: 日志记录器
+
+    Returns:
+        CredentialStore: 未配置凭据文件时返回None
+    """
+    path = SOCKS5_CONFIG['auth_file'] if path is None else path
+    if not path:
+        return None
+    return CredentialStore(path, logger=logger)
+
+
+if __name__ == '__main__':
+    import getpass
+    import sys
+
+    if len(sys.argv) != 3:
+        print("用法: python -m common.socks5_auth 凭据文件 用户名")
+        sys.exit(1)
+
+    path, username = sys.argv[1], sys.argv[2]
+    if ':' in username or not username:
+        print("用户名不能为空或包含冒号")
+        sys.exit(1)
+    password = getpass.getpass(f"{username} 的密码: ")
+    if password != getpass.getpass("再次输入: "):
+        print("两次输入的密码不一致")
+        sys.exit(1)
+
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [line.rstrip('\n') for line in f if not line.startswith(username + ':')]
+    lines.append(f"{username}:{hash_password(password)}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.chmod(path, 0o600)
+    print(f"已更新用户 {username}: {path}")
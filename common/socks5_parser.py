@@ -0,0 +1,140 @@
+"""
+SOCKS5 握手和请求的增量解析
+
+解析函数只处理已收到的字节，不做任何I/O：数据不完整时返回None，由调用方
+继续接收后重试；格式错误时抛出 ProtocolError。处理器把每次 recv 的数据追加到
+同一个缓冲区中，客户端一次性发来的问候、请求以及紧随其后的首包数据只需一次
+读取，解析完剩余的字节即为需要转发给目标的早发数据。
+"""
+
+import socket
+import struct
+
+SOCKS_VERSION = 5
+
+# 用户名/密码认证子协商的版本（RFC 1929）
+AUTH_VERSION = 1
+
+# 地址类型
+ADDR_IPV4 = 1
+ADDR_DOMAIN = 3
+ADDR_IPV6 = 4
+
+# 与 Socks5ProxyHandler 的响应代码一致
+REP_GENERAL_FAILURE = 1
+REP_ADDRESS_TYPE_NOT_SUPPORTED = 8
+
+
+class ProtocolError(ValueError):
+    """SOCKS5数据格式错误"""
+
+    def __init__(self, message, reply=REP_GENERAL_FAILURE):
+        """
+        Args:
+            message: 错误描述
+            reply: 应回复给客户端的响应代码
+        """
+        super().__init__(message)
+        self.reply = reply
+
+
+def parse_greeting(buf):
+    """
+    解析客户端问候: VER | NMETHODS | METHODS
+
+    Args:
+        buf: 已收到的数据
+
+    Returns:
+        tuple: (认证方法 bytes, 消耗的字节数)，数据不完整时返回None
+
+    Raises:
+        ProtocolError: 版本错误
+    """
+    if len(buf) < 2:
+        return None
+    if buf[0] != SOCKS_VERSION:
+        raise ProtocolError(f"不支持的SOCKS版本: {buf[0]}")
+    end = 2 + buf[1]
+    if len(buf) < end:
+        return None
+    return bytes(buf[2:end]), end
+
+
+def parse_auth_request(buf):
+    """
+    解析用户名/密码认证请求: VER | ULEN | UNAME | PLEN | PASSWD
+
+    Args:
+        buf: 已收到的数据
+
+    Returns:
+        tuple: (用户名, 密码, 消耗的字节数)，数据不完整时返回None
+
+    Raises:
+        ProtocolError: 版本错误或用户名/密码不是有效的UTF-8
+    """
+    if len(buf) < 2:
+        return None
+    if buf[0] != AUTH_VERSION:
+        raise ProtocolError(f"不支持的认证子协商版本: {buf[0]}")
+    plen_at = 2 + buf[1]
+    if len(buf) < plen_at + 1:
+        return None
+    end = plen_at + 1 + buf[plen_at]
+    if len(buf) < end:
+        return None
+    try:
+        username = bytes(buf[2:plen_at]).decode('utf-8')
+        password = bytes(buf[plen_at + 1:end]).decode('utf-8')
+    except UnicodeDecodeError:
+        raise ProtocolError("用户名或密码不是有效的UTF-8")
+    return username, password, end
+
+
+def parse_request(buf):
+    """
+    解析客户端请求: VER | CMD | RSV | ATYP | DST.ADDR | DST.PORT
+
+    Args:
+        buf: 已收到的数据
+
+    Returns:
+        tuple: (命令, 目标地址, 目标端口, 消耗的字节数)，数据不完整时返回None
+
+    Raises:
+        ProtocolError: 版本错误、地址类型不支持或地址无法解码
+    """
+    if len(buf) < 4:
+        return None
+    if buf[0] != SOCKS_VERSION:
+        raise ProtocolError(f"不支持的SOCKS版本: {buf[0]}")
+
+    cmd, atyp = buf[1], buf[3]
+    if atyp == ADDR_IPV4:
+        end = 8
+        if len(buf) < end + 2:
+            return None
+        addr = socket.inet_ntoa(bytes(buf[4:8]))
+    elif atyp == ADDR_IPV6:
+        end = 20
+        if len(buf) < end + 2:
+            return None
+        addr = socket.inet_ntop(socket.AF_INET6, bytes(buf[4:20]))
+    elif atyp == ADDR_DOMAIN:
+        if len(buf) < 5:
+            return None
+        end = 5 + buf[4]
+        if len(buf) < end + 2:
+            return None
+        try:
+            addr = bytes(buf[5:end]).decode('utf-8')
+        except UnicodeDecodeError:
+            raise ProtocolError("域名不是有效的UTF-8", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+        if not addr:
+            raise ProtocolError("域名为空", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+    else:
+        raise ProtocolError(f"不支持的地址类型: {atyp}", REP_ADDRESS_TYPE_NOT_SUPPORTED)
+
+    port = struct.unpack_from('!H', buf, end)[0]
+    return cmd, addr, port, end + 2
@@ -3,15 +3,43 @@ SOCKS5 代理服务器实现
 用于VPN服务器提供真实的流量转发功能
 """
 
+import contextlib
 import socket
 import struct
 import threading
 import select
-from .logger import Logger
+import errno
+import logging
+import time
+from .admission import AdmissionController, WorkerPool
+from .config import SOCKS5_CONFIG
+from .buffer_pool import AdaptiveBuffer, AdaptiveBufferPool
+from .dns_cache import DnsResolver, resolve_addresses
+from .happy_eyeballs import create_connection
+from .logger import Logger, packet_trace_matcher
+from .metrics import MetricsServer, ProxyMetrics
+from .path_selector import PATH_NAMES, UPSTREAM, destination_key, load_path_selector, other_path
+from .reaper import create_reaper
+from .rules import DENY, ROUTE, load_rules
+from .shaping import BandwidthShaper
+from .proxy_parser import (
+    PROTOCOL_NAMES, SOCKS4_CMD_CONNECT, http_auth_required, http_reply, parse_http_request,
+    parse_socks4_request, sniff_protocol, socks4_reply,
+)
+from .socks5_auth import load_credentials
+from .socks5_parser import AUTH_VERSION, ProtocolError, parse_auth_request, parse_greeting, parse_request
+from .splice_relay import SpliceRelay, splice_available
+from .tcp_tuning import TcpProfile, get_profile
+from .udp_relay import UdpRelay
+from .unix_listener import UNIX_CLIENT_IP, is_unix, load_unix_listener, peer_identity
+from .uplinks import load_uplinks
+
+# 握手阶段每次recv的最大字节数，足够一次收下问候、请求和首包数据
+RECV_CHUNK = 4096
 
 
 class Socks5ProxyHandler:
-    """SOCKS5代理处理器"""
+    """代理处理器：按连接的第一个字节识别SOCKS5、SOCKS4/4a或HTTP代理请求，之后的转发相同"""
     
     # SOCKS5协议常量
     SOCKS_VERSION = 5
@@ -43,7 +71,14 @@ class Socks5ProxyHandler:
     REP_COMMAND_NOT_SUPPORTED = 7
     REP_ADDRESS_TYPE_NOT_SUPPORTED = 8
     
-    def __init__(self, client_socket, client_id, logger=None):
+    # 响应格式: VER | REP | RSV | ATYP | BND.ADDR | BND.PORT
+    _REPLY_IPV4 = struct.Struct('!BBBB4sH')
+    _REPLY_IPV6 = struct.Struct('!BBBB16sH')
+    
+    def __init__(self, client_socket, client_id, logger=None, relay_mode=None, buffer_pool=None,
+                 on_established=None, udp_relay=None, resolver=None, shaper=None, metrics=None,
+                 tcp_profile=None, credentials=None, rules=None, uplinks=None, trace=False, protocols=None,
+                 paths=None):
         """
         初始化SOCKS5代理处理器
         
@@ -51,11 +86,68 @@ class Socks5ProxyHandler:
             client_socket: 客户端socket
             client_id: 客户端ID
             logger: 日志记录器
+            relay_mode: 转发模式，'copy'(recv/sendall) 或 'splice'(Linux零拷贝)
+            buffer_pool: 自适应转发缓冲区池 AdaptiveBufferPool（可选，不指定时使用固定大小的独立缓冲区）
+            on_established: 完成请求阶段、进入转发阶段时调用的回调（可选）
+            udp_relay: UDP转发器（可选，不指定时不支持UDP ASSOCIATE）
+            resolver: 缓存DNS解析器（可选，不指定时由connect()直接解析域名）
+            shaper: 连接的限速器 ConnectionShaper（可选，不指定时不限速）
+            metrics: 代理指标 ProxyMetrics（可选）
+            tcp_profile: 上游连接使用的TCP调优配置 TcpProfile（可选）
+            credentials: 凭据存储 CredentialStore（可选，指定时要求用户名/密码认证）
+            rules: 目标地址规则引擎 RuleEngine（可选）
+            uplinks: 出口池 UplinkPool（可选，不指定时使用默认路由）
+            trace: 是否以DEBUG级别记录转发的每一块数据（默认只在连接结束时记录汇总）
+            protocols: 接受的协议（'socks5'、'socks4'、'http'，默认读取SOCKS5_CONFIG['protocols']）
+            paths: 直连/上游代理路径选择器 PathSelector（可选，不指定时总是直连）
         """
         self.client_socket = client_socket
         self.client_id = client_id
         self.logger = logger or Logger('Socks5ProxyHandler', 'socks5_proxy')
+        self.relay_mode = relay_mode or SOCKS5_CONFIG['relay_mode']
+        self.buffer_pool = buffer_pool
+        self.on_established = on_established
+        self.udp_relay = udp_relay
+        self.resolver = resolver
+        self.shaper = shaper
+        self.metrics = metrics
+        self.tcp_profile = tcp_profile
+        self.credentials = credentials
+        # 认证通过的用户名（未启用认证时为None）
+        self.username = None
+        self.rules = rules
+        # 本次连接匹配的规则结果 Decision（未匹配或未启用规则时为None）
+        self.route = None
+        self.uplinks = uplinks
+        # 本次连接使用的出口 Uplink（使用默认路由时为None）
+        self.uplink = None
+        self.paths = paths
+        # 本次连接在路径表中的键和使用的路径（未启用路径选择或规则固定了出口时为None）
+        self.path_key = None
+        self.path = None
+        self.trace = trace
+        self.protocols = protocols or SOCKS5_CONFIG['protocols']
+        # 识别出的协议，以及HTTP绝对URI请求（请求直接转发给目标，不回复客户端）
+        self.protocol = None
+        self.http_forward = False
         self.remote_socket = None
+        self.established = False
+        # 空闲连接回收器中的跟踪项 ReapEntry（由服务器设置，可选）
+        self.reap_entry = None
+        self._splice_relay = None
+        # UDP关联建立后客户端连接交由UDP转发器管理，调用方不应再关闭它
+        self.detached = False
+        
+        # 流量统计（字节）
+        self.bytes_up = 0    # 客户端 -> 远程
+        self.bytes_down = 0  # 远程 -> 客户端
+        
+        # 握手阶段的接收缓冲区，解析后剩余的字节为早发数据
+        self._recv_buffer = bytearray()
+        
+        # 耗时统计的起点（time.monotonic()）
+        self.started_at = None
+        self.replied_at = None
         
     def handle(self):
         """
@@ -64,17 +156,34 @@ class Socks5ProxyHandler:
         Returns:
             bool: 是否成功处理
         """
+        self.started_at = time.monotonic()
         try:
-            # 1. 握手阶段 - 协商认证方法
-            if not self._handshake():
+            # 1. 识别协议，完成握手和请求阶段
+            if not self._negotiate():
                 return False
             
-            # 2. 请求阶段 - 处理连接请求
-            if not self._handle_request():
-                return False
+            self.established = True
+            if self.on_established:
+                self.on_established()
+            if self.reap_entry:
+                self.reap_entry.established()
+            
+            if self.detached:
+                # UDP ASSOCIATE：数据由UDP转发器处理，无需TCP转发
+                return True
+            
+            # 客户端未等待响应就发来的首包数据
+            pipelined = self._forward_pipelined()
+            self.bytes_up += pipelined
+            if pipelined and self.metrics:
+                self.metrics.bytes_up.inc(pipelined)
             
             # 3. 转发阶段 - 双向转发数据
-            self._relay_data()
+            if self.relay_mode == 'splice' and splice_available():
+                self._relay_splice()
+            else:
+                self._relay_data()
+            self._log_summary()
             
             return True
             
@@ -84,6 +193,33 @@ class Socks5ProxyHandler:
         finally:
             self._close_connections()
     
+    def _negotiate(self):
+        """
+        按第一个字节识别协议，完成握手和请求阶段（已读取的数据留在接收缓冲区中）
+        
+        Returns:
+            bool: 是否已连接目标（或建立了UDP关联）
+        """
+        if not self._recv_buffer:
+            data = self.client_socket.recv(RECV_CHUNK)
+            if not data:
+                return False
+            self._recv_buffer += data
+        protocol = sniff_protocol(self._recv_buffer[0])
+        if protocol not in self.protocols:
+            self.logger.warning(f"[{self.client_id}] 不支持的协议(首字节 0x{self._recv_buffer[0]:02x})")
+            return False
+        self.protocol = protocol
+        if self.metrics:
+            self.metrics.protocol(protocol)
+        
+        if protocol == 'socks4':
+            return self._handle_socks4()
+        if protocol == 'http':
+            return self._handle_http()
+        # SOCKS5：握手阶段协商认证方法，请求阶段处理连接请求
+        return self._handshake() and self._handle_request()
+    
     def _handshake(self):
         """
         SOCKS5握手 - 协商认证方法
@@ -94,45 +230,106 @@ class Socks5ProxyHandler:
         try:
             # 接收客户端握手请求
             # 格式: VER | NMETHODS | METHODS
-            data = self.client_socket.recv(257)
-            if len(data) < 2:
+            greeting = self._read_message(parse_greeting)
+            if greeting is None:
                 self.logger.warning(f"[{self.client_id}] 握手数据不完整")
                 return False
+            methods = greeting[0]
             
-            version = data[0]
-            nmethods = data[1]
-            
-            # 检查版本
-            if version != self.SOCKS_VERSION:
-                self.logger.warning(f"[{self.client_id}] 不支持的SOCKS版本: {version}")
-                return False
-            
-            # 检查方法列表长度
-            if len(data) < 2 + nmethods:
-                self.logger.warning(f"[{self.client_id}] 方法列表不完整")
-                return False
-            
-            methods = data[2:2+nmethods]
+            # 配置了凭据文件时只接受用户名/密码认证
+            if self.credentials:
+                if self.AUTH_USERNAME_PASSWORD not in methods:
+                    response = struct.pack('!BB', self.SOCKS_VERSION, self.AUTH_NO_ACCEPTABLE)
+                    self.client_socket.sendall(response)
+                    self.logger.warning(f"[{self.client_id}] 客户端不支持用户名/密码认证")
+                    return False
+                response = struct.pack('!BB', self.SOCKS_VERSION, self.AUTH_USERNAME_PASSWORD)
+                self.client_socket.sendall(response)
+                return self._authenticate()
             
             # 选择认证方法（这里使用无认证）
             if self.AUTH_NO_AUTH in methods:
                 # 发送选择的认证方法
                 # 格式: VER | METHOD
                 response = struct.pack('!BB', self.SOCKS_VERSION, self.AUTH_NO_AUTH)
-                self.client_socket.send(response)
+                self.client_socket.sendall(response)
                 self.logger.debug(f"[{self.client_id}] SOCKS5握手成功，使用无认证模式")
                 return True
             else:
                 # 没有可接受的认证方法
                 response = struct.pack('!BB', self.SOCKS_VERSION, self.AUTH_NO_ACCEPTABLE)
-                self.client_socket.send(response)
+                self.client_socket.sendall(response)
                 self.logger.warning(f"[{self.client_id}] 没有可接受的认证方法")
                 return False
-                
+        
+        except ProtocolError as e:
+            self.logger.warning(f"[{self.client_id}] {e}")
+            return False
         except Exception as e:
             self.logger.error(f"[{self.client_id}] 握手异常: {e}")
             return False
     
+    def _authenticate(self):
+        """
+        用户名/密码认证子协商（RFC 1929）
+        
+        Returns:
+            bool: 认证是否通过
+        """
+        # 格式: VER | ULEN | UNAME | PLEN | PASSWD
+        request = self._read_message(parse_auth_request)
+        if request is None:
+            self.logger.warning(f"[{self.client_id}] 认证数据不完整")
+            return False
+        username, password = request
+        
+        ok = self._check_credentials(username, password)
+        # 格式: VER | STATUS，STATUS 为0表示成功
+        self.client_socket.sendall(struct.pack('!BB', AUTH_VERSION, 0 if ok else 1))
+        return ok
+    
+    def _check_credentials(self, username, password):
+        """
+        验证用户名和密码，通过时记录用户的连接
+        
+        Returns:
+            bool: 认证是否通过
+        """
+        if not self.credentials.authenticate(username, password):
+            self.logger.warning(f"[{self.client_id}] 用户认证失败: {username}")
+            return False
+        self.username = username
+        self.credentials.session_started(username)
+        self.logger.debug(f"[{self.client_id}] 用户认证成功: {username}")
+        return True
+    
+    def _read_message(self, parser):
+        """
+        从接收缓冲区解析一条完整消息，数据不足时才继续recv
+        
+        一次recv可能同时收到问候、请求以及之后的首包数据，多余的字节留在缓冲区中，
+        供下一条消息使用或在连接建立后转发给目标。
+        
+        Args:
+            parser: parse_greeting 或 parse_request
+            
+        Returns:
+            tuple: 解析结果（不含消耗的字节数），客户端提前关闭时返回None
+            
+        Raises:
+            ProtocolError: 数据格式错误
+        """
+        buf = self._recv_buffer
+        while True:
+            result = parser(buf)
+            if result is not None:
+                del buf[:result[-1]]
+                return result[:-1]
+            data = self.client_socket.recv(RECV_CHUNK)
+            if not data:
+                return None
+            buf += data
+    
     def _handle_request(self):
         """
         处理SOCKS5请求
@@ -143,89 +340,191 @@ class Socks5ProxyHandler:
         try:
             # 接收客户端请求
             # 格式: VER | CMD | RSV | ATYP | DST.ADDR | DST.PORT
-            data = self.client_socket.recv(4)
-            if len(data) < 4:
+            try:
+                request = self._read_message(parse_request)
+            except ProtocolError as e:
+                self.logger.warning(f"[{self.client_id}] {e}")
+                self._send_reply(e.reply)
+                return False
+            if request is None:
                 self.logger.warning(f"[{self.client_id}] 请求数据不完整")
                 self._send_reply(self.REP_GENERAL_FAILURE)
                 return False
+            cmd, dst_addr, dst_port = request
             
-            version = data[0]
-            cmd = data[1]
-            # rsv = data[2]  # 保留字段
-            atyp = data[3]
-            
-            # 检查版本
-            if version != self.SOCKS_VERSION:
-                self.logger.warning(f"[{self.client_id}] 不支持的SOCKS版本: {version}")
-                self._send_reply(self.REP_GENERAL_FAILURE)
-                return False
+            if cmd == self.CMD_UDP_ASSOCIATE and self.udp_relay:
+                # DST.ADDR/DST.PORT 为客户端将要发送UDP数据报的源地址，可以全为0
+                return self._associate_udp(dst_port)
             
-            # 目前只支持CONNECT命令
+            # 其余只支持CONNECT命令
             if cmd != self.CMD_CONNECT:
                 self.logger.warning(f"[{self.client_id}] 不支持的命令: {cmd}")
                 self._send_reply(self.REP_COMMAND_NOT_SUPPORTED)
                 return False
             
-            # 解析目标地址
-            dst_addr, dst_port = self._parse_address(atyp)
-            if not dst_addr or not dst_port:
-                self.logger.warning(f"[{self.client_id}] 无法解析目标地址")
+            if not dst_port:
+                self.logger.warning(f"[{self.client_id}] 无效的目标端口")
                 self._send_reply(self.REP_ADDRESS_TYPE_NOT_SUPPORTED)
                 return False
             
-            self.logger.info(f"[{self.client_id}] SOCKS5请求连接到: {dst_addr}:{dst_port}")
+            return self._open_target(dst_addr, dst_port)
             
-            # 连接到目标服务器
-            if not self._connect_to_target(dst_addr, dst_port):
+        except Exception as e:
+            self.logger.error(f"[{self.client_id}] 处理请求异常: {e}")
+            self._send_reply(self.REP_GENERAL_FAILURE)
+            return False
+    
+    def _handle_socks4(self):
+        """
+        处理SOCKS4/4a请求（只支持CONNECT；SOCKS4无法携带密码，启用认证时拒绝）
+        
+        Returns:
+            bool: 请求是否成功处理
+        """
+        try:
+            # 格式: VN | CD | DSTPORT | DSTIP | USERID | NUL [| 域名 | NUL]
+            try:
+                request = self._read_message(parse_socks4_request)
+            except ProtocolError as e:
+                self.logger.warning(f"[{self.client_id}] {e}")
+                self._send_reply(e.reply)
                 return False
+            if request is None:
+                self.logger.warning(f"[{self.client_id}] 请求数据不完整")
+                return False
+            cmd, dst_addr, dst_port, _ = request
             
-            # 发送成功响应
-            self._send_reply(self.REP_SUCCESS, dst_addr, dst_port)
-            self.logger.info(f"[{self.client_id}] 成功连接到目标服务器: {dst_addr}:{dst_port}")
+            if self.credentials:
+                self.logger.warning(f"[{self.client_id}] 已启用用户名/密码认证，拒绝SOCKS4请求")
+                self._send_reply(self.REP_CONNECTION_NOT_ALLOWED)
+                return False
+            if cmd != SOCKS4_CMD_CONNECT:
+                self.logger.warning(f"[{self.client_id}] 不支持的SOCKS4命令: {cmd}")
+                self._send_reply(self.REP_COMMAND_NOT_SUPPORTED)
+                return False
+            if not dst_port:
+                self.logger.warning(f"[{self.client_id}] 无效的目标端口")
+                self._send_reply(self.REP_ADDRESS_TYPE_NOT_SUPPORTED)
+                return False
             
-            return True
+            return self._open_target(dst_addr, dst_port)
             
         except Exception as e:
             self.logger.error(f"[{self.client_id}] 处理请求异常: {e}")
             self._send_reply(self.REP_GENERAL_FAILURE)
             return False
     
-    def _parse_address(self, atyp):
+    def _handle_http(self):
         """
-        解析目标地址
+        处理HTTP代理请求：CONNECT 建立隧道；绝对URI请求改写后连同已收到的正文转发给目标，
+        之后目标的响应原样转发给客户端
         
-        Args:
-            atyp: 地址类型
-            
         Returns:
-            tuple: (地址, 端口)
+            bool: 请求是否成功处理
         """
         try:
-            if atyp == self.ADDR_IPV4:
-                # IPv4地址: 4字节
-                addr_data = self.client_socket.recv(4)
-                addr = socket.inet_ntoa(addr_data)
-            elif atyp == self.ADDR_DOMAIN:
-                # 域名: 1字节长度 + 域名
-                addr_len = ord(self.client_socket.recv(1))
-                addr = self.client_socket.recv(addr_len).decode('utf-8')
-            elif atyp == self.ADDR_IPV6:
-                # IPv6地址: 16字节
-                addr_data = self.client_socket.recv(16)
-                addr = socket.inet_ntop(socket.AF_INET6, addr_data)
-            else:
-                self.logger.warning(f"[{self.client_id}] 不支持的地址类型: {atyp}")
-                return None, None
+            try:
+                request = self._read_message(parse_http_request)
+            except ProtocolError as e:
+                self.logger.warning(f"[{self.client_id}] {e}")
+                self._send_reply(e.reply)
+                return False
+            if request is None:
+                self.logger.warning(f"[{self.client_id}] 请求数据不完整")
+                return False
+            _, dst_addr, dst_port, head, auth = request
             
-            # 端口: 2字节
-            port_data = self.client_socket.recv(2)
-            port = struct.unpack('!H', port_data)[0]
+            # 配置了凭据文件时要求 Proxy-Authorization: Basic
+            if self.credentials and (auth is None or not self._check_credentials(*auth)):
+                self.client_socket.sendall(http_auth_required())
+                return False
             
-            return addr, port
+            if head is not None:
+                # 改写后的请求头放在早发数据之前，连接目标后一起转发
+                self._recv_buffer[:0] = head
+                self.http_forward = True
+            return self._open_target(dst_addr, dst_port)
             
         except Exception as e:
-            self.logger.error(f"[{self.client_id}] 解析地址异常: {e}")
-            return None, None
+            self.logger.error(f"[{self.client_id}] 处理请求异常: {e}")
+            self._send_reply(self.REP_GENERAL_FAILURE)
+            return False
+    
+    def _open_target(self, dst_addr, dst_port):
+        """
+        检查规则并连接目标，成功后回复客户端（各协议共用）
+        
+        Args:
+            dst_addr: 目标地址
+            dst_port: 目标端口
+            
+        Returns:
+            bool: 是否连接成功
+        """
+        self.logger.info(f"[{self.client_id}] {PROTOCOL_NAMES[self.protocol]}请求连接到: {dst_addr}:{dst_port}")
+        
+        if self.rules:
+            self.route = self.rules.check(dst_addr, dst_port)
+            if self.route and self.route.action == DENY:
+                self.logger.warning(f"[{self.client_id}] 规则拒绝连接: {dst_addr}:{dst_port}（{self.route.rule}）")
+                self._send_reply(self.REP_CONNECTION_NOT_ALLOWED)
+                return False
+        
+        # 连接到目标服务器
+        connect_started = time.monotonic()
+        if self.metrics:
+            self.metrics.handshake_seconds.observe(connect_started - self.started_at)
+        if not self._connect_to_target(dst_addr, dst_port):
+            return False
+        
+        # 发送成功响应（BND.ADDR/BND.PORT 为代理连接目标时使用的本地地址）
+        bind_addr, bind_port = self._get_bind_address()
+        self._send_reply(self.REP_SUCCESS, bind_addr, bind_port)
+        self.replied_at = time.monotonic()
+        if self.metrics:
+            self.metrics.connect_seconds.observe(self.replied_at - connect_started)
+        self.logger.info(f"[{self.client_id}] 成功连接到目标服务器: {dst_addr}:{dst_port}")
+        
+        return True
+    
+    def _forward_pipelined(self):
+        """
+        把客户端在收到响应前就发来的数据转发给目标
+        
+        Returns:
+            int: 转发的字节数
+        """
+        data = self._recv_buffer
+        if not data:
+            return 0
+        n = len(data)
+        self.remote_socket.sendall(data)
+        self._recv_buffer = bytearray()
+        if self.trace:
+            self.logger.debug("[%s] 转发早发数据 %d 字节", self.client_id, n)
+        return n
+    
+    def _associate_udp(self, client_port):
+        """
+        建立UDP关联，并把客户端连接交给UDP转发器
+        
+        Args:
+            client_port: 客户端声明的UDP源端口（0表示未知）
+            
+        Returns:
+            bool: 是否成功建立
+        """
+        association = self.udp_relay.create_association(self.client_socket, self.client_id, client_port)
+        if association is None:
+            self.logger.warning(f"[{self.client_id}] UDP关联数已达上限")
+            self._send_reply(self.REP_GENERAL_FAILURE)
+            return False
+        
+        bind_addr, bind_port = association.sock.getsockname()[:2]
+        self._send_reply(self.REP_SUCCESS, bind_addr, bind_port)
+        self.udp_relay.attach(association)
+        self.detached = True
+        return True
     
     def _connect_to_target(self, addr, port):
         """
@@ -239,11 +538,12 @@ class Socks5ProxyHandler:
             bool: 连接是否成功
         """
         try:
-            self.remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.remote_socket.settimeout(10)
-            self.remote_socket.connect((addr, port))
-            self.remote_socket.settimeout(None)
-            return True
+            if self.paths and not (self.route and self.route.action == ROUTE):
+                self.path_key = destination_key(addr)
+                self.remote_socket = self._connect_learned(addr, port)
+            else:
+                self.remote_socket = self._connect_direct(addr, port)
+            return self.remote_socket is not None
             
         except socket.timeout:
             self.logger.warning(f"[{self.client_id}] 连接目标超时: {addr}:{port}")
@@ -257,73 +557,251 @@ class Socks5ProxyHandler:
             self.logger.warning(f"[{self.client_id}] 无法解析主机: {addr}")
             self._send_reply(self.REP_HOST_UNREACHABLE)
             return False
+        except OSError as e:
+            if e.errno == errno.ENETUNREACH:
+                self.logger.warning(f"[{self.client_id}] 网络不可达: {addr}:{port}")
+                self._send_reply(self.REP_NETWORK_UNREACHABLE)
+            elif e.errno == errno.EHOSTUNREACH:
+                self.logger.warning(f"[{self.client_id}] 主机不可达: {addr}:{port}")
+                self._send_reply(self.REP_HOST_UNREACHABLE)
+            else:
+                self.logger.error(f"[{self.client_id}] 连接目标异常: {e}")
+                self._send_reply(self.REP_GENERAL_FAILURE)
+            return False
         except Exception as e:
             self.logger.error(f"[{self.client_id}] 连接目标异常: {e}")
             self._send_reply(self.REP_GENERAL_FAILURE)
             return False
     
+    def _connect_direct(self, addr, port):
+        """
+        直连目标（经出口池选择的出口或默认路由）
+        
+        Returns:
+            socket.socket: 已连接的socket，规则拒绝等已回复客户端的情况返回None
+        """
+        addresses = resolve_addresses(addr, self.resolver)
+        if self.rules and self.route is None:
+            # 域名没有匹配的规则时按解析得到的每个地址检查
+            addresses, self.route = self.rules.filter_addresses(addresses, port)
+            if not addresses:
+                self.logger.warning(f"[{self.client_id}] 规则拒绝连接: {addr}:{port}（{self.route.rule}）")
+                self._send_reply(self.REP_CONNECTION_NOT_ALLOWED)
+                return None
+        if self.uplinks:
+            self.uplink = self.uplinks.choose(self.route, self.client_id.rsplit(':', 1)[0])
+        if self.uplink:
+            # 出口的源地址只能用于同一地址族的目标地址
+            addresses = self.uplink.filter_addresses(addresses)
+            if not addresses:
+                self.logger.warning(f"[{self.client_id}] 出口 {self.uplink.name} 没有可用的同族地址: {addr}")
+                self._send_reply(self.REP_NETWORK_UNREACHABLE)
+                return None
+            self.logger.debug(f"[{self.client_id}] 使用出口: {self.uplink.name}")
+        # 各地址交替竞速连接，每个尝试单独计时
+        with self._measure_uplink():
+            return create_connection(
+                addresses, port,
+                attempt_timeout=SOCKS5_CONFIG['connect_attempt_timeout'],
+                attempt_delay=SOCKS5_CONFIG['connect_attempt_delay'],
+                prefer_ipv6=SOCKS5_CONFIG['prefer_ipv6'],
+                prepare=self._prepare_upstream,
+            )
+    
+    def _connect_upstream(self, addr, port):
+        """
+        经上游代理连接目标（域名由上游代理解析；域名没有匹配的规则时先在本地解析，按地址检查规则）
+        
+        Returns:
+            socket.socket: 已建立隧道的socket，规则拒绝时返回None
+        """
+        if self.rules and self.route is None:
+            addresses, self.route = self.rules.filter_addresses(resolve_addresses(addr, self.resolver), port)
+            if not addresses:
+                self.logger.warning(f"[{self.client_id}] 规则拒绝连接: {addr}:{port}（{self.route.rule}）")
+                self._send_reply(self.REP_CONNECTION_NOT_ALLOWED)
+                return None
+        upstream = self.paths.upstream
+        self.logger.debug(f"[{self.client_id}] 经上游代理 {upstream.name} 连接")
+        return upstream.connect(
+            addr, port, resolve_addresses(upstream.host, self.resolver),
+            timeout=SOCKS5_CONFIG['connect_attempt_timeout'],
+            attempt_delay=SOCKS5_CONFIG['connect_attempt_delay'],
+            prepare=self._prepare_upstream,
+        )
+    
+    def _connect_learned(self, addr, port):
+        """
+        按路径表选择直连或经上游代理连接目标，建连失败时改走另一条路径
+        
+        Returns:
+            socket.socket: 已连接的socket，规则拒绝等已回复客户端的情况返回None
+        """
+        path = self.paths.choose(self.path_key)
+        retry = True
+        while True:
+            started = time.monotonic()
+            try:
+                if path == UPSTREAM:
+                    sock = self._connect_upstream(addr, port)
+                else:
+                    sock = self._connect_direct(addr, port)
+            except ConnectionRefusedError:
+                # 目标拒绝连接说明经这条路径可以到达目标
+                raise
+            except OSError as e:
+                self.paths.record_failure(self.path_key, path)
+                if not retry:
+                    raise
+                retry = False
+                if self.uplink:
+                    self.uplinks.release(self.uplink)
+                    self.uplink = None
+                self.logger.warning(
+                    f"[{self.client_id}] 经{PATH_NAMES[path]}连接 {addr}:{port} 失败（{e}），"
+                    f"改走{PATH_NAMES[other_path(path)]}"
+                )
+                path = other_path(path)
+                continue
+            if sock is not None:
+                self.path = path
+                self.paths.record_connect(self.path_key, path, time.monotonic() - started)
+            return sock
+    
+    def _prepare_upstream(self, sock, family):
+        """connect之前设置上游socket：TCP调优和出口源地址"""
+        if self.tcp_profile:
+            self.tcp_profile.prepare_upstream(sock, family)
+        if self.uplink:
+            self.uplink.bind(sock)
+    
+    def _measure_uplink(self):
+        """记录经出口建连的耗时或失败，未使用出口时不记录"""
+        if self.uplink is None:
+            return contextlib.nullcontext()
+        return self.uplinks.measure(self.uplink)
+    
+    def _get_bind_address(self):
+        """
+        获取连接目标时使用的本地地址（用于成功响应的 BND.ADDR/BND.PORT）
+        
+        Returns:
+            tuple: (地址, 端口)
+        """
+        return self.remote_socket.getsockname()[:2]
+    
     def _send_reply(self, reply, bind_addr='0.0.0.0', bind_port=0):
         """
-        发送SOCKS5响应
+        发送响应（SOCKS4/HTTP连接按对应协议的格式回复）
         
         Args:
-            reply: 响应代码
+            reply: SOCKS5响应代码
             bind_addr: 绑定地址（默认0.0.0.0）
             bind_port: 绑定端口（默认0）
         """
+        if self.metrics:
+            self.metrics.reply(reply)
         try:
+            if self.protocol == 'socks4':
+                response = socks4_reply(reply, bind_addr, bind_port)
+            elif self.protocol == 'http':
+                if reply == self.REP_SUCCESS and self.http_forward:
+                    # 绝对URI请求由目标的响应回复客户端
+                    return
+                response = http_reply(reply)
             # 格式: VER | REP | RSV | ATYP | BND.ADDR | BND.PORT
-            response = struct.pack('!BBB', self.SOCKS_VERSION, reply, 0)
-            
-            # 添加绑定地址（使用IPv4）
-            response += struct.pack('!B', self.ADDR_IPV4)
-            response += socket.inet_aton(bind_addr)
-            response += struct.pack('!H', bind_port)
-            
-            self.client_socket.send(response)
+            elif ':' in bind_addr:
+                response = self._REPLY_IPV6.pack(
+                    self.SOCKS_VERSION, reply, 0, self.ADDR_IPV6,
+                    socket.inet_pton(socket.AF_INET6, bind_addr), bind_port
+                )
+            else:
+                response = self._REPLY_IPV4.pack(
+                    self.SOCKS_VERSION, reply, 0, self.ADDR_IPV4,
+                    socket.inet_aton(bind_addr), bind_port
+                )
+            self.client_socket.sendall(response)
             
         except Exception as e:
             self.logger.error(f"[{self.client_id}] 发送响应异常: {e}")
     
     def _relay_data(self):
-        """双向转发数据"""
+        """双向转发数据（每个方向一个自适应读缓冲区）"""
+        up = AdaptiveBuffer(self.buffer_pool)
+        down = AdaptiveBuffer(self.buffer_pool)
+        pool = self.buffer_pool
+        tune = self.tcp_profile.tune_relay_buffers if self.tcp_profile else None
+        
         try:
-            self.logger.info(f"[{self.client_id}] 开始转发数据")
-            
             # 使用select实现双向数据转发
             sockets = [self.client_socket, self.remote_socket]
+            # 被限速的方向暂停读取: socket -> 恢复读取的时间
+            paused = {}
+            metrics = self.metrics
+            first_byte = metrics is not None or self.path is not None
+            # 逐包日志只在开启了跟踪且DEBUG级别可用时记录，默认转发路径上不调用日志
+            trace = self.trace and self.logger.is_enabled()
             
             while True:
+                watch, timeout = sockets, 60
+                if paused:
+                    now = time.monotonic()
+                    for sock, until in list(paused.items()):
+                        if until <= now:
+                            del paused[sock]
+                    if paused:
+                        watch = [sock for sock in sockets if sock not in paused]
+                        timeout = max(0.0, min(paused.values()) - now)
+                
                 # 等待任一socket有数据可读
-                readable, _, exceptional = select.select(sockets, [], sockets, 60)
+                readable, _, exceptional = select.select(watch, [], watch, timeout)
                 
                 if exceptional:
                     self.logger.debug(f"[{self.client_id}] Socket异常，停止转发")
                     break
                 
                 if not readable:
-                    # 超时，发送心跳检测
+                    # 超时后继续等待，空闲连接由回收器关闭
                     continue
                 
                 for sock in readable:
                     try:
-                        # 从一个socket读取数据
-                        data = sock.recv(8192)
-                        
-                        if not data:
-                            # 连接关闭
-                            self.logger.debug(f"[{self.client_id}] 连接关闭")
-                            return
-                        
                         # 转发到另一个socket
                         if sock is self.client_socket:
                             # 客户端 -> 远程服务器
-                            self.remote_socket.sendall(data)
-                            self.logger.debug(f"[{self.client_id}] 转发 {len(data)} 字节: 客户端->远程")
+                            buf, dst = up, self.remote_socket
+                            n = self._forward_chunk(sock, dst, buf.buf, buf.view)
+                            self.bytes_up += n
+                            if metrics:
+                                metrics.bytes_up.inc(n)
                         else:
                             # 远程服务器 -> 客户端
-                            self.client_socket.sendall(data)
-                            self.logger.debug(f"[{self.client_id}] 转发 {len(data)} 字节: 远程->客户端")
+                            buf, dst = down, self.client_socket
+                            n = self._forward_chunk(sock, dst, buf.buf, buf.view)
+                            self.bytes_down += n
+                            if metrics:
+                                metrics.bytes_down.inc(n)
+                            if first_byte and n:
+                                first_byte = False
+                                self._first_byte(time.monotonic() - self.replied_at)
+                        
+                        if not n:
+                            # 连接关闭
+                            return
+                        if trace:
+                            self.logger.debug(
+                                "[%s] 转发 %d 字节: %s", self.client_id, n,
+                                "客户端->远程" if sock is self.client_socket else "远程->客户端"
+                            )
+                        
+                        # 读缓冲区升到最大（大流量）或降到最小（交互流量）时同步调整收发缓冲区
+                        if buf.record(n) and tune and buf.size in (pool.min_size, pool.max_size):
+                            tune(sock, dst, buf.size)
+                        
+                        if self.shaper:
+                            delay = self.shaper.throttle(sock is self.client_socket, n)
+                            if delay:
+                                paused[sock] = time.monotonic() + delay
                     
                     except Exception as e:
                         self.logger.error(f"[{self.client_id}] 转发数据异常: {e}")
@@ -331,6 +809,91 @@ class Socks5ProxyHandler:
         
         except Exception as e:
             self.logger.error(f"[{self.client_id}] 数据转发异常: {e}")
+        finally:
+            up.close()
+            down.close()
+    
+    @staticmethod
+    def _forward_chunk(src, dst, buf, view):
+        """
+        从src读取一块数据并完整写入dst，不产生新的bytes对象
+        
+        Args:
+            src: 可读的源socket
+            dst: 目标socket
+            buf: 读缓冲区
+            view: buf 的 memoryview
+            
+        Returns:
+            int: 转发的字节数，0表示源端已关闭
+        """
+        n = src.recv_into(buf)
+        if n:
+            # sendall 在内部处理部分发送，直接发送切片视图，不复制数据
+            dst.sendall(view[:n])
+        return n
+    
+    def _relay_splice(self):
+        """双向转发数据（splice零拷贝模式）"""
+        try:
+            throttle = self.shaper.throttle if self.shaper else None
+            relay = self._splice_relay = SpliceRelay(self.client_socket, self.remote_socket, throttle=throttle)
+            try:
+                relay.run()
+            finally:
+                self.bytes_up += relay.bytes_a_to_b
+                self.bytes_down += relay.bytes_b_to_a
+                if self.metrics:
+                    # splice 模式在连接结束时一次性计入流量
+                    self.metrics.bytes_up.inc(relay.bytes_a_to_b)
+                    self.metrics.bytes_down.inc(relay.bytes_b_to_a)
+                if relay.first_b_to_a_at is not None:
+                    self._first_byte(relay.first_b_to_a_at - self.replied_at)
+        except Exception as e:
+            self.logger.error(f"[{self.client_id}] 数据转发异常: {e}")
+    
+    def _first_byte(self, elapsed):
+        """记录从回复客户端到收到目标第一个字节的耗时（指标和路径表）"""
+        if self.metrics:
+            self.metrics.first_byte_seconds.observe(elapsed)
+        if self.path is not None:
+            self.paths.record_first_byte(self.path_key, self.path, elapsed)
+    
+    def _log_summary(self):
+        """连接结束时记录一条汇总日志（代替逐包日志）"""
+        if not self.logger.is_enabled(logging.INFO):
+            return
+        self.logger.info(
+            "[%s] 连接关闭，上行 %d 字节，下行 %d 字节，耗时 %.3f 秒",
+            self.client_id, self.bytes_up, self.bytes_down, time.monotonic() - (self.replied_at or self.started_at)
+        )
+    
+    def progress(self):
+        """
+        已转发的字节总数（回收器据此判断连接是否空闲）
+        
+        Returns:
+            int: 字节数，只要求有数据转发时发生变化
+        """
+        moved = self.bytes_up + self.bytes_down
+        relay = self._splice_relay
+        if relay is not None:
+            moved += relay.bytes_a_to_b + relay.bytes_b_to_a
+        return moved
+    
+    def abort(self):
+        """
+        中止连接（可在其他线程中调用）
+        
+        只关闭读写方向而不释放socket，阻塞在select/recv上的处理线程会被唤醒，
+        socket仍由处理线程关闭。
+        """
+        for sock in (self.client_socket, self.remote_socket):
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
     
     def _close_connections(self):
         """关闭所有连接"""
@@ -339,6 +902,9 @@ class Socks5ProxyHandler:
                 self.remote_socket.close()
             except:
                 pass
+        if self.uplink:
+            self.uplinks.release(self.uplink)
+            self.uplink = None
         
         # 注意：不关闭client_socket，由调用方管理
 
@@ -346,65 +912,439 @@ class Socks5ProxyHandler:
 class Socks5ProxyServer:
     """SOCKS5代理服务器（独立运行版）"""
     
-    def __init__(self, host='0.0.0.0', port=1080):
+    def __init__(self, host='0.0.0.0', port=1080, relay_mode=None,
+                 backlog=None, accept_batch=None, reuse_port=False, buffer_pool=None,
+                 admission=None, metrics_port=None, tcp_profile=None, credentials=None, rules=None,
+                 listener=None, uplinks=None, unix_listener=None, paths=None):
         """
         初始化SOCKS5代理服务器
         
         Args:
             host: 监听地址
             port: 监听端口
+            relay_mode: 转发模式，'copy' 或 'splice'（默认读取SOCKS5_CONFIG）
+            backlog: 监听队列长度（默认读取SOCKS5_CONFIG）
+            accept_batch: 每次唤醒最多连续接受的连接数（默认读取SOCKS5_CONFIG）
+            reuse_port: 是否设置SO_REUSEPORT，允许多个进程绑定同一端口
+            buffer_pool: 所有连接共享的自适应转发缓冲区池 AdaptiveBufferPool（默认按SOCKS5_CONFIG新建）
+            admission: 连接准入控制器（默认按SOCKS5_CONFIG新建一个）
+            metrics_port: 指标HTTP端口（默认读取SOCKS5_CONFIG，0表示不启动）
+            tcp_profile: TCP调优配置名称或 TcpProfile（默认读取SOCKS5_CONFIG）
+            credentials: 凭据存储 CredentialStore（默认按SOCKS5_CONFIG['auth_file']加载，未配置时不认证）
+            rules: 目标地址规则引擎 RuleEngine（默认按SOCKS5_CONFIG['rules_file']加载，未配置时不检查）
+            listener: 已经在监听的socket（从旧进程或systemd继承，见 common.lifecycle），指定时不再绑定端口
+            uplinks: 出口池 UplinkPool（默认按SOCKS5_CONFIG['outbounds']创建，未定义出口时使用默认路由）
+            unix_listener: 同时监听的Unix域socket UnixListener（默认按SOCKS5_CONFIG['unix_socket']创建，
+                           False表示不监听）
+            paths: 直连/上游代理路径选择器 PathSelector（默认按SOCKS5_CONFIG['upstream_proxy']创建，
+                   未配置上游代理或为False时总是直连）
         """
         self.host = host
         self.port = port
+        self.listener = listener
+        self.tcp_profile = tcp_profile if isinstance(tcp_profile, TcpProfile) else get_profile(tcp_profile)
+        self.relay_mode = relay_mode or SOCKS5_CONFIG['relay_mode']
+        self.backlog = backlog or SOCKS5_CONFIG['listen_backlog']
+        self.accept_batch = accept_batch or SOCKS5_CONFIG['accept_batch']
+        self.reuse_port = reuse_port
+        self.buffer_pool = buffer_pool or AdaptiveBufferPool()
         self.logger = Logger('Socks5ProxyServer', 'socks5_proxy')
         self.server_socket = None
+        # 同机客户端的Unix域监听，与TCP监听共用同一套处理流程
+        self.unix_listener = load_unix_listener(self.logger) if unix_listener is None else unix_listener or None
+        self.unix_socket = None
         self.running = False
+        # 平滑退出时先停止接受新连接，running 保持为True直到所有连接结束
+        self.accepting = False
+        
+        # 处理中（含排队）的连接，平滑退出时等待它们结束
+        self._active = set()
+        self._active_cond = threading.Condition()
+        
+        # 准入控制：max_handlers 为0时保持每连接一个线程，否则使用有上限的线程池
+        self.admission = admission or AdmissionController()
+        self.worker_pool = None
+        if self.admission.max_handlers:
+            self.worker_pool = WorkerPool(self.admission.max_handlers, logger=self.logger)
+        
+        # 所有连接共享的DNS缓存
+        self.resolver = DnsResolver(logger=self.logger) if SOCKS5_CONFIG['dns_cache_enabled'] else None
+        
+        # 全局/客户端IP/连接三级限速，可通过 self.shaper.set_limits() 在运行中修改
+        self.shaper = BandwidthShaper()
+        
+        # 用户名/密码认证
+        self.credentials = credentials or load_credentials(logger=self.logger)
+        
+        # 目标地址规则（允许/拒绝/出口）
+        self.rules = rules or load_rules(logger=self.logger)
+        
+        # 多出口均衡
+        self.uplinks = uplinks or load_uplinks(logger=self.logger)
+        
+        # 按目标学习直连还是经上游代理更快
+        self.paths = load_path_selector(self.logger) if paths is None else paths or None
+        
+        # 逐包调试日志只对 LOG_CONFIG['trace_clients'] 中的客户端开启
+        self.trace_match = packet_trace_matcher()
+        
+        # 握手超时和空闲超时（所有连接共用一个时间轮）
+        self.reaper = create_reaper(logger=self.logger)
+        
+        # 指标（通过本地HTTP端口以Prometheus文本格式提供）
+        self.metrics = ProxyMetrics()
+        self.metrics.bind_admission(self.admission)
+        self.metrics.bind_buffers(self.buffer_pool)
+        if self.resolver:
+            self.metrics.bind_resolver(self.resolver)
+        if self.credentials:
+            self.metrics.bind_credentials(self.credentials)
+        if self.rules:
+            self.metrics.bind_rules(self.rules)
+        if self.reaper:
+            self.metrics.bind_reaper(self.reaper)
+        if self.uplinks:
+            self.metrics.bind_uplinks(self.uplinks)
+        if self.paths:
+            self.metrics.bind_paths(self.paths)
+        self.metrics_server = MetricsServer(self.metrics.registry, port=metrics_port, logger=self.logger)
+        
+        # 所有UDP关联共用一个转发线程
+        self.udp_relay = None
+        if SOCKS5_CONFIG['udp_enabled']:
+            self.udp_relay = UdpRelay(resolver=self.resolver, rules=self.rules, logger=self.logger)
+        
+        # 累计统计
+        self.stats = {'connections': 0, 'bytes_up': 0, 'bytes_down': 0}
+        self._stats_lock = threading.Lock()
         
     def start(self):
         """启动代理服务器"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            if self.listener is not None:
+                # 继承的监听socket：已经绑定并在监听，排队中的连接也一并接手
+                self.server_socket = self.listener
+                self.host, self.port = self.server_socket.getsockname()[:2]
+            else:
+                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port:
+                    self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                self.tcp_profile.tune_listener(self.server_socket)
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen(self.backlog)
+                self.tcp_profile.enable_fastopen(self.server_socket)
+            # 监听socket可能与交接中的另一个进程共享，可读时连接也可能已被对方接受
+            self.server_socket.setblocking(False)
+            if self.unix_listener:
+                self.unix_socket = self.unix_listener.open(self.backlog)
+                self.unix_socket.setblocking(False)
             
             self.running = True
-            self.logger.info(f"SOCKS5代理服务器启动: {self.host}:{self.port}")
+            self.accepting = True
+            if self.resolver:
+                self.resolver.load()
+            if self.paths:
+                self.paths.load()
+            if self.udp_relay:
+                self.udp_relay.start()
+            if self.reaper:
+                self.reaper.start()
+            self.metrics_server.start()
+            self.logger.info(f"SOCKS5代理服务器启动: {self.host}:{self.port}（TCP调优: {self.tcp_profile.name}）")
+            if self.relay_mode == 'splice' and not splice_available():
+                self.logger.warning("当前环境不支持splice，回退到普通转发模式")
             
-            while self.running:
-                client_socket, client_address = self.server_socket.accept()
-                self.logger.info(f"接受连接: {client_address}")
-                
-                # 为每个客户端创建处理线程
-                client_id = f"{client_address[0]}:{client_address[1]}"
-                handler = Socks5ProxyHandler(client_socket, client_id, self.logger)
-                
-                thread = threading.Thread(target=handler.handle, daemon=True)
-                thread.start()
+            while self.running and self.accepting:
+                for client_socket, client_address in self._accept_batch():
+                    local = is_unix(client_socket)
+                    if local:
+                        client_ip, client_id = peer_identity(client_socket)
+                    else:
+                        client_ip = client_address[0]
+                        client_id = f"{client_ip}:{client_address[1]}"
+                    
+                    reason = self.admission.try_admit(client_ip)
+                    if reason:
+                        self._reject(client_socket, client_id, reason)
+                        continue
+                    self.logger.info(f"接受连接: {client_id}")
+                    if not local:
+                        self.tcp_profile.tune_connection(client_socket)
+                    
+                    handler = self._create_handler(client_socket, client_id, client_ip)
+                    if self.reaper:
+                        handler.reap_entry = self.reaper.track(handler.abort, handler.progress)
+                    with self._active_cond:
+                        self._active.add(handler)
+                    args = (handler, client_ip, time.monotonic())
+                    
+                    if self.worker_pool:
+                        # 交给线程池处理，没有空闲线程时排队等待
+                        self.worker_pool.submit(self._serve_client, *args)
+                    else:
+                        # 为每个客户端创建处理线程
+                        thread = threading.Thread(target=self._serve_client, args=args, daemon=True)
+                        thread.start()
         
         except Exception as e:
-            self.logger.error(f"代理服务器异常: {e}")
+            if self.running:
+                self.logger.error(f"代理服务器异常: {e}")
         finally:
-            self.stop()
+            if self.running and not self.accepting:
+                # 平滑退出中：只关闭监听socket，由 drain() 在已有连接结束后停止服务器
+                self._close_listener()
+            else:
+                self.stop()
+    
+    def _create_handler(self, client_socket, client_id, client_ip):
+        """
+        为新连接创建处理器（子类可以替换为其他处理器）
+        
+        Args:
+            client_socket: 客户端socket
+            client_id: 客户端ID
+            client_ip: 客户端IP
+            
+        Returns:
+            Socks5ProxyHandler: 处理器
+        """
+        # Unix域连接的客户端没有可以收发UDP的地址，不支持UDP ASSOCIATE
+        udp_relay = self.udp_relay if client_ip != UNIX_CLIENT_IP else None
+        return Socks5ProxyHandler(
+            client_socket, client_id, self.logger,
+            relay_mode=self.relay_mode, buffer_pool=self.buffer_pool,
+            on_established=self.admission.established, udp_relay=udp_relay,
+            resolver=self.resolver, shaper=self.shaper.attach(client_ip), metrics=self.metrics,
+            tcp_profile=self.tcp_profile, credentials=self.credentials, rules=self.rules,
+            uplinks=self.uplinks, trace=bool(self.trace_match and self.trace_match(client_ip)),
+            paths=self.paths
+        )
+    
+    def _accept_batch(self):
+        """
+        等待新连接（TCP和Unix域监听），并在一次唤醒中尽量多地接受排队的连接
+        
+        Returns:
+            list: [(client_socket, client_address), ...]
+        """
+        listeners = [self.server_socket]
+        if self.unix_socket is not None:
+            listeners.append(self.unix_socket)
+        readable, _, _ = select.select(listeners, [], [], 1.0)
+        accepted = []
+        for listener in readable:
+            while len(accepted) < self.accept_batch:
+                try:
+                    accepted.append(listener.accept())
+                except BlockingIOError:
+                    break
+        return accepted
+    
+    def _serve_client(self, handler, client_ip, enqueued_at):
+        """
+        在工作线程中处理客户端，结束后关闭客户端socket
+        
+        Args:
+            handler: SOCKS5代理处理器
+            client_ip: 客户端IP
+            enqueued_at: 连接被准入的时间（time.monotonic()）
+        """
+        started = False
+        try:
+            started = self.admission.begin(enqueued_at)
+            if not started:
+                self._reject(handler.client_socket, handler.client_id, AdmissionController.REJECT_QUEUE_TIMEOUT)
+                return
+            handler.handle()
+        finally:
+            if handler.reap_entry:
+                handler.reap_entry.done()
+            if not handler.detached:
+                try:
+                    handler.client_socket.close()
+                except OSError:
+                    pass
+            self.admission.release(client_ip, started, handler.established)
+            if handler.shaper:
+                handler.shaper.release()
+            if handler.username:
+                self.credentials.session_ended(handler.username, handler.bytes_up, handler.bytes_down)
+            with self._stats_lock:
+                self.stats['connections'] += 1
+                self.stats['bytes_up'] += handler.bytes_up
+                self.stats['bytes_down'] += handler.bytes_down
+            with self._active_cond:
+                self._active.discard(handler)
+                self._active_cond.notify_all()
+    
+    def _reject(self, client_socket, client_id, reason):
+        """
+        快速拒绝连接：不等待客户端握手，直接回复 REP_GENERAL_FAILURE 并关闭
+        
+        Args:
+            client_socket: 客户端socket
+            client_id: 客户端ID
+            reason: 拒绝原因
+        """
+        self.logger.debug(f"[{client_id}] 拒绝连接: {reason}")
+        try:
+            client_socket.setblocking(False)
+            client_socket.send(Socks5ProxyHandler._REPLY_IPV4.pack(
+                Socks5ProxyHandler.SOCKS_VERSION, Socks5ProxyHandler.REP_GENERAL_FAILURE, 0,
+                Socks5ProxyHandler.ADDR_IPV4, b'\0\0\0\0', 0
+            ))
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+    
+    def get_stats(self):
+        """
+        获取服务器统计信息
+        
+        Returns:
+            dict: 累计连接数、流量，以及处理中/排队/拒绝的连接数
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(self.admission.get_stats())
+        stats['shaping'] = self.shaper.get_stats()
+        stats['tcp_profile'] = self.tcp_profile.name
+        stats['buffers'] = self.buffer_pool.get_stats()
+        if self.credentials:
+            stats['auth'] = self.credentials.get_stats()
+            stats['users'] = self.credentials.get_user_stats()
+        if self.rules:
+            stats['rules'] = self.rules.get_stats()
+        if self.reaper:
+            stats['reaper'] = self.reaper.get_stats()
+        if self.uplinks:
+            stats['uplinks'] = self.uplinks.get_stats()
+        if self.udp_relay:
+            stats['udp'] = self.udp_relay.get_stats()
+        if self.resolver:
+            stats['dns'] = self.resolver.get_stats()
+        if self.paths:
+            stats['paths'] = self.paths.get_stats()
+        return stats
+    
+    def drain(self, timeout=None):
+        """
+        平滑退出：停止接受新连接，等待已有连接结束，超时后中止剩余的连接再停止服务器
+        
+        Args:
+            timeout: 最长等待时间（秒，默认读取SOCKS5_CONFIG['drain_timeout']）
+            
+        Returns:
+            int: 超时后被中止的连接数
+        """
+        timeout = SOCKS5_CONFIG['drain_timeout'] if timeout is None else timeout
+        # 接受循环在下一次唤醒（最多1秒后）退出并关闭监听socket
+        self.accepting = False
+        deadline = time.monotonic() + timeout
+        with self._active_cond:
+            self.logger.info(f"停止接受新连接，等待 {len(self._active)} 个连接结束（最多 {timeout} 秒）")
+            while self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._active_cond.wait(remaining)
+            leftover = list(self._active)
+        
+        if leftover:
+            self.logger.warning(f"平滑退出超时，中止 {len(leftover)} 个连接")
+            for handler in leftover:
+                handler.abort()
+        self.stop()
+        return len(leftover)
+    
+    def listener_fileno(self):
+        """
+        监听socket的文件描述符（交接给新进程时使用）
+        
+        Returns:
+            int: 文件描述符，未在接受连接时返回None
+        """
+        if self.server_socket is None or not self.accepting:
+            return None
+        return self.server_socket.fileno()
     
     def stop(self):
         """停止代理服务器"""
+        was_running = self.running
         self.running = False
+        self.accepting = False
+        if self.worker_pool:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+        if self.udp_relay:
+            self.udp_relay.stop()
+        if self.reaper:
+            self.reaper.stop()
+        self.metrics_server.stop()
+        if self.resolver and was_running:
+            self.resolver.save()
+        if self.paths and was_running:
+            self.paths.save()
+        self._close_listener()
+        self.logger.info("SOCKS5代理服务器已停止")
+    
+    def _close_listener(self):
+        """关闭监听socket（交接给新进程时，新进程持有的副本不受影响）"""
         if self.server_socket:
             try:
                 self.server_socket.close()
             except:
                 pass
-        self.logger.info("SOCKS5代理服务器已停止")
+        if self.unix_listener:
+            # 交接后socket文件已被新进程替换，此时不会删除
+            self.unix_listener.close()
+            self.unix_socket = None
+
+
+def create_proxy_server(host='0.0.0.0', port=1080, engine=None, **options):
+    """
+    按引擎类型创建SOCKS5代理服务器
+    
+    Args:
+        host: 监听地址
+        port: 监听端口
+        engine: 'thread'、'asyncio' 或 'prefork'（默认读取SOCKS5_CONFIG['engine']）
+        **options: 传递给对应服务器类的其他参数
+        
+    Returns:
+        Socks5ProxyServer、AsyncSocks5ProxyServer 或 PreforkSocks5Server 实例
+    """
+    engine = engine or SOCKS5_CONFIG['engine']
+    if engine == 'asyncio':
+        from .socks5_async import AsyncSocks5ProxyServer
+        return AsyncSocks5ProxyServer(host, port, **options)
+    if engine == 'prefork':
+        from .prefork import PreforkSocks5Server
+        return PreforkSocks5Server(host, port, **options)
+    if engine != 'thread':
+        raise ValueError(f"未知的代理服务器引擎: {engine}")
+    return Socks5ProxyServer(host, port, **options)
 
 
 # 用于测试的独立运行
 if __name__ == '__main__':
     import sys
+    from .lifecycle import inherited_listener, run_server
     
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 1080
+    engine = sys.argv[2] if len(sys.argv) > 2 else None
+    
+    # 从systemd或旧进程继承的监听socket
+    listener = inherited_listener()
+    options = {'listener': listener} if listener is not None else {}
+    server = create_proxy_server(port=port, engine=engine, **options)
     
-    server = Socks5ProxyServer(port=port)
+    if hasattr(server, 'drain'):
+        # SIGTERM 平滑退出，SIGUSR2 交接给新进程
+        run_server(server, argv=['-m', 'common.socks5_proxy'] + sys.argv[1:], logger=server.logger)
+        sys.exit(0)
     
     try:
         server.start()
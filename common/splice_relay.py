@@ -0,0 +1,127 @@
+"""
+基于 splice() 的零拷贝转发（仅Linux）
+
+数据经由内核管道在两个socket之间直接搬运，不再复制到Python的bytes对象中，
+可显著降低大流量转发时的CPU占用。运行环境不支持时（非Linux或Python < 3.10）
+由调用方回退到普通的 recv/sendall 转发。
+"""
+
+import os
+import select
+import time
+
+# 每次搬运的最大字节数（Linux默认管道容量为64KB）
+SPLICE_CHUNK = 64 * 1024
+
+
+def splice_available():
+    """
+    检查当前环境是否支持 os.splice
+
+    Returns:
+        bool: 是否可用
+    """
+    return hasattr(os, 'splice') and hasattr(os, 'SPLICE_F_MOVE')
+
+
+class SpliceRelay:
+    """使用内核管道在两个socket之间双向转发数据"""
+
+    def __init__(self, sock_a, sock_b, chunk_size=SPLICE_CHUNK, throttle=None):
+        """
+        初始化转发器
+
+        Args:
+            sock_a: 一端的socket（通常为客户端）
+            sock_b: 另一端的socket（通常为远程服务器）
+            chunk_size: 单次搬运的最大字节数
+            throttle: 可选的限速回调 throttle(a_to_b, n)，返回该方向需要暂停读取的秒数
+        """
+        self.sock_a = sock_a
+        self.sock_b = sock_b
+        self.chunk_size = chunk_size
+        self.throttle = throttle
+        self.bytes_a_to_b = 0
+        self.bytes_b_to_a = 0
+        # 第一次从 sock_b 收到数据的时间（time.monotonic()）
+        self.first_b_to_a_at = None
+        # 每个方向一条管道: fd -> (对端fd, 管道读端, 管道写端)
+        self._routes = {}
+
+    def run(self, timeout=60):
+        """
+        开始双向转发，直到任一方向关闭或出错
+
+        Args:
+            timeout: select超时时间（秒），超时后继续等待
+        """
+        fd_a = self.sock_a.fileno()
+        fd_b = self.sock_b.fileno()
+        pipe_ab = os.pipe()
+        pipe_ba = os.pipe()
+        self._routes = {
+            fd_a: (fd_b, pipe_ab[0], pipe_ab[1]),
+            fd_b: (fd_a, pipe_ba[0], pipe_ba[1]),
+        }
+
+        try:
+            fds = [fd_a, fd_b]
+            # 被限速的方向暂停读取: fd -> 恢复读取的时间
+            paused = {}
+            while True:
+                watch, wait = fds, timeout
+                if paused:
+                    now = time.monotonic()
+                    for fd, until in list(paused.items()):
+                        if until <= now:
+                            del paused[fd]
+                    if paused:
+                        watch = [fd for fd in fds if fd not in paused]
+                        wait = max(0.0, min(paused.values()) - now)
+
+                readable, _, exceptional = select.select(watch, [], watch, wait)
+                if exceptional:
+                    return
+                for fd in readable:
+                    moved = self._transfer(fd)
+                    if moved == 0:
+                        return
+                    if fd == fd_a:
+                        self.bytes_a_to_b += moved
+                    else:
+                        if self.first_b_to_a_at is None:
+                            self.first_b_to_a_at = time.monotonic()
+                        self.bytes_b_to_a += moved
+                    if self.throttle:
+                        delay = self.throttle(fd == fd_a, moved)
+                        if delay:
+                            paused[fd] = time.monotonic() + delay
+        finally:
+            for fd in pipe_ab + pipe_ba:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def _transfer(self, src_fd):
+        """
+        把源socket中当前可读的数据经管道搬运到目标socket
+
+        Args:
+            src_fd: 可读的源socket描述符
+
+        Returns:
+            int: 搬运的字节数，0表示源端已关闭
+        """
+        dst_fd, pipe_r, pipe_w = self._routes[src_fd]
+
+        # socket -> 管道
+        pending = os.splice(src_fd, pipe_w, self.chunk_size, flags=os.SPLICE_F_MOVE)
+        if pending == 0:
+            return 0
+
+        # 管道 -> socket（目标为阻塞socket，写满前会一直等待，语义同sendall）
+        moved = pending
+        while pending > 0:
+            pending -= os.splice(pipe_r, dst_fd, pending, flags=os.SPLICE_F_MOVE)
+        return moved
@@ -0,0 +1,217 @@
+"""
+TCP socket 调优配置
+
+按使用场景预设几组socket选项，分别作用于监听socket、接受的客户端连接和
+连接目标的上游socket：
+
+    interactive        交互流量（网页、SSH）：关闭Nagle，接受客户端的TCP Fast Open，
+                       限制内核中未发送的数据量以降低排队延迟，缓冲区由内核自动调节
+    bulk               大流量下载/上传：保留Nagle合并小包，使用大的固定收发缓冲区
+    low-memory-router  路由器等小内存设备：小的固定缓冲区，限制每个连接占用的内核内存
+    none               不设置任何选项（与之前的行为相同）
+
+某个选项在当前系统上不可用时跳过该选项，不影响其他选项和连接本身。
+
+上游的 TCP Fast Open（TCP_FASTOPEN_CONNECT）在所有预设中都不启用，需要时通过
+SOCKS5_CONFIG['tcp_fastopen_connect'] 或 get_profile(fastopen_connect=True) 显式开启。
+开启后如果内核已缓存目标的cookie，connect() 会立即返回，SYN 随第一块数据一起发出：
+连接目标失败只能表现为之后的读写错误而不是SOCKS5响应代码，Happy Eyeballs 不会
+从不可达的地址回退到下一个地址，出口和路径选择器测得的建连耗时也接近于零。
+"""
+
+import socket
+import sys
+from .config import SOCKS5_CONFIG
+
+# 部分常量在较旧的Python中没有导出，使用Linux上的取值
+_LINUX = sys.platform.startswith('linux')
+TCP_FASTOPEN = getattr(socket, 'TCP_FASTOPEN', 23 if _LINUX else None)
+TCP_FASTOPEN_CONNECT = getattr(socket, 'TCP_FASTOPEN_CONNECT', 30 if _LINUX else None)
+TCP_NOTSENT_LOWAT = getattr(socket, 'TCP_NOTSENT_LOWAT', 25 if _LINUX else None)
+# macOS 上空闲时间选项名为 TCP_KEEPALIVE
+TCP_KEEPIDLE = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+TCP_KEEPINTVL = getattr(socket, 'TCP_KEEPINTVL', None)
+TCP_KEEPCNT = getattr(socket, 'TCP_KEEPCNT', None)
+
+# 各项含义：
+#   nodelay          设置 TCP_NODELAY（关闭Nagle算法）
+#   fastopen         服务端TFO队列长度，0表示不启用
+#   fastopen_connect 上游连接启用TFO
+#   rcvbuf/sndbuf    SO_RCVBUF/SO_SNDBUF（字节），0表示由内核自动调节
+#   notsent_lowat    TCP_NOTSENT_LOWAT（字节），0表示不设置
+#   keepalive        (空闲秒数, 探测间隔秒数, 探测次数)，None表示不启用
+PROFILES = {
+    'none': {
+        'nodelay': False,
+        'fastopen': 0,
+        'fastopen_connect': False,
+        'rcvbuf': 0,
+        'sndbuf': 0,
+        'notsent_lowat': 0,
+        'keepalive': None,
+    },
+    'interactive': {
+        'nodelay': True,
+        'fastopen': 256,
+        'fastopen_connect': False,
+        'rcvbuf': 0,
+        'sndbuf': 0,
+        'notsent_lowat': 16 * 1024,
+        'keepalive': (60, 10, 5),
+    },
+    'bulk': {
+        'nodelay': False,
+        'fastopen': 256,
+        'fastopen_connect': False,
+        'rcvbuf': 4 * 1024 * 1024,
+        'sndbuf': 4 * 1024 * 1024,
+        'notsent_lowat': 0,
+        'keepalive': (300, 30, 5),
+    },
+    'low-memory-router': {
+        'nodelay': True,
+        'fastopen': 0,
+        'fastopen_connect': False,
+        'rcvbuf': 32 * 1024,
+        'sndbuf': 32 * 1024,
+        'notsent_lowat': 8 * 1024,
+        'keepalive': (120, 30, 3),
+    },
+}
+
+
+class TcpProfile:
+    """一组socket选项"""
+
+    def __init__(self, name, options):
+        """
+        Args:
+            name: 配置名称
+            options: 选项字典（键见 PROFILES）
+        """
+        self.name = name
+        self.options = options
+        # 当前系统不支持的选项，之后不再尝试
+        self.unsupported = set()
+
+    def tune_listener(self, sock):
+        """
+        设置监听socket
+
+        接收缓冲区需要在握手之前设置，才能按它协商窗口扩大因子，因此设置在
+        监听socket上，由之后接受的连接继承。
+
+        Args:
+            sock: 监听socket
+        """
+        o = self.options
+        if o['rcvbuf']:
+            self._set(sock, socket.SOL_SOCKET, socket.SO_RCVBUF, o['rcvbuf'], 'SO_RCVBUF')
+        if o['sndbuf']:
+            self._set(sock, socket.SOL_SOCKET, socket.SO_SNDBUF, o['sndbuf'], 'SO_SNDBUF')
+
+    def enable_fastopen(self, sock):
+        """
+        在监听socket上启用服务端TFO（在 listen 之后调用也可以）
+
+        Args:
+            sock: 监听socket
+        """
+        if self.options['fastopen']:
+            self._set(sock, socket.IPPROTO_TCP, TCP_FASTOPEN, self.options['fastopen'], 'TCP_FASTOPEN')
+
+    def tune_connection(self, sock):
+        """
+        设置已建立的连接（接受的客户端连接或上游连接）
+
+        Args:
+            sock: TCP socket
+        """
+        o = self.options
+        if o['nodelay']:
+            self._set(sock, socket.IPPROTO_TCP, socket.TCP_NODELAY, 1, 'TCP_NODELAY')
+        if o['rcvbuf']:
+            self._set(sock, socket.SOL_SOCKET, socket.SO_RCVBUF, o['rcvbuf'], 'SO_RCVBUF')
+        if o['sndbuf']:
+            self._set(sock, socket.SOL_SOCKET, socket.SO_SNDBUF, o['sndbuf'], 'SO_SNDBUF')
+        if o['notsent_lowat']:
+            self._set(sock, socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, o['notsent_lowat'], 'TCP_NOTSENT_LOWAT')
+        if o['keepalive']:
+            idle, interval, count = o['keepalive']
+            self._set(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1, 'SO_KEEPALIVE')
+            self._set(sock, socket.IPPROTO_TCP, TCP_KEEPIDLE, idle, 'TCP_KEEPIDLE')
+            self._set(sock, socket.IPPROTO_TCP, TCP_KEEPINTVL, interval, 'TCP_KEEPINTVL')
+            self._set(sock, socket.IPPROTO_TCP, TCP_KEEPCNT, count, 'TCP_KEEPCNT')
+
+    def prepare_upstream(self, sock, family):
+        """
+        在connect之前设置上游socket（可作为 create_connection 的 prepare 回调）
+
+        Args:
+            sock: 尚未连接的socket
+            family: 地址族
+        """
+        self.tune_connection(sock)
+        if self.options['fastopen_connect']:
+            self._set(sock, socket.IPPROTO_TCP, TCP_FASTOPEN_CONNECT, 1, 'TCP_FASTOPEN_CONNECT')
+
+    def tune_relay_buffers(self, src, dst, read_size, factor=None):
+        """
+        转发读缓冲区大小改变时，按比例设置来源的接收缓冲区和去向的发送缓冲区
+
+        配置中固定了收发缓冲区大小的方向不调整。设置后内核不再自动调节该方向的
+        缓冲区，因此只在读缓冲区大小改变（流量模式改变）时调用。
+
+        Args:
+            src: 读取数据的socket
+            dst: 写入数据的socket
+            read_size: 当前读缓冲区大小（字节）
+            factor: 收发缓冲区为读缓冲区的倍数（默认读取SOCKS5_CONFIG['relay_socket_buffer_factor']，0表示不调整）
+        """
+        factor = SOCKS5_CONFIG['relay_socket_buffer_factor'] if factor is None else factor
+        if not factor:
+            return
+        nbytes = read_size * factor
+        if not self.options['rcvbuf']:
+            self._set(src, socket.SOL_SOCKET, socket.SO_RCVBUF, nbytes, 'SO_RCVBUF')
+        if not self.options['sndbuf']:
+            self._set(dst, socket.SOL_SOCKET, socket.SO_SNDBUF, nbytes, 'SO_SNDBUF')
+
+    def _set(self, sock, level, option, value, name):
+        if option is None or name in self.unsupported:
+            return
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            self.unsupported.add(name)
+
+    def __repr__(self):
+        return f"TcpProfile({self.name!r})"
+
+
+def get_profile(name=None, **overrides):
+    """
+    获取调优配置
+
+    Args:
+        name: 配置名称（默认读取SOCKS5_CONFIG['tcp_profile']）
+        **overrides: 覆盖配置中的单个选项，如 nodelay=False（fastopen_connect 默认读取
+                     SOCKS5_CONFIG['tcp_fastopen_connect']）
+
+    Returns:
+        TcpProfile: 调优配置
+
+    Raises:
+        ValueError: 未知的配置名称或选项
+    """
+    name = name or SOCKS5_CONFIG['tcp_profile']
+    if name not in PROFILES:
+        raise ValueError(f"未知的TCP调优配置: {name}")
+    options = dict(PROFILES[name])
+    if name != 'none' and SOCKS5_CONFIG['tcp_fastopen_connect']:
+        options['fastopen_connect'] = True
+    unknown = set(overrides) - set(options)
+    if unknown:
+        raise ValueError(f"未知的TCP调优选项: {', '.join(sorted(unknown))}")
+    options.update(overrides)
+    return TcpProfile(name, options)
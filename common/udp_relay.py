@@ -0,0 +1,365 @@
+"""
+SOCKS5 UDP ASSOCIATE 转发
+
+所有UDP关联共用一个转发线程：每个关联对应一个非阻塞UDP socket，由同一个
+selector统一等待，每次唤醒时批量读取多个数据报。SOCKS5 UDP头在共享缓冲区中
+原地解析和剥离（客户端 -> 目标），或原地写在数据前面（目标 -> 客户端），
+转发过程不复制数据报内容。空闲超时或控制TCP连接关闭后关联自动失效。
+"""
+
+import selectors
+import socket
+import struct
+import threading
+import time
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+# SOCKS5地址类型（与 Socks5ProxyHandler 保持一致）
+ADDR_IPV4 = 1
+ADDR_DOMAIN = 3
+ADDR_IPV6 = 4
+
+# 回程数据报在缓冲区前部预留的UDP头空间: RSV(2) FRAG(1) ATYP(1) IPv6(16) PORT(2)
+HEADROOM = 22
+MAX_DATAGRAM = 65535
+
+_HEADER_IPV4 = struct.Struct('!HBB4sH')
+_HEADER_IPV6 = struct.Struct('!HBB16sH')
+
+
+def parse_udp_header(buf, length):
+    """
+    解析SOCKS5 UDP请求头
+
+    格式: RSV(2) | FRAG(1) | ATYP(1) | DST.ADDR | DST.PORT(2) | DATA
+
+    Args:
+        buf: 数据报缓冲区
+        length: 数据报长度
+
+    Returns:
+        tuple: (目标地址, 目标端口, 数据起始偏移)，格式错误或分片数据报返回None
+    """
+    if length < 10 or buf[2] != 0:
+        # 不支持分片（FRAG != 0），按RFC 1928直接丢弃
+        return None
+
+    atyp = buf[3]
+    if atyp == ADDR_IPV4:
+        end = 8
+        addr = socket.inet_ntoa(bytes(buf[4:8]))
+    elif atyp == ADDR_IPV6:
+        end = 20
+        if length < end + 2:
+            return None
+        addr = socket.inet_ntop(socket.AF_INET6, bytes(buf[4:20]))
+    elif atyp == ADDR_DOMAIN:
+        end = 5 + buf[4]
+        if length < end + 2:
+            return None
+        addr = bytes(buf[5:end]).decode('utf-8', 'replace')
+    else:
+        return None
+
+    port = (buf[end] << 8) | buf[end + 1]
+    return addr, port, end + 2
+
+
+class UdpAssociation:
+    """单个UDP关联的状态"""
+
+    __slots__ = ('sock', 'control', 'client_id', 'client_ip', 'client_port',
+                 'last_active', 'resolved', 'packets_up', 'packets_down',
+                 'bytes_up', 'bytes_down')
+
+    def __init__(self, sock, control, client_id, client_ip, client_port):
+        self.sock = sock
+        self.control = control
+        self.client_id = client_id
+        self.client_ip = client_ip
+        # 客户端在请求中声明的源端口，为0时以收到的第一个数据报为准
+        self.client_port = client_port
+        self.last_active = time.monotonic()
+        self.resolved = {}
+        self.packets_up = 0
+        self.packets_down = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+
+class UdpRelay:
+    """单线程、基于selector的UDP关联转发器"""
+
+    def __init__(self, idle_timeout=None, batch_size=None, max_associations=None, resolver=None, rules=None,
+                 logger=None):
+        """
+        初始化UDP转发器
+
+        Args:
+            idle_timeout: 关联空闲超时（秒，默认读取SOCKS5_CONFIG）
+            batch_size: 每个socket每次唤醒最多处理的数据报数（默认读取SOCKS5_CONFIG）
+            max_associations: 最大关联数（默认读取SOCKS5_CONFIG）
+            resolver: 缓存DNS解析器（可选）
+            rules: 目标地址规则引擎（可选，被拒绝的数据报直接丢弃）
+            logger: 日志记录器
+        """
+        self.idle_timeout = idle_timeout or SOCKS5_CONFIG['udp_idle_timeout']
+        self.batch_size = batch_size or SOCKS5_CONFIG['udp_batch_size']
+        self.max_associations = max_associations or SOCKS5_CONFIG['udp_max_associations']
+        self.resolver = resolver
+        self.rules = rules
+        self.logger = logger or Logger('UdpRelay', 'socks5_proxy')
+
+        self.selector = selectors.DefaultSelector()
+        self.associations = {}
+        self.running = False
+        self.expired = 0
+        self.denied = 0
+
+        # 其他线程通过此队列提交新关联，再用socketpair唤醒转发线程
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        self._buffer = bytearray(HEADROOM + MAX_DATAGRAM)
+        self._view = memoryview(self._buffer)
+        self._thread = None
+
+    def start(self):
+        """启动转发线程"""
+        if self.running:
+            return
+        self.running = True
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name='socks5-udp-relay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止转发线程并关闭所有关联"""
+        self.running = False
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def create_association(self, control_socket, client_id, client_port=0):
+        """
+        为一个SOCKS5控制连接创建UDP关联（尚未开始转发）
+
+        Args:
+            control_socket: 客户端的TCP控制连接
+            client_id: 客户端ID
+            client_port: 客户端声明的UDP源端口（0表示未知）
+
+        Returns:
+            UdpAssociation: 新关联，超过关联数上限时返回None
+        """
+        if len(self.associations) + len(self._pending) >= self.max_associations:
+            return None
+
+        # 绑定在客户端连入的本地地址上，该地址一定对客户端可达
+        local_ip = control_socket.getsockname()[0]
+        client_ip = control_socket.getpeername()[0]
+        sock = socket.socket(control_socket.family, socket.SOCK_DGRAM)
+        sock.bind((local_ip, 0))
+        sock.setblocking(False)
+        return UdpAssociation(sock, control_socket, client_id, client_ip, client_port)
+
+    def attach(self, association):
+        """
+        开始转发，转发线程接管控制连接直到其关闭
+
+        Args:
+            association: create_association() 返回的关联
+        """
+        association.control.setblocking(False)
+        with self._pending_lock:
+            self._pending.append(association)
+        self._wake()
+
+    def get_stats(self):
+        """
+        获取UDP转发统计信息
+
+        Returns:
+            dict: associations / expired / denied
+        """
+        return {'associations': len(self.associations), 'expired': self.expired, 'denied': self.denied}
+
+    def _wake(self):
+        """唤醒转发线程"""
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        """转发线程主循环"""
+        next_sweep = time.monotonic() + 1
+        try:
+            while self.running:
+                for key, _ in self.selector.select(timeout=1.0):
+                    association = key.data
+                    if association is None:
+                        self._register_pending()
+                    elif association.sock.fileno() < 0:
+                        # 同一轮事件中已被关闭
+                        continue
+                    elif key.fileobj is association.sock:
+                        self._drain(association)
+                    else:
+                        self._check_control(association)
+
+                now = time.monotonic()
+                if now >= next_sweep:
+                    next_sweep = now + 1
+                    self._expire_idle(now)
+        except Exception as e:
+            self.logger.error(f"UDP转发线程异常: {e}")
+        finally:
+            for association in list(self.associations.values()):
+                self._close(association)
+            self.selector.close()
+
+    def _register_pending(self):
+        """注册其他线程提交的新关联"""
+        try:
+            while self._wake_r.recv(512):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for association in pending:
+            self.associations[association.sock.fileno()] = association
+            self.selector.register(association.sock, selectors.EVENT_READ, association)
+            self.selector.register(association.control, selectors.EVENT_READ, association)
+            self.logger.info(f"[{association.client_id}] UDP关联已建立: {association.sock.getsockname()[:2]}")
+
+    def _check_control(self, association):
+        """控制连接可读：收到EOF或出错时关闭关联，其他数据直接丢弃"""
+        try:
+            if association.control.recv(512):
+                return
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            pass
+        self._close(association)
+
+    def _drain(self, association):
+        """
+        批量读取并转发一个关联上的数据报
+
+        Args:
+            association: UDP关联
+        """
+        buf = self._buffer
+        view = self._view
+        sock = association.sock
+        payload = view[HEADROOM:]
+
+        for _ in range(self.batch_size):
+            try:
+                n, sender = sock.recvfrom_into(payload)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # 例如ICMP端口不可达，忽略后继续
+                self.logger.debug(f"[{association.client_id}] UDP接收异常: {e}")
+                continue
+
+            association.last_active = time.monotonic()
+            if sender[0] == association.client_ip and association.client_port in (0, sender[1]):
+                association.client_port = sender[1]
+                self._forward_to_target(association, buf, view, n)
+            elif association.client_port:
+                self._forward_to_client(association, buf, view, n, sender)
+
+        payload.release()
+
+    def _forward_to_target(self, association, buf, view, n):
+        """剥离SOCKS5 UDP头后发往目标地址"""
+        header = parse_udp_header(view[HEADROOM:HEADROOM + n], n)
+        if header is None:
+            return
+        host, port, offset = header
+        if self.rules and not self.rules.allows(host, port):
+            self.denied += 1
+            return
+
+        target = association.resolved.get(host)
+        if target is None and self.resolver:
+            # 不阻塞转发线程：缓存未命中时丢弃该数据报，后台解析完成后的重传即可命中
+            addresses = self.resolver.get_cached(host)
+            family = association.sock.family
+            target = next((ip for f, ip in addresses if f == family), None) if addresses else None
+            if target is None:
+                self.logger.debug(f"[{association.client_id}] UDP目标尚未解析: {host}")
+                return
+        elif target is None:
+            try:
+                target = socket.getaddrinfo(host, None, association.sock.family, socket.SOCK_DGRAM)[0][4][0]
+            except (socket.gaierror, IndexError):
+                self.logger.debug(f"[{association.client_id}] UDP目标无法解析: {host}")
+                return
+            association.resolved[host] = target
+
+        # 域名没有匹配的规则时再按解析得到的地址检查
+        if self.rules and target != host and not self.rules.allows(target, port):
+            self.denied += 1
+            return
+
+        try:
+            association.sock.sendto(view[HEADROOM + offset:HEADROOM + n], (target, port))
+            association.packets_up += 1
+            association.bytes_up += n - offset
+        except OSError as e:
+            self.logger.debug(f"[{association.client_id}] UDP发送到目标失败: {e}")
+
+    def _forward_to_client(self, association, buf, view, n, sender):
+        """在数据前面原地写入SOCKS5 UDP头后发回客户端"""
+        addr = sender[0]
+        if ':' in addr:
+            start = HEADROOM - _HEADER_IPV6.size
+            _HEADER_IPV6.pack_into(buf, start, 0, 0, ADDR_IPV6,
+                                   socket.inet_pton(socket.AF_INET6, addr), sender[1])
+        else:
+            start = HEADROOM - _HEADER_IPV4.size
+            _HEADER_IPV4.pack_into(buf, start, 0, 0, ADDR_IPV4, socket.inet_aton(addr), sender[1])
+
+        try:
+            association.sock.sendto(view[start:HEADROOM + n], (association.client_ip, association.client_port))
+            association.packets_down += 1
+            association.bytes_down += n
+        except OSError as e:
+            self.logger.debug(f"[{association.client_id}] UDP发送到客户端失败: {e}")
+
+    def _expire_idle(self, now):
+        """关闭空闲超时的关联"""
+        for association in list(self.associations.values()):
+            if now - association.last_active > self.idle_timeout:
+                self.expired += 1
+                self._close(association)
+
+    def _close(self, association):
+        """关闭关联及其控制连接"""
+        if self.associations.pop(association.sock.fileno(), None) is None:
+            return
+        for sock in (association.sock, association.control):
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self.logger.info(
+            f"[{association.client_id}] UDP关联已关闭，上行 {association.packets_up} 包/"
+            f"{association.bytes_up} 字节，下行 {association.packets_down} 包/{association.bytes_down} 字节"
+        )
@@ -0,0 +1,161 @@
+"""
+Unix域socket监听
+
+同一台网关上的本地程序（包管理器、同步工具、挂载了socket文件的容器）可以
+通过Unix域socket连接代理，省去TCP回环的三次握手、协议栈处理和端口分配。
+访问控制依靠文件权限：socket文件的属组和权限位决定哪些本地用户可以连接。
+
+    'unix_socket': '/run/drcom/socks5.sock',
+    'unix_socket_mode': 0o660,
+    'unix_socket_group': 'proxy',
+
+绑定时先在同一目录下的临时路径上创建socket并设置好权限，再 rename 到目标
+路径，因此不存在权限过宽的时间窗口；交接给新进程时新进程用同样的方式原子地
+替换socket文件，旧进程关闭时只删除仍属于自己的socket文件。
+
+Unix域连接没有IP地址，所有这类连接的客户端IP记为 UNIX_CLIENT_IP（按IP的
+连接数上限和限速对它们合并计算），客户端ID中带有对端进程的pid和uid。
+"""
+
+import os
+import socket
+import struct
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+
+# 部分平台（Windows）没有Unix域socket
+AF_UNIX = getattr(socket, 'AF_UNIX', None)
+
+# Unix域连接的客户端IP
+UNIX_CLIENT_IP = 'unix'
+
+# SO_PEERCRED 返回的 struct ucred: pid, uid, gid
+_UCRED = struct.Struct('3i')
+
+
+def is_unix(sock):
+    """socket是否为Unix域socket"""
+    return AF_UNIX is not None and sock.family == AF_UNIX
+
+
+def peer_identity(sock):
+    """
+    获取Unix域连接的客户端IP和客户端ID
+
+    Args:
+        sock: 已接受的Unix域连接
+
+    Returns:
+        tuple: (UNIX_CLIENT_IP, 'unix:pid=<pid>,uid=<uid>')，无法获取对端凭据时ID为 'unix:fd=<fd>'
+    """
+    try:
+        pid, uid, _ = _UCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _UCRED.size))
+        return UNIX_CLIENT_IP, f"unix:pid={pid},uid={uid}"
+    except (AttributeError, OSError):
+        return UNIX_CLIENT_IP, f"unix:fd={sock.fileno()}"
+
+
+class UnixListener:
+    """一个Unix域监听socket及其socket文件"""
+
+    def __init__(self, path, mode=None, group=None, logger=None):
+        """
+        Args:
+            path: socket文件路径
+            mode: 文件权限位（默认读取SOCKS5_CONFIG['unix_socket_mode']）
+            group: 属组名或GID（默认读取SOCKS5_CONFIG['unix_socket_group']，None为进程的属组）
+            logger: 日志记录器
+
+        Raises:
+            OSError: 当前平台不支持Unix域socket
+        """
+        if AF_UNIX is None:
+            raise OSError("当前平台不支持Unix域socket")
+        self.path = path
+        self.mode = SOCKS5_CONFIG['unix_socket_mode'] if mode is None else mode
+        self.group = SOCKS5_CONFIG['unix_socket_group'] if group is None else group
+        self.logger = logger or Logger('UnixListener', 'socks5_proxy')
+        self.sock = None
+        # 创建socket文件的进程和文件的inode，关闭时据此判断文件是否仍属于自己
+        self._owner = None
+        self._inode = None
+
+    def open(self, backlog=None):
+        """
+        绑定并开始监听（已经打开时直接返回，预派生的工作进程共用主进程打开的socket）
+
+        Args:
+            backlog: 监听队列长度（默认读取SOCKS5_CONFIG['listen_backlog']）
+
+        Returns:
+            socket.socket: 监听socket
+        """
+        if self.sock is not None:
+            return self.sock
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        temp = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}")
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+        sock = socket.socket(AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # umask 保证文件在 chmod 之前也不会被其他用户连接
+            old_umask = os.umask(0o177)
+            try:
+                sock.bind(temp)
+            finally:
+                os.umask(old_umask)
+            if self.group is not None:
+                import grp
+                gid = self.group if isinstance(self.group, int) else grp.getgrnam(self.group).gr_gid
+                os.chown(temp, -1, gid)
+            os.chmod(temp, self.mode)
+            sock.listen(backlog or SOCKS5_CONFIG['listen_backlog'])
+            # 原子地替换旧的socket文件（包括交接前旧进程的文件）
+            os.rename(temp, self.path)
+        except Exception:
+            sock.close()
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+
+        self.sock = sock
+        self._owner = os.getpid()
+        self._inode = os.stat(self.path).st_ino
+        self.logger.info(f"Unix域socket监听: {self.path}（权限 {self.mode:o}）")
+        return sock
+
+    def close(self):
+        """关闭监听socket；socket文件仍属于本进程时删除它"""
+        if self.sock is None:
+            return
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.sock = None
+        if self._owner != os.getpid():
+            return
+        try:
+            if os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except OSError:
+            # 文件已被删除
+            pass
+
+
+def load_unix_listener(logger=None):
+    """
+    按配置创建Unix域监听
+
+    Returns:
+        UnixListener: 未配置 unix_socket 时返回None
+    """
+    path = SOCKS5_CONFIG['unix_socket']
+    if not path:
+        return None
+    return UnixListener(path, logger=logger)
+
+
+# 用于测试的独立运行
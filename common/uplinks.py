@@ -0,0 +1,308 @@
+"""
+多出口（上行链路）负载均衡
+
+网关同时有多条已认证的链路（有线 + 无线，或不同网卡上的多个校园网账号）时，
+把连接目标的上游socket绑定到不同的出口，使总吞吐量随链路数增加。
+
+出口在 SOCKS5_CONFIG['outbounds'] 中定义：
+
+    'outbounds': {
+        'wired': {'bind_address': '10.1.2.3'},
+        'wifi':  {'bind_address': '10.8.0.5', 'interface': 'wlan0'},
+    },
+    'uplinks': ['wired', 'wifi'],
+
+bind_address 为源地址（决定走哪条路由需要配合按源地址的策略路由），interface
+为网卡名（SO_BINDTODEVICE，需要root或CAP_NET_RAW），两者至少指定一个。
+uplinks 中的出口参与均衡，规则中的 route:<出口名> 可以固定使用某个出口。
+
+均衡策略（uplink_policy）：
+
+    round-robin   轮流使用
+    least-conn    活动连接数最少
+    least-rtt     最近建连耗时（TCP握手，指数加权平均）最短
+    sticky        按客户端IP固定使用同一出口（最高随机权重哈希，出口增减时
+                  只有该出口上的客户端会换出口）
+
+也可以传入自定义策略函数 policy(uplinks, client_ip) -> Uplink。
+
+出口连续 uplink_max_failures 次建连失败后暂时移出均衡，uplink_cooldown 秒后
+重新尝试一次，成功则恢复，失败则等待时间加倍（最长 MAX_COOLDOWN_FACTOR 倍）。
+所有出口都不可用时选择最早可以重试的出口。
+"""
+
+import asyncio
+import hashlib
+import itertools
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from .config import SOCKS5_CONFIG
+from .logger import Logger
+from .rules import ROUTE
+
+# Linux SO_BINDTODEVICE，部分Python版本未导出
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+# 建连耗时指数加权平均的权重
+RTT_ALPHA = 0.2
+
+# 冷却时间最长为 uplink_cooldown 的倍数
+MAX_COOLDOWN_FACTOR = 10
+
+
+class Uplink:
+    """一个出口及其状态"""
+
+    def __init__(self, name, bind_address=None, interface=None):
+        """
+        Args:
+            name: 出口名
+            bind_address: 源地址（可选）
+            interface: 网卡名（可选）
+        """
+        if not bind_address and not interface:
+            raise ValueError(f"出口 {name} 需要指定 bind_address 或 interface")
+        self.name = name
+        self.bind_address = bind_address
+        self.interface = interface
+        # 指定源地址时只能连接同一地址族的目标
+        self.family = None
+        if bind_address:
+            self.family = socket.AF_INET6 if ':' in bind_address else socket.AF_INET
+
+        self.active = 0
+        self.connections = 0
+        self.failures = 0          # 连续失败次数
+        self.total_failures = 0
+        self.rtt = None            # 建连耗时的指数加权平均（秒）
+        self.down_until = 0.0      # 冷却结束的时间（time.monotonic()）
+        self.cooldown = 0.0        # 当前的冷却时间（秒）
+
+    def filter_addresses(self, addresses):
+        """
+        过滤出可以经此出口连接的地址
+
+        Args:
+            addresses: [(family, ip), ...]
+
+        Returns:
+            list: 同一地址族的地址
+        """
+        if self.family is None:
+            return addresses
+        return [a for a in addresses if a[0] == self.family]
+
+    def bind(self, sock):
+        """connect之前把socket绑定到出口"""
+        if self.interface:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self.interface.encode())
+        if self.bind_address:
+            sock.bind((self.bind_address, 0))
+
+    def __repr__(self):
+        return f"Uplink({self.name!r})"
+
+
+_round_robin_counter = itertools.count()
+
+
+def _round_robin(uplinks, client_ip):
+    return uplinks[next(_round_robin_counter) % len(uplinks)]
+
+
+def _least_conn(uplinks, client_ip):
+    # 活动连接数相同时选累计连接较少的，避免总是落在第一个出口上
+    return min(uplinks, key=lambda u: (u.active, u.connections))
+
+
+def _least_rtt(uplinks, client_ip):
+    # 还没有测量值的出口优先，以便尽快得到它的耗时
+    return min(uplinks, key=lambda u: (u.rtt is not None, u.rtt or 0.0, u.active))
+
+
+def _rendezvous_weight(client_ip, uplink):
+    digest = hashlib.blake2b(f"{client_ip}|{uplink.name}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _sticky(uplinks, client_ip):
+    return max(uplinks, key=lambda u: _rendezvous_weight(client_ip, u))
+
+
+POLICIES = {
+    'round-robin': _round_robin,
+    'least-conn': _least_conn,
+    'least-rtt': _least_rtt,
+    'sticky': _sticky,
+}
+
+
+class UplinkPool:
+    """所有出口，负责选择出口并跟踪健康状态（线程安全）"""
+
+    def __init__(self, outbounds=None, members=None, policy=None, max_failures=None, cooldown=None,
+                 logger=None):
+        """
+        初始化出口池（参数为None时读取SOCKS5_CONFIG）
+
+        Args:
+            outbounds: 出口定义 {名称: {'bind_address': ..., 'interface': ...}}
+            members: 参与均衡的出口名列表
+            policy: 均衡策略名称或策略函数
+            max_failures: 连续失败多少次后暂时移出均衡
+            cooldown: 移出后多久重新尝试（秒）
+            logger: 日志记录器
+
+        Raises:
+            ValueError: 出口定义错误、未知的出口名或策略
+        """
+        def pick(value, key):
+            return SOCKS5_CONFIG[key] if value is None else value
+
+        outbounds = pick(outbounds, 'outbounds')
+        self.uplinks = {
+            name: Uplink(name, spec.get('bind_address'), spec.get('interface'))
+            for name, spec in outbounds.items()
+        }
+        members = pick(members, 'uplinks')
+        unknown = [name for name in members if name not in self.uplinks]
+        if unknown:
+            raise ValueError(f"未定义的出口: {', '.join(unknown)}")
+        self.members = [self.uplinks[name] for name in members]
+
+        policy = pick(policy, 'uplink_policy')
+        if callable(policy):
+            self.policy_name, self.policy = getattr(policy, '__name__', 'custom'), policy
+        elif policy in POLICIES:
+            self.policy_name, self.policy = policy, POLICIES[policy]
+        else:
+            raise ValueError(f"未知的均衡策略: {policy}")
+
+        self.max_failures = pick(max_failures, 'uplink_max_failures')
+        self.base_cooldown = pick(cooldown, 'uplink_cooldown')
+        self.logger = logger or Logger('UplinkPool', 'socks5_proxy')
+        self._lock = threading.Lock()
+
+    def choose(self, decision=None, client_ip=None):
+        """
+        为一个新连接选择出口并计入活动连接
+
+        Args:
+            decision: 规则结果 Decision（route:<出口名> 时使用该出口，route:direct 时不绑定出口）
+            client_ip: 客户端IP（sticky 策略使用）
+
+        Returns:
+            Uplink: 选中的出口，使用默认路由时返回None；连接结束后需要调用 release()
+        """
+        with self._lock:
+            if decision is not None and decision.action == ROUTE:
+                if not decision.outbound:
+                    return None
+                uplink = self.uplinks[decision.outbound]
+            elif not self.members:
+                return None
+            else:
+                now = time.monotonic()
+                healthy = [u for u in self.members if self._healthy(u, now)]
+                if healthy:
+                    uplink = self.policy(healthy, client_ip)
+                else:
+                    # 全部不可用：尝试最早结束冷却的出口
+                    uplink = min(self.members, key=lambda u: u.down_until)
+            uplink.active += 1
+            uplink.connections += 1
+            return uplink
+
+    def _healthy(self, uplink, now):
+        """连续失败未达上限，或冷却已结束（允许试探一次）"""
+        return uplink.failures < self.max_failures or now >= uplink.down_until
+
+    def connect_succeeded(self, uplink, elapsed):
+        """
+        记录一次建连成功
+
+        Args:
+            uplink: 出口
+            elapsed: 建连耗时（秒）
+        """
+        with self._lock:
+            if uplink.failures >= self.max_failures:
+                self.logger.info(f"出口 {uplink.name} 已恢复")
+            uplink.failures = 0
+            uplink.cooldown = 0.0
+            uplink.rtt = elapsed if uplink.rtt is None else uplink.rtt + RTT_ALPHA * (elapsed - uplink.rtt)
+
+    def connect_failed(self, uplink):
+        """记录一次建连失败（目标拒绝连接、域名解析失败等与出口无关的错误不应计入）"""
+        with self._lock:
+            uplink.failures += 1
+            uplink.total_failures += 1
+            if uplink.failures >= self.max_failures:
+                if uplink.cooldown:
+                    uplink.cooldown = min(uplink.cooldown * 2, self.base_cooldown * MAX_COOLDOWN_FACTOR)
+                else:
+                    uplink.cooldown = self.base_cooldown
+                uplink.down_until = time.monotonic() + uplink.cooldown
+                self.logger.warning(
+                    f"出口 {uplink.name} 连续 {uplink.failures} 次建连失败，暂停使用 {uplink.cooldown:.0f} 秒"
+                )
+
+    @contextmanager
+    def measure(self, uplink):
+        """
+        包住一次建连，记录耗时或失败（uplink为None时不记录）
+
+        目标拒绝连接说明经此出口可以到达目标，不计为出口失败。
+        """
+        started = time.monotonic()
+        try:
+            yield
+        except ConnectionRefusedError:
+            raise
+        except (OSError, asyncio.TimeoutError):
+            if uplink is not None:
+                self.connect_failed(uplink)
+            raise
+        if uplink is not None:
+            self.connect_succeeded(uplink, time.monotonic() - started)
+
+    def release(self, uplink):
+        """连接结束，减少出口的活动连接数"""
+        with self._lock:
+            uplink.active -= 1
+
+    def get_stats(self):
+        """
+        获取各出口的状态
+
+        Returns:
+            dict: 出口名 -> {'active', 'connections', 'failures', 'rtt_ms', 'healthy'}，
+                  以及均衡策略 'policy'
+        """
+        now = time.monotonic()
+        with self._lock:
+            uplinks = {
+                u.name: {
+                    'active': u.active,
+                    'connections': u.connections,
+                    'failures': u.total_failures,
+                    'rtt_ms': round(u.rtt * 1000, 3) if u.rtt is not None else None,
+                    'healthy': self._healthy(u, now),
+                }
+                for u in self.uplinks.values()
+            }
+        return {'policy': self.policy_name, 'uplinks': uplinks}
+
+
+def load_uplinks(logger=None):
+    """
+    按配置创建出口池
+
+    Returns:
+        UplinkPool: 没有定义任何出口时返回None
+    """
+    if not SOCKS5_CONFIG['outbounds']:
+        return None
+    return UplinkPool(logger=logger)
@@ -0,0 +1,315 @@
+"""
+VPN 服务端 - 多路复用隧道的远端
+
+接受 client.vpn_client.VPNClient 的隧道连接，认证后为隧道中的每个流连接目标
+（与 Socks5ProxyServer 使用相同的DNS缓存和 Happy Eyeballs 连接），并在流和
+目标连接之间转发数据。
+"""
+
+import errno
+import socket
+import threading
+from common.admission import WorkerPool
+from common.compression import describe_stats
+from common.config import VPN_CONFIG, SOCKS5_CONFIG
+from common.dns_cache import DnsResolver, resolve_addresses
+from common.happy_eyeballs import create_connection
+from common.logger import Logger
+from common.mux import MuxSession, TunnelError, decode_address, relay_stream, server_handshake
+from common.rules import DENY, load_rules
+from common.socks5_proxy import Socks5ProxyHandler as P
+from common.uplinks import load_uplinks
+
+
+class VPNServer:
+    """VPN隧道服务端"""
+
+    def __init__(self, host='0.0.0.0', port=None, users=None, resolver=None, rules=None, uplinks=None,
+                 compression=None):
+        """
+        初始化服务端
+
+        Args:
+            host: 监听地址
+            port: 监听端口（默认读取VPN_CONFIG['server_port']）
+            users: {用户名: 密码}（至少一个用户）
+            resolver: 缓存DNS解析器（默认按SOCKS5_CONFIG新建）
+            rules: 目标地址规则引擎（默认按SOCKS5_CONFIG['rules_file']加载，未配置时不检查）
+            uplinks: 出口池（默认按SOCKS5_CONFIG['outbounds']创建，未定义出口时使用默认路由）
+            compression: 是否接受客户端的压缩请求（方法名，默认读取VPN_CONFIG['tunnel_compression']，
+                         False表示不接受）
+
+        Raises:
+            ValueError: 未配置用户（否则任何人都可以通过隧道连接任意目标）
+        """
+        if not users:
+            raise ValueError("未配置用户，拒绝启动：隧道只接受已认证的用户")
+        self.host = host
+        self.port = port or VPN_CONFIG['server_port']
+        self.users = users
+        self.logger = Logger('VPNServer', 'vpn_server')
+        self.server_socket = None
+        self.running = False
+        self.resolver = resolver
+        if resolver is None and SOCKS5_CONFIG['dns_cache_enabled']:
+            self.resolver = DnsResolver(logger=self.logger)
+        self.rules = rules or load_rules(logger=self.logger)
+        self.uplinks = uplinks or load_uplinks(logger=self.logger)
+        self.compression = compression
+        # 工作线程只负责连接目标，连接成功后每个流的转发在单独的线程中进行，
+        # 长时间转发的流不占用工作线程，不会使其他流的 OPEN 排队等待
+        self.worker_pool = WorkerPool(SOCKS5_CONFIG['max_handlers'] or 256, name='vpn-stream', logger=self.logger)
+        self.sessions = set()
+        self._lock = threading.Lock()
+        self.stats = {'sessions': 0, 'streams': 0, 'bytes_up': 0, 'bytes_down': 0,
+                      'compression_saved_bytes': 0, 'compression_cpu_seconds': 0.0}
+
+    def start(self):
+        """启动服务端（阻塞）"""
+        try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(SOCKS5_CONFIG['listen_backlog'])
+            self.running = True
+            if self.resolver:
+                self.resolver.load()
+            self.logger.info(f"VPN服务端启动: {self.host}:{self.port}")
+
+            while self.running:
+                client_socket, client_address = self.server_socket.accept()
+                threading.Thread(
+                    target=self._accept_session, args=(client_socket, client_address), daemon=True
+                ).start()
+
+        except Exception as e:
+            if self.running:
+                self.logger.error(f"VPN服务端异常: {e}")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """停止服务端并断开所有隧道"""
+        was_running = self.running
+        self.running = False
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except OSError:
+                pass
+        with self._lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            session.close()
+        self.worker_pool.shutdown()
+        if self.resolver and was_running:
+            self.resolver.save()
+        if was_running:
+            self.logger.info("VPN服务端已停止")
+
+    def get_stats(self):
+        """
+        获取服务端统计信息
+
+        Returns:
+            dict: 隧道数、累计流数和流量
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['active_sessions'] = len(self.sessions)
+        if self.resolver:
+            stats['dns'] = self.resolver.get_stats()
+        if self.rules:
+            stats['rules'] = self.rules.get_stats()
+        if self.uplinks:
+            stats['uplinks'] = self.uplinks.get_stats()
+        return stats
+
+    def _accept_session(self, client_socket, client_address):
+        """认证新的隧道连接并开始处理其中的流"""
+        try:
+            username = server_handshake(client_socket, self.users, VPN_CONFIG['connection_timeout'])
+        except (OSError, TunnelError) as e:
+            self.logger.warning(f"隧道认证失败 {client_address}: {e}")
+            client_socket.close()
+            return
+
+        session = MuxSession(client_socket, on_open=self._on_open, logger=self.logger,
+                             compression=self.compression)
+        with self._lock:
+            self.sessions.add(session)
+            self.stats['sessions'] += 1
+        self.logger.info(f"隧道已建立: {username}@{client_address[0]}:{client_address[1]}")
+        session.start()
+        session.join()
+        with self._lock:
+            self.sessions.discard(session)
+
+    def _on_open(self, stream, payload):
+        """读取线程回调：不能阻塞，交给工作线程连接目标"""
+        self.worker_pool.submit(self._serve_stream, stream, payload)
+
+    def _serve_stream(self, stream, payload):
+        """
+        工作线程：连接流的目标，成功后启动转发线程
+
+        Args:
+            stream: 隧道流
+            payload: OPEN 帧负载（SOCKS5格式的目标地址）
+        """
+        session = stream.session
+        stream_id = f"流{stream.stream_id}"
+        try:
+            addr, port = decode_address(payload)
+            self.logger.info(f"[{stream_id}] 隧道请求连接到: {addr}:{port}")
+            remote, uplink = self._connect(addr, port, self._peer_ip(session))
+        except Exception as e:
+            self.logger.warning(f"[{stream_id}] 连接目标失败: {e}")
+            try:
+                session.accept_open(stream, self._reply_for_error(e))
+            except OSError:
+                pass
+            return
+
+        try:
+            threading.Thread(
+                target=self._relay, args=(stream, remote, uplink), name='vpn-relay', daemon=True
+            ).start()
+        except RuntimeError as e:
+            self.logger.warning(f"[{stream_id}] 无法启动转发线程: {e}")
+            remote.close()
+            if uplink:
+                self.uplinks.release(uplink)
+            try:
+                session.accept_open(stream, P.REP_GENERAL_FAILURE)
+            except OSError:
+                pass
+
+    def _relay(self, stream, remote, uplink):
+        """
+        转发线程：回复 OPEN 并在流和目标连接之间转发数据，结束后释放出口
+
+        Args:
+            stream: 隧道流
+            remote: 已连接的目标socket
+            uplink: 使用的出口（默认路由时为None）
+        """
+        session = stream.session
+        stream_id = f"流{stream.stream_id}"
+        try:
+            bind_addr, bind_port = remote.getsockname()[:2]
+            session.accept_open(stream, P.REP_SUCCESS, bind_addr, bind_port)
+            up, down = relay_stream(remote, stream)
+            compression = stream.compression_stats()
+            if compression:
+                self.logger.info(f"[{stream_id}] {describe_stats(compression)}")
+            with self._lock:
+                self.stats['streams'] += 1
+                # 以客户端视角统计：上行为隧道 -> 目标
+                self.stats['bytes_up'] += down
+                self.stats['bytes_down'] += up
+                if compression:
+                    self.stats['compression_saved_bytes'] += compression['saved_bytes']
+                    self.stats['compression_cpu_seconds'] += compression['cpu_seconds']
+        except OSError as e:
+            self.logger.debug(f"[{stream_id}] 转发结束: {e}")
+        finally:
+            stream.close()
+            remote.close()
+            if uplink:
+                self.uplinks.release(uplink)
+
+    @staticmethod
+    def _peer_ip(session):
+        """隧道客户端的IP（按客户端固定出口时使用）"""
+        try:
+            return session.sock.getpeername()[0]
+        except OSError:
+            return None
+
+    def _connect(self, addr, port, client_ip=None):
+        """
+        按规则检查并经选中的出口连接目标
+
+        Returns:
+            tuple: (已连接的socket, 使用的出口 Uplink)，出口为None表示默认路由；
+                   出口在连接结束后需要释放
+
+        Raises:
+            PermissionError: 规则拒绝连接
+            OSError: 解析或连接失败
+        """
+        decision = self.rules.check(addr, port) if self.rules else None
+        if decision and decision.action == DENY:
+            raise PermissionError(f"规则拒绝连接（{decision.rule}）")
+        addresses = resolve_addresses(addr, self.resolver)
+        if self.rules and decision is None:
+            addresses, decision = self.rules.filter_addresses(addresses, port)
+            if not addresses:
+                raise PermissionError(f"规则拒绝连接（{decision.rule}）")
+
+        uplink = self.uplinks.choose(decision, client_ip) if self.uplinks else None
+        if uplink is None:
+            return self._create_connection(addresses, port), None
+        try:
+            addresses = uplink.filter_addresses(addresses)
+            if not addresses:
+                raise OSError(errno.ENETUNREACH, "出口没有可用的同族地址")
+            with self.uplinks.measure(uplink):
+                return self._create_connection(addresses, port, uplink.bind), uplink
+        except BaseException:
+            self.uplinks.release(uplink)
+            raise
+
+    @staticmethod
+    def _create_connection(addresses, port, bind=None):
+        """Happy Eyeballs 连接目标，bind 为connect之前绑定出口的函数（可选）"""
+        return create_connection(
+            addresses, port,
+            attempt_timeout=SOCKS5_CONFIG['connect_attempt_timeout'],
+            attempt_delay=SOCKS5_CONFIG['connect_attempt_delay'],
+            prefer_ipv6=SOCKS5_CONFIG['prefer_ipv6'],
+            prepare=(lambda sock, family: bind(sock)) if bind else None,
+        )
+
+    @staticmethod
+    def _reply_for_error(e):
+        """
+        把连接目标时的异常映射为SOCKS5响应代码
+
+        Returns:
+            int: 响应代码
+        """
+        if isinstance(e, PermissionError):
+            return P.REP_CONNECTION_NOT_ALLOWED
+        if isinstance(e, socket.timeout):
+            return P.REP_TTL_EXPIRED
+        if isinstance(e, ConnectionRefusedError):
+            return P.REP_CONNECTION_REFUSED
+        if isinstance(e, socket.gaierror):
+            return P.REP_HOST_UNREACHABLE
+        if isinstance(e, ValueError):
+            return P.REP_ADDRESS_TYPE_NOT_SUPPORTED
+        if isinstance(e, OSError) and e.errno == errno.ENETUNREACH:
+            return P.REP_NETWORK_UNREACHABLE
+        if isinstance(e, OSError) and e.errno == errno.EHOSTUNREACH:
+            return P.REP_HOST_UNREACHABLE
+        return P.REP_GENERAL_FAILURE
+
+
+if __name__ == '__main__':
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    # 用户列表: 用户名:密码 ...（至少一个）
+    users = dict(arg.split(':', 1) for arg in sys.argv[2:])
+    if not users:
+        print("用法: python -m server.vpn_server 端口 用户名:密码 [用户名:密码 ...]")
+        sys.exit(1)
+
+    server = VPNServer(port=port, users=users)
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        print("\n正在关闭服务端...")
+        server.stop()
@@ -0,0 +1,120 @@
+"""
+SOCKS4/4a 和 HTTP 代理请求解析的测试
+
+任意切分的结果与一次性解析一致，截断的报文等待更多数据，篡改和随机数据只抛出 ProtocolError。
+"""
+
+import base64
+import random
+
+import pytest
+
+from common.proxy_parser import MAX_HTTP_HEAD, parse_http_request, parse_socks4_request
+from common.socks5_parser import ProtocolError
+
+SEED = 1080
+
+SAMPLES = [
+    (parse_socks4_request, b'\x04\x01\x00\x50\x0a\x00\x00\x01user\x00'),
+    (parse_socks4_request, b'\x04\x01\x00\x50\x00\x00\x00\x09\x00' + '测试.cn'.encode() + b'\x00'),
+    (parse_http_request, b"CONNECT example.com:443 HTTP/1.1\r\nHost: example.com:443\r\n\r\n"),
+    (parse_http_request, b"POST http://user@10.0.0.1/x HTTP/1.0\r\nContent-Length: 3\r\n\r\n"),
+]
+
+
+def parse_chunks(parser, chunks):
+    """按块追加数据，返回第一次解析成功的结果"""
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        result = parser(buf)
+        if result is not None:
+            return result
+    return None
+
+
+def split(rng, message):
+    """在随机位置把报文切成至多6块"""
+    cuts = sorted(rng.sample(range(1, len(message)), min(rng.randrange(6), len(message) - 1)))
+    return [message[a:b] for a, b in zip([0] + cuts, cuts + [len(message)])]
+
+
+def test_socks4_request():
+    assert parse_socks4_request(b'\x04\x01\x00\x50\x0a\x00\x00\x01bob\x00') == (1, '10.0.0.1', 80, 'bob', 12)
+    assert parse_socks4_request(b'\x04\x01\x01\xbb\x00\x00\x00\x01\x00example.com\x00') == \
+        (1, 'example.com', 443, '', 21)
+    assert parse_socks4_request(b'\x04\x01\x01\xbb\x00\x00\x00\x01\x00example') is None
+
+
+def test_http_connect():
+    creds = base64.b64encode(b'alice:s3cret').decode()
+    request = (f"CONNECT [2001:db8::1]:443 HTTP/1.1\r\nHost: x\r\nProxy-Authorization: Basic {creds}\r\n\r\n"
+               ).encode() + b'early'
+    assert parse_http_request(request) == ('CONNECT', '2001:db8::1', 443, None, ('alice', 's3cret'),
+                                           len(request) - 5)
+
+
+def test_http_absolute_uri():
+    """绝对URI改写为源站形式，去掉逐跳头部并加上 Host 和 Connection: close"""
+    request = b"GET http://example.com:8080/a?b=1 HTTP/1.1\r\nProxy-Connection: keep-alive\r\nAccept: */*\r\n\r\n"
+    method, host, port, head, auth, used = parse_http_request(request)
+    assert (method, host, port, auth, used) == ('GET', 'example.com', 8080, None, len(request))
+    assert head == b"GET /a?b=1 HTTP/1.1\r\nHost: example.com:8080\r\nAccept: */*\r\nConnection: close\r\n\r\n"
+
+
+def test_http_connection_listed_headers():
+    """Connection 头中列出的头也是逐跳头，不转发给目标；决定请求体长度的头保留"""
+    request = (b"POST http://example.com/ HTTP/1.1\r\nHost: example.com\r\n"
+               b"Connection: keep-alive, X-Hop , Transfer-Encoding\r\nX-Hop: 1\r\nX-Keep: 2\r\n"
+               b"Transfer-Encoding: chunked\r\n\r\n")
+    head = parse_http_request(request)[3]
+    assert head == (b"POST / HTTP/1.1\r\nHost: example.com\r\nX-Keep: 2\r\n"
+                    b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+
+@pytest.mark.parametrize('bad', [
+    b"GET /local HTTP/1.1\r\n\r\n", b"CONNECT example.com HTTP/1.1\r\n\r\n", b"HELLO\r\n\r\n",
+])
+def test_http_invalid(bad):
+    with pytest.raises(ProtocolError):
+        parse_http_request(bad)
+
+
+def test_split_truncate_mutate():
+    """任意切分与一次性解析一致，任意前缀等待更多数据，篡改只抛出 ProtocolError"""
+    rng = random.Random(SEED)
+    for _ in range(5000):
+        parser, message = rng.choice(SAMPLES)
+        assert parse_chunks(parser, split(rng, message)) == parser(message)
+        for cut in range(len(message)):
+            assert parser(message[:cut]) is None
+        mutated = bytearray(message)
+        for _ in range(rng.randrange(1, 4)):
+            mutated[rng.randrange(len(mutated))] = rng.randrange(256)
+        try:
+            result = parser(bytes(mutated))
+            assert result is None or result[-1] <= len(mutated)
+        except ProtocolError:
+            pass
+
+
+@pytest.mark.parametrize('parser', [parse_socks4_request, parse_http_request])
+def test_random_bytes(parser):
+    """纯随机字节只能解析成功、等待数据或抛出 ProtocolError，且不会越界"""
+    rng = random.Random(SEED)
+    for _ in range(20000):
+        junk = bytes(rng.randrange(256) for _ in range(rng.randrange(300)))
+        try:
+            result = parser(junk)
+            assert result is None or result[-1] <= len(junk)
+        except ProtocolError:
+            pass
+
+
+@pytest.mark.parametrize('parser, junk', [
+    (parse_http_request, b'G' * MAX_HTTP_HEAD), (parse_socks4_request, b'\x04\x01' + b'a' * 300),
+])
+def test_oversized(parser, junk):
+    """超长数据报错，不会无限等待"""
+    with pytest.raises(ProtocolError):
+        parser(junk)
@@ -0,0 +1,44 @@
+"""
+时间轮和空闲连接回收器的测试
+"""
+
+import time
+
+from common.reaper import IdleReaper, TimerWheel
+
+
+def test_timer_wheel_fires_by_tick():
+    """定时器按刻度到期，取消的定时器不执行"""
+    wheel = TimerWheel(tick=0.01, slots=8)
+    fired = []
+    base = wheel._origin
+    for delay in (0.01, 0.05, 0.2, 0.5):
+        wheel.schedule(delay, lambda d=delay: fired.append(d))
+    wheel.schedule(0.03, lambda: fired.append('cancelled')).cancel()
+    wheel.advance(base + 0.1)
+    assert fired == [0.01, 0.05]
+    wheel.advance(base + 1.0)
+    assert fired == [0.01, 0.05, 0.2, 0.5]
+
+
+def test_reaper_closes_only_stalled_connections():
+    """没有进度的连接被回收，有进度的保留"""
+    reaper = IdleReaper(idle_timeout=0.2, handshake_timeout=0.1, tick=0.01)
+    closed = []
+    counters = {'busy': 0, 'idle': 0}
+    entries = {}
+    for name in ('busy', 'idle', 'handshake'):
+        entries[name] = reaper.track(lambda n=name: closed.append(n), lambda n=name: counters.get(n, 0))
+    entries['busy'].established()
+    entries['idle'].established()
+    reaper.start()
+    try:
+        deadline = time.monotonic() + 0.6
+        while time.monotonic() < deadline:
+            counters['busy'] += 1
+            time.sleep(0.01)
+    finally:
+        reaper.stop()
+    assert sorted(closed) == ['handshake', 'idle']
+    stats = reaper.get_stats()
+    assert stats['reaped_idle'] == 1 and stats['reaped_handshake'] == 1, stats
@@ -0,0 +1,73 @@
+"""
+目标地址规则的匹配测试
+"""
+
+import ipaddress
+import random
+
+import pytest
+
+from common.rules import compile_rules
+
+SEED = 1928
+
+
+@pytest.mark.parametrize('version', [4, 6])
+def test_cidr_matches_linear_scan(version):
+    """随机规则下与逐条线性匹配（最长前缀优先）的结果一致"""
+    rng = random.Random(SEED)
+    bits = 32 if version == 4 else 128
+
+    def random_network():
+        return ipaddress.ip_network((rng.getrandbits(bits), rng.randrange(0, bits + 1)), strict=False)
+
+    networks = [random_network() for _ in range(3000)]
+    # 增加一些嵌套前缀
+    networks += [n.supernet(rng.randrange(0, n.prefixlen + 1)) for n in networks[:500] if n.prefixlen]
+    lines = [f"{rng.choice(['allow', 'deny'])} cidr {n}" for n in networks]
+    ruleset = compile_rules(lines, outbounds={})
+    for _ in range(2000):
+        if rng.random() < 0.5:
+            n = rng.choice(networks)
+            ip = n.network_address + rng.randrange(n.num_addresses)
+        else:
+            ip = ipaddress.ip_address(rng.getrandbits(bits))
+        best = None
+        for line, n in zip(lines, networks):
+            if ip in n and (best is None or n.prefixlen > best[1].prefixlen):
+                best = (line, n)
+        expected = best[0] if best else 'default allow'
+        assert ruleset.match_ip(str(ip), 80).rule == expected, (ip, expected)
+
+
+RULES = [
+    'deny port 25',
+    'deny domain-suffix example.com',
+    'allow domain www.example.com',
+    'allow domain-suffix a.example.com ports 443',
+    'deny cidr 10.0.0.0/8',
+    'allow cidr 10.1.0.0/16 ports 80,8000-8080',
+    'default deny',
+]
+
+
+@pytest.mark.parametrize('host, port, expected', [
+    ('www.example.com', 25, 'deny port 25'),
+    ('www.example.com', 80, 'allow domain www.example.com'),
+    ('example.com', 80, 'deny domain-suffix example.com'),
+    ('x.a.example.com', 443, 'allow domain-suffix a.example.com ports 443'),
+    ('x.a.example.com', 80, 'deny domain-suffix example.com'),
+    ('WWW.Example.COM.', 80, 'allow domain www.example.com'),
+    ('10.1.2.3', 8001, 'allow cidr 10.1.0.0/16 ports 80,8000-8080'),
+    ('10.1.2.3', 22, 'deny cidr 10.0.0.0/8'),
+    ('::ffff:10.9.9.9', 80, 'deny cidr 10.0.0.0/8'),
+    ('8.8.8.8', 53, 'default deny'),
+])
+def test_match_host(host, port, expected):
+    """端口、域名、后缀和网段规则的优先顺序"""
+    assert compile_rules(RULES, outbounds={}).match_host(host, port).rule == expected
+
+
+def test_unmatched_domain_needs_addresses():
+    """没有匹配规则的域名返回None，由调用方解析后按地址检查"""
+    assert compile_rules(RULES, outbounds={}).match_host('other.org', 80) is None
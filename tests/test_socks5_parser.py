@@ -0,0 +1,118 @@
+"""
+SOCKS5 报文解析的模糊测试
+
+随机切分、截断和篡改合法报文，检查解析结果与一次性解析一致，且只抛出 ProtocolError。
+"""
+
+import random
+import socket
+import struct
+
+import pytest
+
+from common.socks5_parser import (
+    ADDR_DOMAIN, ADDR_IPV4, ADDR_IPV6, AUTH_VERSION, SOCKS_VERSION, ProtocolError,
+    parse_auth_request, parse_greeting, parse_request,
+)
+
+SEED = 1080
+
+TARGETS = [
+    (ADDR_IPV4, '10.0.0.1'), (ADDR_IPV6, '2001:db8::1'),
+    (ADDR_DOMAIN, 'example.com'), (ADDR_DOMAIN, 'a' * 255), (ADDR_DOMAIN, '测试.cn'),
+]
+
+
+def build(methods, cmd, atyp, addr, port, payload):
+    """问候 + 请求 + 早发数据"""
+    greeting = bytes([SOCKS_VERSION, len(methods)]) + methods
+    if atyp == ADDR_IPV4:
+        raw = socket.inet_aton(addr)
+    elif atyp == ADDR_IPV6:
+        raw = socket.inet_pton(socket.AF_INET6, addr)
+    else:
+        raw = bytes([len(addr.encode())]) + addr.encode()
+    return greeting + bytes([SOCKS_VERSION, cmd, 0, atyp]) + raw + struct.pack('!H', port) + payload
+
+
+def parse_stream(chunks):
+    """模拟处理器：按块追加数据，依次解析问候和请求"""
+    buf = bytearray()
+    results = []
+    parsers = [parse_greeting, parse_request]
+    for chunk in chunks:
+        buf += chunk
+        while parsers:
+            result = parsers[0](buf)
+            if result is None:
+                break
+            del buf[:result[-1]]
+            results.append(result[:-1])
+            parsers.pop(0)
+    return results, bytes(buf)
+
+
+def random_messages(rng, count):
+    """随机的合法报文 (报文, 早发数据)"""
+    for _ in range(count):
+        atyp, addr = rng.choice(TARGETS)
+        methods = bytes(rng.randrange(256) for _ in range(rng.randrange(256)))
+        payload = bytes(rng.randrange(256) for _ in range(rng.randrange(64)))
+        yield build(methods, rng.choice((1, 2, 3)), atyp, addr, rng.randrange(65536), payload), payload
+
+
+def test_split_matches_whole():
+    """任意切分后的结果与一次性解析相同，剩余字节为早发数据"""
+    rng = random.Random(SEED)
+    for message, payload in random_messages(rng, 5000):
+        cuts = sorted(rng.sample(range(1, len(message)), min(rng.randrange(6), len(message) - 1)))
+        chunks = [message[a:b] for a, b in zip([0] + cuts, cuts + [len(message)])]
+        assert parse_stream(chunks) == parse_stream([message]), chunks
+        assert parse_stream([message])[1] == payload
+
+
+def test_truncated_waits_for_more():
+    """截断的报文只会等待更多数据，不会报错"""
+    rng = random.Random(SEED)
+    for message, _ in random_messages(rng, 5000):
+        results, _ = parse_stream([message[:rng.randrange(len(message))]])
+        assert len(results) <= 2
+
+
+def test_mutated_raises_only_protocol_error():
+    """随机篡改的报文只能解析成功、等待数据或抛出 ProtocolError"""
+    rng = random.Random(SEED)
+    for message, _ in random_messages(rng, 5000):
+        mutated = bytearray(message)
+        for _ in range(rng.randrange(1, 4)):
+            mutated[rng.randrange(len(mutated))] = rng.randrange(256)
+        try:
+            parse_stream([bytes(mutated)])
+        except ProtocolError:
+            pass
+
+
+def test_auth_request_split():
+    """认证请求的任意前缀都等待更多数据，完整报文解析出原用户名和密码"""
+    rng = random.Random(SEED)
+    for _ in range(2000):
+        username = ''.join(rng.choice('abc用户') for _ in range(rng.randrange(1, 40)))
+        password = ''.join(rng.choice('xyz密码') for _ in range(rng.randrange(0, 40)))
+        u, p = username.encode(), password.encode()
+        message = bytes([AUTH_VERSION, len(u)]) + u + bytes([len(p)]) + p
+        assert parse_auth_request(message) == (username, password, len(message))
+        for cut in range(len(message)):
+            assert parse_auth_request(message[:cut]) is None
+
+
+@pytest.mark.parametrize('parser', [parse_greeting, parse_auth_request, parse_request])
+def test_random_bytes(parser):
+    """纯随机字节只能解析成功、等待数据或抛出 ProtocolError，且不会越界"""
+    rng = random.Random(SEED)
+    for _ in range(10000):
+        junk = bytes(rng.randrange(256) for _ in range(rng.randrange(300)))
+        try:
+            result = parser(junk)
+            assert result is None or result[-1] <= len(junk)
+        except ProtocolError:
+            pass
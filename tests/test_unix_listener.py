@@ -0,0 +1,55 @@
+"""
+Unix域socket监听的测试
+"""
+
+import os
+import socket
+
+import pytest
+
+from common.unix_listener import AF_UNIX, UnixListener, is_unix, peer_identity
+
+pytestmark = pytest.mark.skipif(AF_UNIX is None, reason="当前平台没有Unix域socket")
+
+
+def test_socket_file_mode(tmp_path):
+    path = str(tmp_path / 'proxy.sock')
+    listener = UnixListener(path, mode=0o600)
+    listener.open()
+    try:
+        assert os.stat(path).st_mode & 0o777 == 0o600
+    finally:
+        listener.close()
+    assert not os.path.exists(path)
+
+
+def test_handover_keeps_new_socket_file(tmp_path):
+    """交接：新的监听替换socket文件，旧的关闭时不删除"""
+    path = str(tmp_path / 'proxy.sock')
+    first = UnixListener(path, mode=0o600)
+    first.open()
+    second = UnixListener(path, mode=0o660)
+    second.open()
+    first.close()
+    try:
+        assert os.path.exists(path) and os.stat(path).st_mode & 0o777 == 0o660
+    finally:
+        second.close()
+    assert not os.path.exists(path)
+
+
+def test_peer_identity(tmp_path):
+    """客户端ID中带有对端进程的pid和uid"""
+    path = str(tmp_path / 'proxy.sock')
+    listener = UnixListener(path)
+    listener.open()
+    client = socket.socket(AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        conn, _ = listener.sock.accept()
+        with conn:
+            assert is_unix(conn)
+            assert peer_identity(conn) == ('unix', f"unix:pid={os.getpid()},uid={os.getuid()}")
+    finally:
+        client.close()
+        listener.close()